@@ -0,0 +1,138 @@
+from datetime import date
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app import models
+
+# Dashboard aggregates computed in SQL with GROUP BY, so the dashboard receives
+# a few rows per metric instead of whole tables. Order, customer and inventory
+# totals are read from the summary tables maintained by app.summaries.
+
+OrderSummary = models.OrderDailySummary
+InventorySummary = models.CategoryInventorySummary
+
+
+def _period_start(db: Session, column, period: str):
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date(func.date_trunc(period, column))
+    if period == "week":
+        # Monday of the week: move forward to the next Sunday, then back six days
+        return func.date(column, "weekday 0", "-6 days")
+    return func.date(column)
+
+
+def overview(db: Session):
+    orders = db.execute(select(
+        func.coalesce(func.sum(OrderSummary.order_count), 0),
+        func.coalesce(func.sum(OrderSummary.revenue), 0.0),
+    )).one()
+    return {
+        "users": db.scalar(select(func.count()).select_from(models.User)),
+        "products": db.scalar(select(func.coalesce(func.sum(InventorySummary.product_count), 0))),
+        "orders": orders[0],
+        "revenue": orders[1],
+    }
+
+
+def orders_by_status(db: Session):
+    count = func.sum(OrderSummary.order_count)
+    stmt = (
+        select(
+            OrderSummary.status,
+            count.label("order_count"),
+            func.sum(OrderSummary.revenue).label("revenue"),
+        )
+        .group_by(OrderSummary.status)
+        .having(count > 0)
+        .order_by(OrderSummary.status)
+    )
+    return [{**row._asdict(), "status": row.status or None} for row in db.execute(stmt)]
+
+
+def orders_by_period(db: Session, period: str = "day", date_from: date | None = None,
+                     date_to: date | None = None):
+    start = _period_start(db, OrderSummary.day, period).label("period")
+    count = func.sum(OrderSummary.order_count)
+    stmt = select(start, count.label("order_count"), func.sum(OrderSummary.revenue).label("revenue"))
+    if date_from is not None:
+        stmt = stmt.where(OrderSummary.day >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(OrderSummary.day < date_to)
+    stmt = stmt.group_by(start).having(count > 0).order_by(start)
+    return [{**row._asdict(), "period": str(row.period)} for row in db.execute(stmt)]
+
+
+def top_customers(db: Session, limit: int = 10):
+    # Walks the lifetime_value index of the customer summary: cost grows with limit, not with orders
+    Customer = models.CustomerOrderSummary
+    stmt = (
+        select(
+            Customer.user_id,
+            models.User.name,
+            models.User.email,
+            Customer.order_count,
+            Customer.lifetime_value.label("total_spent"),
+            Customer.last_order_date,
+        )
+        .join(models.User, models.User.user_id == Customer.user_id)
+        .where(Customer.order_count > 0)
+        .order_by(Customer.lifetime_value.desc())
+        .limit(limit)
+    )
+    return [row._asdict() for row in db.execute(stmt)]
+
+
+def customer_stats(db: Session, user_id: int):
+    """Order count, lifetime value and last order date of one user; None for unknown users."""
+    Customer = models.CustomerOrderSummary
+    row = db.execute(
+        select(models.User.user_id, func.coalesce(Customer.order_count, 0).label("order_count"),
+               func.coalesce(Customer.lifetime_value, 0.0).label("lifetime_value"), Customer.last_order_date)
+        .outerjoin(Customer, Customer.user_id == models.User.user_id)
+        .where(models.User.user_id == user_id)
+    ).one_or_none()
+    db.commit()
+    return row._asdict() if row is not None else None
+
+
+def low_stock_products(db: Session, threshold: int = 10, limit: int = 20):
+    stmt = (
+        select(
+            models.Product.product_id,
+            models.Product.name,
+            models.Product.category,
+            models.Product.stock,
+        )
+        .where(models.Product.stock <= threshold)
+        .order_by(models.Product.stock, models.Product.product_id)
+        .limit(limit)
+    )
+    return [row._asdict() for row in db.execute(stmt)]
+
+
+def products_by_category(db: Session):
+    stmt = (
+        select(
+            InventorySummary.category,
+            InventorySummary.product_count,
+            InventorySummary.total_stock,
+            InventorySummary.stock_value,
+        )
+        .where(InventorySummary.product_count > 0)
+        .order_by(InventorySummary.category)
+    )
+    return [row._asdict() for row in db.execute(stmt)]
+
+
+def dashboard(db: Session, period: str = "day", date_from: date | None = None,
+              date_to: date | None = None, top_n: int = 10, low_stock_threshold: int = 10):
+    result = {
+        "overview": overview(db),
+        "orders_by_status": orders_by_status(db),
+        "orders_by_period": orders_by_period(db, period, date_from, date_to),
+        "top_customers": top_customers(db, top_n),
+        "low_stock_products": low_stock_products(db, low_stock_threshold),
+        "products_by_category": products_by_category(db),
+    }
+    db.commit()
+    return result
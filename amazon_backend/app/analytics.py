@@ -0,0 +1,441 @@
+"""Columnar snapshots of orders, products and users, and reports computed from them.
+
+Historical reports (revenue trends, cohorts, the status funnel) scan every
+order. They run on Parquet snapshots with Arrow's vectorized kernels instead
+of the OLTP database, so they never compete with the API for it. Take a
+snapshot from cron, or keep a process doing it::
+
+    python -m app.analytics snapshot              # changed months only
+    python -m app.analytics snapshot --every 300  # repeat every five minutes
+    python -m app.analytics snapshot --full       # rewrite everything
+
+Layout under ``ANALYTICS_DIR``::
+
+    manifest.json                          versions and the files of the current snapshot
+    orders/month=2025-06/v1234.parquet     one file per order month, sorted by order_date
+    products/v1200.parquet
+    users/v1180.parquet
+
+Snapshots are incremental through the change feed. The manifest remembers the
+``change_counters`` version each table was read at, and the next run rewrites
+only the months holding orders changed or deleted since then. A moved order
+rewrites its old and its new month. Users and products are small and are
+rewritten whenever they changed. All reads of one run share one transaction,
+so the files match a single point in time.
+
+Files are written under new names and the manifest is replaced atomically;
+readers always see a complete snapshot. Files the previous manifest still
+referenced are kept for one more run, so a report that started before the
+swap can finish. Orders without an ``order_date`` are left out.
+
+Reports open the files through a memory-mapped filesystem, read only the
+columns they need, skip months outside the requested range and aggregate
+with Arrow's multi-threaded group-by. pyarrow is an optional dependency that
+only this module needs.
+"""
+import argparse
+import inspect
+import json
+import os
+import sys
+import time
+from datetime import date, datetime
+
+from sqlalchemy import Float, String, cast, func, select
+from sqlalchemy.orm import Session
+from app import models
+
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", "./analytics")
+ANALYTICS_COMPRESSION = os.getenv("ANALYTICS_COMPRESSION", "zstd")
+ANALYTICS_ROW_GROUP_SIZE = 128 * 1024
+FETCH_ROWS = 100000
+MANIFEST = "manifest.json"
+MAX_TOP_CUSTOMERS = 1000
+
+Order, Product, User = models.Order, models.Product, models.User
+Counter = models.ChangeCounter
+
+
+class SnapshotMissing(LookupError):
+    """No snapshot has been taken in ``ANALYTICS_DIR`` yet."""
+
+
+def _arrow():
+    try:
+        import pyarrow  # optional dependency, only needed for analytics
+    except ImportError as e:
+        raise RuntimeError("Analytics needs pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+# -------------------- Snapshot -------------------- #
+
+# Columns per table: (name, SQL expression, Arrow type name)
+COLUMNS = {
+    "orders": [
+        ("id", Order.id, "int64"),
+        ("user_id", Order.user_id, "int64"),
+        ("total_amount", Order.total_amount, "float64"),
+        ("status", Order.status, "string"),
+        # Parsed by Arrow in bulk, much faster than one datetime per row in Python
+        ("order_date", cast(Order.order_date, String), "timestamp"),
+    ],
+    "products": [
+        ("product_id", Product.product_id, "int64"),
+        ("seller_id", Product.seller_id, "int64"),
+        ("name", Product.name, "string"),
+        ("category", Product.category, "string"),
+        ("price", cast(Product.price, Float), "float64"),
+        ("stock", Product.stock, "int64"),
+    ],
+    "users": [
+        ("user_id", User.user_id, "int64"),
+        ("name", User.name, "string"),
+        ("role", User.role, "string"),
+    ],
+}
+
+
+def _schema(table: str):
+    pa = _arrow()
+    types = {"int64": pa.int64(), "float64": pa.float64(), "string": pa.string(), "timestamp": pa.timestamp("us")}
+    return pa.schema([(name, types[kind]) for name, _, kind in COLUMNS[table]])
+
+
+def _read(db: Session, table: str, *where, order_by=None):
+    """Rows of ``table`` matching ``where`` as an Arrow table."""
+    pa = _arrow()
+    schema = _schema(table)
+    stmt = select(*(expression for _, expression, _ in COLUMNS[table])).where(*where)
+    if order_by is not None:
+        stmt = stmt.order_by(order_by)
+    batches = []
+    for rows in db.execute(stmt).partitions(FETCH_ROWS):
+        arrays = []
+        for field, values in zip(schema, zip(*rows)):
+            if pa.types.is_timestamp(field.type):
+                arrays.append(pa.array(values, pa.string()).cast(field.type))
+            else:
+                arrays.append(pa.array(values, field.type))
+        batches.append(pa.RecordBatch.from_arrays(arrays, schema=schema))
+    return pa.Table.from_batches(batches, schema=schema)
+
+
+def _month_bounds(month: str):
+    start = datetime.strptime(month, "%Y-%m")
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return start, end
+
+
+def _months_between(first: datetime, last: datetime):
+    months = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def load_manifest(directory: str = ANALYTICS_DIR):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write(table, directory: str, relative: str):
+    import pyarrow.parquet as pq
+
+    path = os.path.join(directory, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, path + ".tmp", compression=ANALYTICS_COMPRESSION,
+                   row_group_size=ANALYTICS_ROW_GROUP_SIZE)
+    os.replace(path + ".tmp", path)
+
+
+def _changed_months(db: Session, previous: dict, since: int, directory: str):
+    """Months holding orders written or deleted after version ``since``, before and after the change."""
+    pa = _arrow()
+    import pyarrow.compute as pc
+
+    months = set()
+    ids = []
+    for order_id, order_date in db.execute(
+            select(Order.id, cast(Order.order_date, String)).where(Order.version > since)):
+        ids.append(order_id)
+        if order_date is not None:
+            months.add(order_date[:7])
+    ids += db.scalars(select(models.Tombstone.row_id).where(models.Tombstone.table_name == "orders",
+                                                            models.Tombstone.version > since)).all()
+    if ids and previous["orders"]:
+        # Where the changed and deleted orders were in the previous snapshot
+        paths = [os.path.join(directory, relative) for relative in previous["orders"].values()]
+        found = _dataset(paths).to_table(columns=["order_date"],
+                                         filter=pc.field("id").isin(pa.array(ids, pa.int64())))
+        months.update(pc.strftime(found["order_date"], "%Y-%m").to_pylist())
+    return months
+
+
+def _begin_consistent_read(db: Session):
+    """Make every following query of this transaction see the same committed data."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        # pysqlite runs SELECTs outside any transaction unless one is opened explicitly
+        db.connection().exec_driver_sql("BEGIN")
+    elif dialect == "postgresql":
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+
+
+def snapshot(db: Session, directory: str = ANALYTICS_DIR, full: bool = False):
+    """Bring the snapshot in ``directory`` up to date; returns the rows written per file."""
+    os.makedirs(directory, exist_ok=True)
+    _begin_consistent_read(db)
+    previous = load_manifest(directory)
+    counters = {row.table_name: row for row in db.scalars(select(Counter))}
+    versions = {table: counters[table].version if table in counters else 0 for table in COLUMNS}
+    pruned = counters["orders"].pruned_through if "orders" in counters else 0
+    # Deletions since the previous run must still be in the change feed
+    incremental = previous is not None and not full and previous["versions"]["orders"] >= pruned
+    manifest = {"created_at": datetime.utcnow().isoformat(timespec="seconds"), "versions": versions,
+                "orders": dict(previous["orders"]) if incremental else {},
+                "rows": dict(previous["rows"]) if incremental else {}}
+    written = {}
+
+    if incremental:
+        months = _changed_months(db, previous, previous["versions"]["orders"], directory)
+    else:
+        first, last = db.execute(select(func.min(Order.order_date), func.max(Order.order_date))).one()
+        months = set(_months_between(first, last)) if first is not None else set()
+    for month in sorted(months):
+        start, end = _month_bounds(month)
+        rows = _read(db, "orders", Order.order_date >= start, Order.order_date < end, order_by=Order.order_date)
+        key = f"orders:{month}"
+        written[key] = rows.num_rows
+        if rows.num_rows:
+            relative = f"orders/month={month}/v{versions['orders']}.parquet"
+            _write(rows, directory, relative)
+            manifest["orders"][month] = relative
+            manifest["rows"][key] = rows.num_rows
+        else:
+            manifest["orders"].pop(month, None)
+            manifest["rows"].pop(key, None)
+
+    for table in ("products", "users"):
+        if incremental and previous["versions"][table] == versions[table]:
+            manifest[table] = previous[table]
+            continue
+        rows = _read(db, table, order_by=COLUMNS[table][0][1])
+        manifest[table] = f"{table}/v{versions[table]}.parquet"
+        _write(rows, directory, manifest[table])
+        manifest["rows"][table] = written[table] = rows.num_rows
+    db.commit()
+
+    path = os.path.join(directory, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+    _remove_unreferenced(directory, manifest, previous)
+    return written
+
+
+def _files(manifest):
+    if not manifest:
+        return set()
+    return set(manifest["orders"].values()) | {manifest[t] for t in ("products", "users") if t in manifest}
+
+
+def _remove_unreferenced(directory: str, manifest: dict, previous: dict | None):
+    keep = {os.path.normpath(path) for path in _files(manifest) | _files(previous)}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            relative = os.path.normpath(os.path.relpath(os.path.join(root, name), directory))
+            if name.endswith(".parquet") and relative not in keep:
+                os.remove(os.path.join(root, name))
+
+
+# -------------------- Reports -------------------- #
+
+_manifest_cache = {}
+
+
+def current_manifest(directory: str = ANALYTICS_DIR):
+    """The manifest of the latest snapshot, re-read only when the file changes."""
+    try:
+        mtime = os.stat(os.path.join(directory, MANIFEST)).st_mtime_ns
+    except FileNotFoundError:
+        raise SnapshotMissing("No analytics snapshot yet; run python -m app.analytics snapshot") from None
+    cached = _manifest_cache.get(directory)
+    if cached is None or cached[0] != mtime:
+        cached = _manifest_cache[directory] = (mtime, load_manifest(directory))
+    return cached[1]
+
+
+def _dataset(paths):
+    import pyarrow.dataset as ds
+    from pyarrow import fs
+
+    return ds.dataset(paths, format="parquet", filesystem=fs.LocalFileSystem(use_mmap=True))
+
+
+def _orders(manifest: dict, directory: str, columns, date_from: date | None = None,
+            date_to: date | None = None, exclude_cancelled: bool = False):
+    """The requested order columns, reading only the months inside ``[date_from, date_to)``."""
+    import pyarrow.compute as pc
+
+    low = date_from.strftime("%Y-%m") if date_from else None
+    high = date_to.strftime("%Y-%m") if date_to else None
+    paths = [os.path.join(directory, relative) for month, relative in sorted(manifest["orders"].items())
+             if (low is None or month >= low) and (high is None or month <= high)]
+    if not paths:
+        return _arrow().schema([field for field in _schema("orders") if field.name in columns]).empty_table()
+    conditions = []
+    if date_from:
+        conditions.append(pc.field("order_date") >= datetime.combine(date_from, datetime.min.time()))
+    if date_to:
+        conditions.append(pc.field("order_date") < datetime.combine(date_to, datetime.min.time()))
+    if exclude_cancelled:
+        conditions.append(pc.field("status") != "cancelled")
+    condition = None
+    for part in conditions:
+        condition = part if condition is None else condition & part
+    return _dataset(paths).to_table(columns=columns, filter=condition)
+
+
+def _period(order_dates, period: str):
+    import pyarrow.compute as pc
+
+    if period == "week":
+        return pc.floor_temporal(order_dates, unit="week", week_starts_monday=True)
+    return pc.floor_temporal(order_dates, unit=period)
+
+
+def revenue(manifest, directory, period="month", date_from=None, date_to=None):
+    """Orders, revenue, average order value and distinct customers per period, cancelled orders excluded."""
+    orders = _orders(manifest, directory, ["user_id", "total_amount", "order_date"], date_from, date_to,
+                     exclude_cancelled=True)
+    orders = orders.append_column("period", _period(orders["order_date"], period))
+    result = orders.group_by("period").aggregate([
+        ("total_amount", "count"), ("total_amount", "sum"), ("total_amount", "mean"), ("user_id", "count_distinct"),
+    ])
+    return result.rename_columns(["period", "orders", "revenue", "average_order", "customers"]).sort_by("period")
+
+
+def funnel(manifest, directory, period="month", date_from=None, date_to=None):
+    """Orders per period and status, with each status's share of the period."""
+    import pyarrow.compute as pc
+
+    orders = _orders(manifest, directory, ["status", "order_date"], date_from, date_to)
+    orders = orders.append_column("period", _period(orders["order_date"], period))
+    counts = orders.group_by(["period", "status"]).aggregate([([], "count_all")])
+    counts = counts.rename_columns(["period", "status", "orders"])
+    totals = counts.group_by("period").aggregate([("orders", "sum")])
+    counts = counts.join(totals, "period")
+    share = pc.divide(pc.cast(counts["orders"], "float64"), counts["orders_sum"])
+    return (counts.drop_columns(["orders_sum"]).append_column("share", share)
+            .sort_by([("period", "ascending"), ("status", "ascending")]))
+
+
+def cohorts(manifest, directory, date_from=None, date_to=None):
+    """Customers and revenue by first-order month (the cohort) and months since then.
+
+    Cohorts come from each customer's whole history; ``date_from`` and
+    ``date_to`` only choose which cohorts are reported.
+    """
+    import pyarrow.compute as pc
+
+    orders = _orders(manifest, directory, ["user_id", "total_amount", "order_date"], exclude_cancelled=True)
+    orders = orders.append_column("month", _period(orders["order_date"], "month"))
+    first = orders.group_by("user_id").aggregate([("month", "min")]).rename_columns(["user_id", "cohort"])
+    if date_from:
+        first = first.filter(pc.field("cohort") >= datetime.combine(date_from, datetime.min.time()))
+    if date_to:
+        first = first.filter(pc.field("cohort") < datetime.combine(date_to, datetime.min.time()))
+    orders = orders.join(first, "user_id", join_type="inner")
+    age = pc.add(pc.multiply(pc.subtract(pc.year(orders["month"]), pc.year(orders["cohort"])), 12),
+                 pc.subtract(pc.month(orders["month"]), pc.month(orders["cohort"])))
+    orders = orders.append_column("months_since_first", age)
+    result = orders.group_by(["cohort", "months_since_first"]).aggregate([
+        ("user_id", "count_distinct"), ("total_amount", "sum"), ("total_amount", "count"),
+    ])
+    result = result.rename_columns(["cohort", "months_since_first", "customers", "revenue", "orders"])
+    return result.sort_by([("cohort", "ascending"), ("months_since_first", "ascending")])
+
+
+def customers(manifest, directory, date_from=None, date_to=None, limit=10):
+    """The ``limit`` customers with the most revenue, with their names."""
+    orders = _orders(manifest, directory, ["user_id", "total_amount"], date_from, date_to, exclude_cancelled=True)
+    totals = orders.group_by("user_id").aggregate([("total_amount", "sum"), ("total_amount", "count")])
+    totals = totals.rename_columns(["user_id", "revenue", "orders"])
+    top = totals.sort_by([("revenue", "descending"), ("user_id", "ascending")]).slice(0, limit)
+    users = _dataset([os.path.join(directory, manifest["users"])]).to_table(columns=["user_id", "name"])
+    return top.join(users, "user_id").sort_by([("revenue", "descending"), ("user_id", "ascending")])
+
+
+def categories(manifest, directory):
+    """Products, stock, stock value and average price per category."""
+    import pyarrow.compute as pc
+
+    products = _dataset([os.path.join(directory, manifest["products"])]).to_table(
+        columns=["category", "price", "stock"])
+    products = products.append_column("stock_value", pc.multiply(products["price"],
+                                                                 pc.cast(products["stock"], "float64")))
+    result = products.group_by("category").aggregate([
+        ("price", "count"), ("stock", "sum"), ("stock_value", "sum"), ("price", "mean"),
+    ])
+    return (result.rename_columns(["category", "products", "stock", "stock_value", "average_price"])
+            .sort_by("category"))
+
+
+REPORTS = {"revenue": revenue, "funnel": funnel, "cohorts": cohorts, "customers": customers,
+           "categories": categories}
+
+
+def run_report(name: str, directory: str = ANALYTICS_DIR, **params):
+    """``(manifest, Arrow table)`` for report ``name`` over the latest snapshot.
+
+    Parameters the report does not take are ignored.
+    """
+    _arrow()
+    manifest = current_manifest(directory)
+    report = REPORTS[name]
+    accepted = inspect.signature(report).parameters
+    return manifest, report(manifest, directory, **{k: v for k, v in params.items() if k in accepted})
+
+
+def to_arrow_stream(table) -> bytes:
+    pa = _arrow()
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def main(argv):
+    from app import migrations
+    from app.database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Write columnar snapshots for analytics.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    snapshot_parser = commands.add_parser("snapshot", help="write or update the snapshot")
+    snapshot_parser.add_argument("--directory", default=ANALYTICS_DIR)
+    snapshot_parser.add_argument("--full", action="store_true", help="rewrite every file")
+    snapshot_parser.add_argument("--every", type=float, help="keep running, one snapshot every this many seconds")
+    args = parser.parse_args(argv)
+
+    migrations.upgrade(engine)
+    full = args.full
+    while True:
+        started = time.perf_counter()
+        with SessionLocal() as db:
+            written = snapshot(db, args.directory, full=full)
+        rows = sum(written.values())
+        print(f"Snapshot in {time.perf_counter() - started:.1f}s: {len(written)} files rewritten, {rows} rows.")
+        if not args.every:
+            return 0
+        full = False
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,112 @@
+"""Async counterparts of the crud functions used by ``app.async_routes``.
+
+Reads build the same statements as ``app.crud`` and await them on the
+AsyncSession. Writes run the sync crud functions through ``run_sync`` so the
+summary tables and every other side effect stay defined in one place.
+"""
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import auth, crud, models, schemas
+from app.pagination import DEFAULT_PAGE_SIZE, keyset_select, split_page
+
+
+async def _page(db: AsyncSession, stmt, sort: str, column, pk_column, limit: int,
+                after: str | None, descending: bool, columns=None):
+    stmt = keyset_select(stmt, sort, column, pk_column, limit, after, descending)
+    if columns is not None:
+        rows = (await db.execute(stmt.with_only_columns(*columns))).all()
+    else:
+        rows = (await db.scalars(stmt)).all()
+    return split_page(rows, sort, column, pk_column, limit)
+
+
+# -------------------- USERS -------------------- #
+async def _hash_password(user: schemas.UserCreate | schemas.UserUpdate):
+    # run_sync executes on the event loop thread; hash beforehand so the KDF runs on a worker
+    if user.password is not None and not auth.is_hashed(user.password):
+        user = user.model_copy(update={"password": await auth.hash_password_async(user.password)})
+    return user
+
+async def _revoke_sessions(user_id: int):
+    # Not inside run_sync: with AUTH_SESSION_STORE=database this is a blocking transaction of its own
+    await run_in_threadpool(auth.sessions.revoke_user, user_id)
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    return await db.run_sync(crud.create_user, await _hash_password(user))
+
+async def get_users(db: AsyncSession, limit: int = DEFAULT_PAGE_SIZE, after: str | None = None,
+                    sort: str = "user_id", descending: bool = False, role: str | None = None,
+                    columns=None):
+    return await _page(db, crud.filter_users(role), sort, crud.USER_SORTS[sort],
+                       models.User.user_id, limit, after, descending, columns)
+
+async def update_user(db: AsyncSession, user_id: int, user: schemas.UserCreate,
+                      expected_version: int | None = None, admin_name: str | None = None):
+    updated = await db.run_sync(crud.update_user, user_id, await _hash_password(user), expected_version,
+                                admin_name, revoke_sessions=False)
+    if updated is not None:
+        await _revoke_sessions(user_id)
+    return updated
+
+async def patch_user(db: AsyncSession, user_id: int, user: schemas.UserUpdate,
+                     expected_version: int | None = None, admin_name: str | None = None):
+    patched = await db.run_sync(crud.patch_user, user_id, await _hash_password(user), expected_version,
+                                admin_name, revoke_sessions=False)
+    if patched is not None and user.model_fields_set:
+        await _revoke_sessions(user_id)
+    return patched
+
+async def delete_user(db: AsyncSession, user_id: int):
+    deleted = await db.run_sync(crud.delete_user, user_id, revoke_sessions=False)
+    await _revoke_sessions(user_id)
+    return deleted
+
+# -------------------- PRODUCTS -------------------- #
+async def create_product(db: AsyncSession, product: schemas.ProductCreate):
+    return await db.run_sync(crud.create_product, product)
+
+async def get_products(db: AsyncSession, limit: int = DEFAULT_PAGE_SIZE, after: str | None = None,
+                       sort: str = "product_id", descending: bool = False, columns=None, **filters):
+    return await _page(db, crud.filter_products(**filters), sort, crud.PRODUCT_SORTS[sort],
+                       models.Product.product_id, limit, after, descending, columns)
+
+async def update_product(db: AsyncSession, product_id: int, product: schemas.ProductCreate,
+                         expected_version: int | None = None, admin_name: str | None = None):
+    return await db.run_sync(crud.update_product, product_id, product, expected_version, admin_name)
+
+async def patch_product(db: AsyncSession, product_id: int, product: schemas.ProductUpdate,
+                        expected_version: int | None = None, admin_name: str | None = None):
+    return await db.run_sync(crud.patch_product, product_id, product, expected_version, admin_name)
+
+async def delete_product(db: AsyncSession, product_id: int):
+    return await db.run_sync(crud.delete_product, product_id)
+
+# -------------------- ORDERS -------------------- #
+async def create_order(db: AsyncSession, order: schemas.OrderCreate):
+    return await db.run_sync(crud.create_order, order)
+
+async def checkout(db: AsyncSession, request: schemas.CheckoutRequest):
+    return await db.run_sync(crud.checkout, request)
+
+async def get_orders(db: AsyncSession, limit: int = DEFAULT_PAGE_SIZE, after: str | None = None,
+                     sort: str = "id", descending: bool = False, columns=None, **filters):
+    return await _page(db, crud.filter_orders(**filters), sort, crud.ORDER_SORTS[sort],
+                       models.Order.id, limit, after, descending, columns)
+
+async def get_orders_by_user(db: AsyncSession, user_id: int, **page):
+    return await get_orders(db, user_id=user_id, **page)
+
+async def update_order(db: AsyncSession, order_id: int, order: schemas.OrderCreate,
+                       expected_version: int | None = None, admin_name: str | None = None):
+    return await db.run_sync(crud.update_order, order_id, order, expected_version, admin_name)
+
+async def patch_order(db: AsyncSession, order_id: int, order: schemas.OrderUpdate,
+                      expected_version: int | None = None, admin_name: str | None = None):
+    return await db.run_sync(crud.patch_order, order_id, order, expected_version, admin_name)
+
+async def delete_order(db: AsyncSession, order_id: int):
+    return await db.run_sync(crud.delete_order, order_id)
+
+async def log_admin_activity(db: AsyncSession, admin_name: str, action: str, target_table: str):
+    # Only stages the entry on the session; nothing to await
+    crud.log_admin_activity(db.sync_session, admin_name, action, target_table)
@@ -0,0 +1,54 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.metrics import TimedAsyncQueuePool
+from app.database import (
+    DB_PROFILE,
+    SQLALCHEMY_DATABASE_URL,
+    apply_sqlite_pragmas,
+    engine_options,
+    sqlite_pragmas,
+)
+
+
+def async_url(url: str):
+    """Map the sync DATABASE_URL onto its async driver (aiosqlite or asyncpg)."""
+    scheme, _, rest = url.partition("://")
+    dialect = scheme.split("+")[0]
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    if dialect == "postgresql":
+        return f"postgresql+asyncpg://{rest}"
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", async_url(SQLALCHEMY_DATABASE_URL))
+
+
+def create_async_db_engine(url: str = ASYNC_DATABASE_URL, profile: str = DB_PROFILE):
+    options = engine_options(url)
+    if url.startswith("sqlite"):
+        # aiosqlite runs each connection on its own thread already
+        options.pop("connect_args", None)
+    if "poolclass" in options:
+        options["poolclass"] = TimedAsyncQueuePool
+    async_engine = create_async_engine(url, **options)
+    if async_engine.dialect.name == "sqlite":
+        pragmas = sqlite_pragmas(profile)
+
+        @event.listens_for(async_engine.sync_engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+    return async_engine
+
+
+async_engine = create_async_db_engine()
+os.register_at_fork(after_in_child=lambda: async_engine.sync_engine.dispose(close=False))  # see app.database
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,229 @@
+"""``async def`` versions of the user, product and order endpoints.
+
+Enabled with ``API_MODE=async``; ``app.main`` registers this router ahead of
+``app.routes`` so these handlers take over the shared paths while every other
+endpoint keeps being served by the sync router.
+"""
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import async_crud, crud, schemas
+from app.async_database import get_async_db
+from app.cache import response_cache
+from app.serialization import columns_for
+from app.pagination import InvalidCursor
+from app.routes import ADMIN_NAME, PageParams, if_match, version_conflict, with_etag
+
+router = APIRouter()
+
+async def paginate(response: Response, fetch, page: PageParams, **kwargs):
+    try:
+        rows, next_cursor = await fetch(limit=page.limit, after=page.after,
+                                        descending=page.descending, **kwargs)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+async def cached_page(request: Request, response: Response, table: str, partition, schema, fetch,
+                      page: PageParams, **kwargs):
+    lookup = response_cache.lookup(request, table, partition)
+    if lookup.entry is None:
+        rows = await paginate(response, fetch, page, columns=columns_for(schema), **kwargs)
+        lookup.store(page.encode(schema, rows), response.headers.get("X-Next-Cursor"))
+    return lookup.response()
+
+# ---------------- USERS ----------------
+@router.post("/users/", response_model=schemas.User)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
+    await async_crud.log_admin_activity(db, admin_name=ADMIN_NAME, action="add", target_table="users")
+    created_user = await async_crud.create_user(db, user)
+    return created_user
+
+@router.get("/users/", response_model=list[schemas.User])
+async def read_users(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    sort: Literal["user_id", "email"] = "user_id",
+    role: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await cached_page(request, response, "users", role, schemas.User,
+                             lambda **kw: async_crud.get_users(db, **kw), page, sort=sort, role=role)
+
+@router.put("/users/{user_id}", response_model=schemas.User)
+async def update_user(
+    user_id: int,
+    user: schemas.UserCreate,
+    response: Response,
+    expected_version: Optional[int] = Depends(if_match),
+    db: AsyncSession = Depends(get_async_db),
+):
+    try:
+        updated = await async_crud.update_user(db, user_id, user, expected_version, admin_name=ADMIN_NAME)
+    except crud.VersionConflict as e:
+        raise version_conflict(e)
+    return with_etag(response, updated, "User not found.")
+
+@router.patch("/users/{user_id}", response_model=schemas.User)
+async def patch_user(
+    user_id: int,
+    user: schemas.UserUpdate,
+    response: Response,
+    expected_version: Optional[int] = Depends(if_match),
+    db: AsyncSession = Depends(get_async_db),
+):
+    try:
+        patched = await async_crud.patch_user(db, user_id, user, expected_version, admin_name=ADMIN_NAME)
+    except crud.VersionConflict as e:
+        raise version_conflict(e)
+    return with_etag(response, patched, "User not found.")
+
+@router.delete("/users/{user_id}")
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
+    await async_crud.log_admin_activity(db, admin_name=ADMIN_NAME, action="delete", target_table="users")
+    deleted = await async_crud.delete_user(db, user_id)
+    return deleted
+
+# ---------------- PRODUCTS ----------------
+@router.post("/products/", response_model=schemas.Product)
+async def create_product(product: schemas.ProductCreate, db: AsyncSession = Depends(get_async_db)):
+    await async_crud.log_admin_activity(db, admin_name=ADMIN_NAME, action="add", target_table="products")
+    created_product = await async_crud.create_product(db, product)
+    return created_product
+
+@router.get("/products/", response_model=list[schemas.Product])
+async def read_products(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    sort: Literal["product_id", "price"] = "product_id",
+    category: Optional[str] = None,
+    seller_id: Optional[int] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await cached_page(request, response, "products", category, schemas.Product,
+                             lambda **kw: async_crud.get_products(db, **kw), page, sort=sort, category=category,
+                             seller_id=seller_id, min_price=min_price, max_price=max_price)
+
+@router.put("/products/{product_id}", response_model=schemas.Product)
+async def update_product(
+    product_id: int,
+    product: schemas.ProductCreate,
+    response: Response,
+    expected_version: Optional[int] = Depends(if_match),
+    db: AsyncSession = Depends(get_async_db),
+):
+    try:
+        updated = await async_crud.update_product(db, product_id, product, expected_version, admin_name=ADMIN_NAME)
+    except crud.VersionConflict as e:
+        raise version_conflict(e)
+    return with_etag(response, updated, "Product not found.")
+
+@router.patch("/products/{product_id}", response_model=schemas.Product)
+async def patch_product(
+    product_id: int,
+    product: schemas.ProductUpdate,
+    response: Response,
+    expected_version: Optional[int] = Depends(if_match),
+    db: AsyncSession = Depends(get_async_db),
+):
+    try:
+        patched = await async_crud.patch_product(db, product_id, product, expected_version, admin_name=ADMIN_NAME)
+    except crud.VersionConflict as e:
+        raise version_conflict(e)
+    return with_etag(response, patched, "Product not found.")
+
+@router.delete("/products/{product_id}")
+async def delete_product(product_id: int, db: AsyncSession = Depends(get_async_db)):
+    await async_crud.log_admin_activity(db, admin_name=ADMIN_NAME, action="delete", target_table="products")
+    deleted = await async_crud.delete_product(db, product_id)
+    return deleted
+
+# ---------------- ORDERS ----------------
+@router.post("/orders/", response_model=schemas.Order)
+async def create_order(order: schemas.OrderCreate, db: AsyncSession = Depends(get_async_db)):
+    await async_crud.log_admin_activity(db, admin_name=ADMIN_NAME, action="add", target_table="orders")
+    created_order = await async_crud.create_order(db, order)
+    return created_order
+
+@router.post("/orders/checkout", response_model=schemas.OrderWithItems)
+async def checkout(request: schemas.CheckoutRequest, db: AsyncSession = Depends(get_async_db)):
+    await async_crud.log_admin_activity(db, admin_name=ADMIN_NAME, action="checkout", target_table="orders")
+    try:
+        return await async_crud.checkout(db, request)
+    except crud.ProductNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except crud.InsufficientStock as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/orders/", response_model=list[schemas.Order])
+async def read_all_orders(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    sort: Literal["id", "order_date", "total_amount"] = "id",
+    status: Optional[str] = None,
+    user_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await cached_page(request, response, "orders", user_id, schemas.Order,
+                             lambda **kw: async_crud.get_orders(db, **kw), page, sort=sort, status=status,
+                             user_id=user_id, date_from=date_from, date_to=date_to,
+                             min_amount=min_amount, max_amount=max_amount)
+
+@router.get("/orders/user/{user_id}", response_model=list[schemas.Order])
+async def read_orders_by_user(
+    user_id: int,
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    sort: Literal["id", "order_date", "total_amount"] = "id",
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await cached_page(request, response, "orders", user_id, schemas.Order,
+                             lambda **kw: async_crud.get_orders_by_user(db, user_id, **kw), page, sort=sort)
+
+@router.put("/orders/{order_id}", response_model=schemas.Order)
+async def update_order(
+    order_id: int,
+    order: schemas.OrderCreate,
+    response: Response,
+    expected_version: Optional[int] = Depends(if_match),
+    db: AsyncSession = Depends(get_async_db),
+):
+    try:
+        updated = await async_crud.update_order(db, order_id, order, expected_version, admin_name=ADMIN_NAME)
+    except crud.VersionConflict as e:
+        raise version_conflict(e)
+    return with_etag(response, updated, "Order not found.")
+
+@router.patch("/orders/{order_id}", response_model=schemas.Order)
+async def patch_order(
+    order_id: int,
+    order: schemas.OrderUpdate,
+    response: Response,
+    expected_version: Optional[int] = Depends(if_match),
+    db: AsyncSession = Depends(get_async_db),
+):
+    try:
+        patched = await async_crud.patch_order(db, order_id, order, expected_version, admin_name=ADMIN_NAME)
+    except crud.VersionConflict as e:
+        raise version_conflict(e)
+    return with_etag(response, patched, "Order not found.")
+
+@router.delete("/orders/{order_id}")
+async def delete_order(order_id: int, db: AsyncSession = Depends(get_async_db)):
+    await async_crud.log_admin_activity(db, admin_name=ADMIN_NAME, action="delete", target_table="orders")
+    deleted = await async_crud.delete_order(db, order_id)
+    return deleted
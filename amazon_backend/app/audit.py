@@ -0,0 +1,159 @@
+"""Admin activity logging.
+
+``record`` attaches a log entry to the session's upcoming commit:
+
+- ``AUDIT_MODE=queued`` (default): once the mutation commits, the entry is handed
+  to a background writer that inserts logs in batches, so a request costs one
+  commit instead of two. Entries of a rolled back transaction are dropped.
+- ``AUDIT_MODE=strict``: the entry is added to the session and committed in the
+  same transaction as the mutation.
+
+Call ``record`` before the mutation commits. The writer flushes when
+``AUDIT_BATCH_SIZE`` entries are waiting or ``AUDIT_FLUSH_INTERVAL`` seconds
+have passed, and drains its queue on shutdown. When ``AUDIT_QUEUE_SIZE``
+entries are already waiting, producers block for up to ``AUDIT_PUT_TIMEOUT``
+seconds and then write their entry themselves.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+from app import events, models
+from app.database import SessionLocal
+
+AUDIT_MODE = os.getenv("AUDIT_MODE", "queued")
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_PUT_TIMEOUT = float(os.getenv("AUDIT_PUT_TIMEOUT", "0.5"))
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = "pending_audit_entries"
+_STOP = object()
+
+
+class AuditLogWriter:
+    def __init__(self, session_factory=SessionLocal, batch_size=AUDIT_BATCH_SIZE,
+                 flush_interval=AUDIT_FLUSH_INTERVAL, max_queue=AUDIT_QUEUE_SIZE,
+                 put_timeout=AUDIT_PUT_TIMEOUT):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.written = 0
+        self.direct_writes = 0
+        self.failed = 0
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the writer after everything queued so far has been written."""
+        if not self.running:
+            return
+        self.queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, entry: dict):
+        if self.running:
+            try:
+                self.queue.put(entry, timeout=self.put_timeout)
+                return
+            except queue.Full:
+                logger.warning("Audit log queue is full; writing entry synchronously.")
+        self.direct_writes += 1
+        self._write([entry])
+
+    def flush(self):
+        """Block until every entry queued so far has been written."""
+        if self.running:
+            self.queue.join()
+
+    def _run(self):
+        batch, deadline = [], None
+        while True:
+            # Wait indefinitely for the first entry, then at most until the batch deadline
+            timeout = max(deadline - time.monotonic(), 0) if batch else None
+            try:
+                entry = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                entry = None
+            if entry is _STOP:
+                self._write_batch(batch)
+                self.queue.task_done()
+                return
+            if entry is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(entry)
+            if batch and (entry is None or len(batch) >= self.batch_size):
+                self._write_batch(batch)
+                batch = []
+
+    def _write_batch(self, batch: list):
+        if batch:
+            self._write(batch)
+        for _ in batch:
+            self.queue.task_done()
+
+    def _write(self, batch: list):
+        for attempt in range(3):
+            try:
+                with self.session_factory() as db:
+                    Log = models.AdminActivityLog
+                    ids = db.scalars(insert(Log).returning(Log.id, sort_by_parameter_order=True), batch).all()
+                    for entry, log_id in zip(batch, ids):
+                        events.publish(db, "admin_logs", "insert", row={"id": log_id, **entry})
+                    db.commit()
+                self.written += len(batch)
+                return
+            except Exception:
+                logger.exception("Writing %d audit log entries failed (attempt %d).", len(batch), attempt + 1)
+                time.sleep(0.1 * 2 ** attempt)
+        self.failed += len(batch)
+
+
+writer = AuditLogWriter()
+
+
+def record(db: Session, admin_name: str, action: str, target_table: str, details: str | None = None):
+    entry = {
+        "admin_name": admin_name,
+        "action": action,
+        "target_table": target_table,
+        "timestamp": datetime.utcnow(),
+        "details": details,
+    }
+    if AUDIT_MODE == "strict":
+        log = models.AdminActivityLog(**entry)
+        db.add(log)
+        events.publish(db, "admin_logs", "insert", row=log)
+    else:
+        db.info.setdefault(PENDING_KEY, []).append(entry)  # published by the writer, with its id
+
+
+@event.listens_for(Session, "after_commit")
+def _submit_pending(session):
+    for entry in session.info.pop(PENDING_KEY, ()):
+        writer.submit(entry)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop(PENDING_KEY, None)
@@ -0,0 +1,254 @@
+"""Password hashing and server-side login sessions.
+
+Passwords are stored as ``pbkdf2_sha256$<iterations>$<salt>$<hash>`` with a
+random 16 byte salt per user. ``AUTH_PBKDF2_ITERATIONS`` sets the cost for new
+hashes; existing hashes keep their own cost and are upgraded on the next
+successful login, as are plaintext passwords left over from before hashing.
+Bulk imports hash with ``AUTH_IMPORT_PBKDF2_ITERATIONS``, which can be set
+lower to load many users quickly; those hashes are upgraded the same way.
+
+The KDF is CPU bound, so the async helpers run it on worker threads limited to
+``AUTH_KDF_CONCURRENCY`` at a time, keeping logins from tying up the event loop
+or the threadpool the sync endpoints run on. ``ensure_hashed_many`` spreads a
+batch over as many threads (``hashlib`` releases the GIL while hashing).
+
+``sessions`` maps tokens issued at login to the logged in user for
+``AUTH_SESSION_TTL`` seconds. ``AUTH_SESSION_STORE`` picks where they live:
+``memory`` (the default) keeps them in the process, so checking a token costs
+a dict lookup; ``database`` keeps them in the ``auth_sessions`` table, which
+every worker process sees (``app.serve`` selects it when running several).
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import anyio
+from sqlalchemy import delete, insert
+from app import models
+from app.database import SessionLocal
+
+AUTH_PBKDF2_ITERATIONS = int(os.getenv("AUTH_PBKDF2_ITERATIONS", "600000"))
+AUTH_IMPORT_PBKDF2_ITERATIONS = int(os.getenv("AUTH_IMPORT_PBKDF2_ITERATIONS", str(AUTH_PBKDF2_ITERATIONS)))
+AUTH_KDF_CONCURRENCY = int(os.getenv("AUTH_KDF_CONCURRENCY", str(os.cpu_count() or 1)))
+AUTH_SESSION_TTL = int(os.getenv("AUTH_SESSION_TTL", "28800"))
+AUTH_MAX_SESSIONS = int(os.getenv("AUTH_MAX_SESSIONS", "10000"))
+AUTH_SESSION_STORE = os.getenv("AUTH_SESSION_STORE", "memory")
+
+ALGORITHM = "pbkdf2_sha256"
+SALT_BYTES = 16
+
+_kdf_limiter = None
+_kdf_pool = None
+_kdf_pool_lock = threading.Lock()
+
+
+# ---------- Password hashing ----------
+
+def _b64(raw: bytes):
+    return base64.b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _unb64(text: str):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _parse(stored: str):
+    """``(iterations, salt, digest)`` of a stored hash, or None for anything else."""
+    parts = stored.split("$")
+    if len(parts) != 4 or parts[0] != ALGORITHM or not parts[1].isdigit():
+        return None
+    try:
+        return int(parts[1]), _unb64(parts[2]), _unb64(parts[3])
+    except ValueError:
+        return None
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int):
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+
+
+def hash_password(password: str, iterations: int = AUTH_PBKDF2_ITERATIONS):
+    salt = secrets.token_bytes(SALT_BYTES)
+    return f"{ALGORITHM}${iterations}${_b64(salt)}${_b64(_pbkdf2(password, salt, iterations))}"
+
+
+def is_hashed(stored: str):
+    return _parse(stored) is not None
+
+
+def ensure_hashed(password: str):
+    """Hash ``password`` unless it already is a hash, e.g. one carried over from another system."""
+    return password if is_hashed(password) else hash_password(password)
+
+
+def ensure_hashed_many(passwords, iterations: int = AUTH_IMPORT_PBKDF2_ITERATIONS):
+    """``ensure_hashed`` for a batch, run on ``AUTH_KDF_CONCURRENCY`` threads."""
+    global _kdf_pool
+
+    def one(password):
+        return password if is_hashed(password) else hash_password(password, iterations)
+
+    passwords = list(passwords)
+    if AUTH_KDF_CONCURRENCY <= 1 or sum(not is_hashed(p) for p in passwords) <= 1:
+        return [one(password) for password in passwords]
+    with _kdf_pool_lock:
+        if _kdf_pool is None:
+            _kdf_pool = ThreadPoolExecutor(AUTH_KDF_CONCURRENCY, thread_name_prefix="kdf")
+    return list(_kdf_pool.map(one, passwords))
+
+
+def verify_password(password: str, stored: str | None):
+    """Check ``password`` against a stored hash (or legacy plaintext).
+
+    With ``stored=None`` (unknown user) a hash is still computed so the response
+    time does not reveal which emails exist.
+    """
+    if stored is None:
+        hash_password(password)
+        return False
+    parsed = _parse(stored)
+    if parsed is None:
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+    iterations, salt, digest = parsed
+    return hmac.compare_digest(_pbkdf2(password, salt, iterations), digest)
+
+
+def needs_rehash(stored: str):
+    parsed = _parse(stored)
+    return parsed is None or parsed[0] != AUTH_PBKDF2_ITERATIONS
+
+
+def _limiter():
+    global _kdf_limiter
+    if _kdf_limiter is None:
+        _kdf_limiter = anyio.CapacityLimiter(AUTH_KDF_CONCURRENCY)
+    return _kdf_limiter
+
+
+async def hash_password_async(password: str):
+    return await anyio.to_thread.run_sync(hash_password, password, limiter=_limiter())
+
+
+async def verify_password_async(password: str, stored: str | None):
+    return await anyio.to_thread.run_sync(verify_password, password, stored, limiter=_limiter())
+
+
+# ---------- Sessions ----------
+
+LoginSession = namedtuple("LoginSession", "user_id name email role expires_at")
+
+
+class SessionCache:
+    """In-process token store with a fixed lifetime per token.
+
+    Only a SHA-256 digest of each token is kept. When ``max_sessions`` tokens
+    are live, the oldest one is dropped to make room.
+    """
+
+    def __init__(self, ttl: int = AUTH_SESSION_TTL, max_sessions: int = AUTH_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str):
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def issue(self, user):
+        token = secrets.token_urlsafe(32)
+        session = LoginSession(user.user_id, user.name, user.email, user.role, time.time() + self.ttl)
+        with self._lock:
+            self._sessions[self._key(token)] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return token, session
+
+    def get(self, token: str):
+        key = self._key(token)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None and session.expires_at <= time.time():
+                del self._sessions[key]
+                session = None
+        return session
+
+    def revoke(self, token: str):
+        with self._lock:
+            return self._sessions.pop(self._key(token), None) is not None
+
+    def revoke_user(self, user_id: int):
+        """End every session of a user, e.g. after a password change or deletion."""
+        with self._lock:
+            for key in [k for k, s in self._sessions.items() if s.user_id == user_id]:
+                del self._sessions[key]
+
+    def revoke_users(self, user_ids):
+        """``revoke_user`` for many users at once, e.g. after a bulk upsert."""
+        user_ids = set(user_ids)
+        with self._lock:
+            for key in [k for k, s in self._sessions.items() if s.user_id in user_ids]:
+                del self._sessions[key]
+
+
+class DatabaseSessionStore:
+    """Token store in the ``auth_sessions`` table, shared by all worker processes.
+
+    Same interface as ``SessionCache``. Each call runs in its own short
+    transaction, so it must not be made while the caller's session holds the
+    SQLite write lock (``crud`` revokes sessions after committing). Expired
+    rows are deleted whenever a new session is issued.
+    """
+
+    def __init__(self, ttl: int = AUTH_SESSION_TTL):
+        self.ttl = ttl
+
+    def issue(self, user):
+        token = secrets.token_urlsafe(32)
+        session = LoginSession(user.user_id, user.name, user.email, user.role, time.time() + self.ttl)
+        with SessionLocal() as db:
+            db.execute(delete(models.AuthSession).where(models.AuthSession.expires_at <= time.time()))
+            db.execute(insert(models.AuthSession).values(token_hash=SessionCache._key(token), **session._asdict()))
+            db.commit()
+        return token, session
+
+    def get(self, token: str):
+        with SessionLocal() as db:
+            row = db.get(models.AuthSession, SessionCache._key(token))
+        if row is None or row.expires_at <= time.time():
+            return None
+        return LoginSession(row.user_id, row.name, row.email, row.role, row.expires_at)
+
+    def _delete(self, condition):
+        with SessionLocal() as db:
+            deleted = db.execute(delete(models.AuthSession).where(condition)).rowcount
+            db.commit()
+        return deleted
+
+    def revoke(self, token: str):
+        return self._delete(models.AuthSession.token_hash == SessionCache._key(token)) > 0
+
+    def revoke_user(self, user_id: int):
+        """End every session of a user, e.g. after a password change or deletion."""
+        self._delete(models.AuthSession.user_id == user_id)
+
+    def revoke_users(self, user_ids):
+        """``revoke_user`` for many users at once, e.g. after a bulk upsert."""
+        self._delete(models.AuthSession.user_id.in_(list(user_ids)))
+
+
+def create_session_store(name: str = AUTH_SESSION_STORE):
+    if name == "memory":
+        return SessionCache()
+    if name == "database":
+        return DatabaseSessionStore()
+    raise ValueError(f"Unknown AUTH_SESSION_STORE {name!r}; expected memory or database")
+
+
+sessions = create_session_store()
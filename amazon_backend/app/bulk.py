@@ -0,0 +1,272 @@
+"""Bulk import and streaming export of users, products and orders.
+
+Imports read NDJSON or CSV line by line, validate each row against the create
+schema and write batches of ``BATCH_SIZE`` rows with one executemany and one
+commit per batch. A batch that hits a database error is retried row by row so
+every failing row is reported with its line number.
+
+Exports stream rows through a server-side cursor, so the table is never
+materialized in memory. Password hashes are left out of user exports.
+"""
+import codecs
+import csv
+import io
+import json
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+import anyio
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from app import auth, cache, changes, events, models, schemas, summaries
+from app.database import SessionLocal, upsert_insert
+
+BATCH_SIZE = 1000
+EXPORT_CHUNK_ROWS = 1000
+MAX_REPORTED_ERRORS = 1000
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def _hash_user_passwords(rows: list):
+    # Values that are already hashes are kept as they are
+    for values, password in zip(rows, auth.ensure_hashed_many(values["password"] for values in rows)):
+        values["password"] = password
+
+
+def _revoke_user_sessions(rows: list):
+    # Like a single user update: an upserted user may have a new password or role
+    auth.sessions.revoke_users(values["user_id"] for values in rows)
+
+
+# upserted: called with the rows of each committed upsert batch
+# private: columns left out of exports
+BulkTable = namedtuple("BulkTable", "model schema pk snapshot summarize prepare upserted private",
+                       defaults=(None, ()))
+
+TABLES = {
+    "users": BulkTable(models.User, schemas.UserCreate, "user_id", None, None, _hash_user_passwords,
+                       _revoke_user_sessions, ("password",)),
+    "products": BulkTable(models.Product, schemas.ProductImport, "product_id",
+                          summaries.snapshot_product, summaries.products_changed, None),
+    "orders": BulkTable(models.Order, schemas.OrderImport, "id",
+                        summaries.snapshot_order, summaries.orders_changed, None),
+}
+
+
+# ---------- Parsing ----------
+
+def iter_lines(stream):
+    """Turn an async byte stream (``request.stream()``) into text lines.
+
+    Must be consumed from a worker thread, e.g. inside ``run_in_threadpool``.
+    """
+    iterator = stream.__aiter__()
+
+    async def next_chunk():
+        try:
+            return await iterator.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    while (chunk := anyio.from_thread.run(next_chunk)) is not None:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def parse_ndjson(lines):
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield number, None, "Each line must be a JSON object."
+            continue
+        yield number, row, None
+
+
+def parse_csv(lines):
+    reader = csv.DictReader(lines)
+    try:
+        for row in reader:
+            # Empty cells are nulls; the optional fields' defaults are applied by the schema
+            yield reader.line_num, {k: v if v != "" else None for k, v in row.items() if k is not None}, None
+    except csv.Error as e:
+        yield reader.line_num, None, f"Invalid CSV: {e}"
+
+
+PARSERS = {"ndjson": parse_ndjson, "csv": parse_csv}
+
+
+def _validation_message(error: ValidationError):
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors()
+    )
+
+
+# ---------- Import ----------
+
+def _write_batch(db: Session, spec: BulkTable, rows: list, upsert: bool):
+    model, pk = spec.model, spec.pk
+    table = model.__table__
+
+    existing = {}
+    if upsert and spec.summarize:
+        keys = [row[pk] for row in rows if row.get(pk) is not None]
+        if keys:
+            existing = {getattr(obj, pk): obj
+                        for obj in db.scalars(select(model).where(getattr(model, pk).in_(keys)))}
+
+    if model is models.Order:
+        now = datetime.utcnow()
+        for row in rows:
+            if row["order_date"] is None:
+                current = existing.get(row["id"])
+                row["order_date"] = current.order_date if current is not None else now
+
+    first_version = changes.reserve(db, table.name, len(rows))
+    for offset, row in enumerate(rows):
+        row["version"] = first_version + offset
+
+    with_pk = [row for row in rows if row.get(pk) is not None]
+    without_pk = [{k: v for k, v in row.items() if k != pk} for row in rows if row.get(pk) is None]
+    if with_pk and upsert:
+        stmt = upsert_insert(db, table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[pk],
+            set_={name: stmt.excluded[name] for name in with_pk[0] if name != pk},
+        )
+        db.execute(stmt, with_pk)
+    elif with_pk:
+        db.execute(insert(table), with_pk)
+    if without_pk:
+        db.execute(insert(table), without_pk)
+    # Ids written by this batch that had been deleted before are live again
+    changes.clear_tombstones(db, table.name, select(getattr(model, pk)).where(
+        model.version.between(first_version, first_version + len(rows) - 1)))
+
+    if spec.summarize:
+        spec.summarize(db, [
+            (spec.snapshot(existing.get(row.get(pk))), spec.snapshot(SimpleNamespace(**row)))
+            for row in rows
+        ])
+    cache.invalidate(db, table.name)
+    events.publish(db, table.name, "reset", count=len(rows))  # subscribers catch up from the change feed
+
+
+def _record_error(result: dict, line: int, error: str):
+    result["failed"] += 1
+    if len(result["errors"]) < MAX_REPORTED_ERRORS:
+        result["errors"].append({"line": line, "error": error})
+
+
+def _flush(db: Session, spec: BulkTable, batch: list, upsert: bool, result: dict):
+    if spec.prepare:
+        spec.prepare([values for _, values in batch])
+    try:
+        _write_batch(db, spec, [values for _, values in batch], upsert)
+        db.commit()
+        result["written"] += len(batch)
+        _upserted(spec, [values for _, values in batch], upsert)
+        return
+    except SQLAlchemyError:
+        db.rollback()
+
+    # Find the offending rows; the others are still written
+    for line, values in batch:
+        try:
+            _write_batch(db, spec, [values], upsert)
+            db.commit()
+            result["written"] += 1
+            _upserted(spec, [values], upsert)
+        except SQLAlchemyError as e:
+            db.rollback()
+            _record_error(result, line, str(getattr(e, "orig", None) or e))
+
+
+def _upserted(spec: BulkTable, rows: list, upsert: bool):
+    # After the commit: the database session store runs transactions of its own
+    if upsert and spec.upserted:
+        spec.upserted(rows)
+
+
+def import_rows(db: Session, table: str, lines, fmt: str = "ndjson", upsert: bool = False):
+    """Validate and write rows from ``lines``; returns counts and per-row errors."""
+    spec = TABLES[table]
+    result = {"written": 0, "failed": 0, "errors": []}
+    batch = []
+    for line, row, error in PARSERS[fmt](lines):
+        if error is None:
+            try:
+                values = spec.schema(**row).model_dump()
+            except ValidationError as e:
+                error = _validation_message(e)
+        if error is not None:
+            _record_error(result, line, error)
+            continue
+        batch.append((line, values))
+        if len(batch) >= BATCH_SIZE:
+            _flush(db, spec, batch, upsert, result)
+            batch = []
+    if batch:
+        _flush(db, spec, batch, upsert, result)
+    return result
+
+
+# ---------- Export ----------
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def export_rows(table: str, fmt: str = "ndjson"):
+    """Yield the whole table as NDJSON or CSV text chunks, ordered by primary key.
+
+    Uses its own session so the stream outlives the request's dependency scope.
+    """
+    spec = TABLES[table]
+    columns = [column for column in spec.model.__table__.columns if column.name not in spec.private]
+    names = [column.name for column in columns]
+    stmt = (
+        select(*columns)
+        .order_by(getattr(spec.model, spec.pk))
+        .execution_options(yield_per=EXPORT_CHUNK_ROWS)
+    )
+    db = SessionLocal()
+    try:
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(names)
+            for rows in db.execute(stmt).partitions():
+                writer.writerows([_plain(value) for value in row] for row in rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            for rows in db.execute(stmt).partitions():
+                yield "".join(
+                    json.dumps({name: _plain(value) for name, value in zip(names, row)}) + "\n"
+                    for row in rows
+                )
+    finally:
+        db.close()
@@ -0,0 +1,268 @@
+"""Read-through cache for the user, product and order list responses.
+
+Entries are the encoded JSON body of one page plus its ``ETag`` and
+``X-Next-Cursor``, keyed by path and query string. Requests carrying a matching
+``If-None-Match`` get an empty ``304``.
+
+Invalidation works with generation counters instead of deleting keys. Every
+entry key embeds the current generation of two tags:
+
+- ``<table>``, bumped by bulk writes that touch arbitrary rows, and
+- ``<table>=<value>`` for lists filtered on the table's partition column
+  (``users.role``, ``products.category``, ``orders.user_id``), or ``<table>:*``
+  for every other list of the table.
+
+A crud mutation bumps ``<table>:*`` plus the partition tags of the row's old
+and new values, so e.g. changing one user's order leaves the cached order
+lists of all other users valid. Generations are read before the query runs,
+so a page computed while a write commits is stored under a key that is
+already stale. Bumps are staged on the session and applied after commit.
+
+``CACHE_BACKEND`` selects ``memory`` (per process LRU with TTL, the default),
+``redis`` (shared between workers, needs the ``redis`` package and
+``CACHE_REDIS_URL``) or ``off``.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2048"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = "pending_cache_tags"
+
+Entry = namedtuple("Entry", "body etag next_cursor")
+
+
+# ---------- Backends ----------
+
+class MemoryBackend:
+    name = "memory"
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires_at, Entry), least recently used first
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def generations(self, tags):
+        with self._lock:
+            return [self._generations.get(tag, 0) for tag in tags]
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return item[1]
+
+    def set(self, key, entry: Entry):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def size(self):
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Shares entries and generations between worker processes through Redis.
+
+    Redis errors are logged and treated as cache misses.
+    """
+    name = "redis"
+    prefix = "amazon:cache:"
+
+    def __init__(self, url: str = CACHE_REDIS_URL, ttl: float = CACHE_TTL):
+        import redis  # optional dependency, only needed with CACHE_BACKEND=redis
+
+        self.errors = (redis.RedisError,)
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.evictions = None
+
+    def generations(self, tags):
+        try:
+            return [int(v or 0) for v in self.client.mget([f"{self.prefix}gen:{t}" for t in tags])]
+        except self.errors:
+            logger.warning("Reading cache generations failed.", exc_info=True)
+            return None
+
+    def bump(self, tags):
+        try:
+            with self.client.pipeline() as pipe:
+                for tag in tags:
+                    pipe.incr(f"{self.prefix}gen:{tag}")
+                pipe.execute()
+        except self.errors:
+            logger.warning("Invalidating cache tags %s failed.", sorted(tags), exc_info=True)
+
+    def get(self, key):
+        try:
+            raw = self.client.get(self.prefix + key)
+        except self.errors:
+            logger.warning("Cache read failed.", exc_info=True)
+            return None
+        if raw is None:
+            return None
+        header, _, body = raw.partition(b"\n")
+        etag, next_cursor = json.loads(header)
+        return Entry(body, etag, next_cursor)
+
+    def set(self, key, entry: Entry):
+        header = json.dumps([entry.etag, entry.next_cursor]).encode()
+        try:
+            self.client.set(self.prefix + key, header + b"\n" + entry.body, px=int(self.ttl * 1000))
+        except self.errors:
+            logger.warning("Cache write failed.", exc_info=True)
+
+    def size(self):
+        return None
+
+
+def create_backend(name: str = CACHE_BACKEND):
+    if name == "memory":
+        return MemoryBackend()
+    if name == "redis":
+        return RedisBackend()
+    if name == "off":
+        return None
+    raise ValueError(f"Unknown CACHE_BACKEND {name!r}; expected memory, redis or off")
+
+
+# ---------- Invalidation ----------
+
+def _partition_tag(table: str, value):
+    return f"{table}:*" if value is None else f"{table}={value}"
+
+
+def invalidate(db: Session, table: str, *values):
+    """Stage invalidation of ``table``'s lists affected by rows with these partition values.
+
+    Without values every cached list of the table is invalidated. Applied when
+    the session commits; call it before the commit.
+    """
+    if values:
+        tags = {_partition_tag(table, None)}
+        tags.update(_partition_tag(table, v) for v in values if v is not None)
+    else:
+        tags = {table}
+    db.info.setdefault(PENDING_KEY, set()).update(tags)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending(session):
+    tags = session.info.pop(PENDING_KEY, None)
+    if tags:
+        response_cache.invalidated += len(tags)
+        if response_cache.backend is not None:
+            response_cache.backend.bump(tags)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+# ---------- Responses ----------
+
+def _etag(body: bytes):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _etag_matches(request: Request, etag: str):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {c.strip().removeprefix("W/") for c in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+class Lookup:
+    """One cache lookup; ``entry`` is None on a miss, to be filled with ``store``."""
+
+    def __init__(self, cache, request: Request, key, entry):
+        self.cache = cache
+        self.request = request
+        self.key = key
+        self.entry = entry
+
+    def store(self, body: bytes, next_cursor: str | None):
+        self.entry = Entry(body, _etag(body), next_cursor)
+        if self.key is not None:
+            self.cache.backend.set(self.key, self.entry)
+        return self.entry
+
+    def response(self):
+        entry = self.entry
+        headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+        if _etag_matches(self.request, entry.etag):
+            self.cache.stats[self.endpoint, "not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        if entry.next_cursor:
+            headers["X-Next-Cursor"] = entry.next_cursor
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    @property
+    def endpoint(self):
+        route = self.request.scope.get("route")
+        return getattr(route, "name", self.request.url.path)
+
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.stats = Counter()  # (endpoint name, "hits" | "misses" | "not_modified")
+        self.invalidated = 0
+
+    def lookup(self, request: Request, table: str, partition=None):
+        lookup = Lookup(self, request, None, None)
+        generations = self.backend.generations([table, _partition_tag(table, partition)]) if self.backend else None
+        if generations is not None:
+            query = sorted(request.query_params.multi_items())
+            raw_key = json.dumps([request.url.path, query, generations])
+            lookup.key = hashlib.blake2b(raw_key.encode(), digest_size=20).hexdigest()
+            lookup.entry = self.backend.get(lookup.key)
+        self.stats[lookup.endpoint, "hits" if lookup.entry is not None else "misses"] += 1
+        return lookup
+
+    def snapshot(self):
+        endpoints = {}
+        for (endpoint, outcome), count in sorted(self.stats.items()):
+            endpoints.setdefault(endpoint, {"hits": 0, "misses": 0, "not_modified": 0})[outcome] = count
+        return {
+            "backend": self.backend.name if self.backend else "off",
+            "entries": self.backend.size() if self.backend else 0,
+            "evictions": self.backend.evictions if self.backend else 0,
+            "invalidated_tags": self.invalidated,
+            "endpoints": endpoints,
+        }
+
+
+response_cache = ResponseCache(create_backend())
@@ -0,0 +1,230 @@
+"""Change feed for users, products and orders.
+
+Every row carries a ``version`` taken from a per-table counter
+(``change_counters``); each insert or update gets a new, unique version and
+each delete leaves a ``tombstones`` row with one. ``GET /changes/{table}?since=N``
+returns the rows and tombstones with versions above ``N`` in version order,
+plus the version to ask from next time, so a client holding a local copy
+only downloads what changed. ``GET /changes`` returns just the current
+versions, which clients can use as cache keys for anything derived from a
+table.
+
+ORM writes are versioned by the ``before_flush`` hook below. Core statements
+that write these tables must call ``reserve`` (and ``clear_tombstones`` for
+inserts) themselves, as ``app.bulk`` does.
+
+The counter row is updated in the writing transaction and stays locked until
+it commits, so versions become visible in order: a feed reader can never see
+version ``N + 1`` while ``N`` is still uncommitted. Reads are bounded by the
+counter value they start with for the same reason.
+
+Rows written around the app with plain SQL keep version 0 and are missing from
+the feed until ``python -m app.changes stamp`` versions them.
+
+Old tombstones can be dropped with ``python -m app.changes prune --keep N``;
+clients whose ``since`` falls before the pruned range get ``reset: true`` and
+must reload the table.
+"""
+import argparse
+import sys
+
+from sqlalchemy import delete, event, func, select, update
+from sqlalchemy.orm import Session
+from app import models, schemas
+from app.database import upsert_insert
+from app.serialization import columns_for
+
+FEED_PAGE_SIZE = 1000
+MAX_FEED_PAGE_SIZE = 10000
+
+TABLES = {
+    "users": (models.User, models.User.user_id, schemas.User),
+    "products": (models.Product, models.Product.product_id, schemas.Product),
+    "orders": (models.Order, models.Order.id, schemas.Order),
+}
+VERSIONED = {model: name for name, (model, _, _) in TABLES.items()}
+
+Counter = models.ChangeCounter
+Tombstone = models.Tombstone
+
+
+def reserve(db: Session, table: str, count: int) -> int:
+    """Hand out ``count`` consecutive versions for ``table``; returns the first one."""
+    # Core statements go to the session's connection; session.execute would autoflush mid-flush
+    conn = db.connection()
+    stmt = (
+        update(Counter).where(Counter.table_name == table)
+        .values(version=Counter.version + count).returning(Counter.version)
+    )
+    last = conn.execute(stmt).scalar()
+    if last is None:
+        # Tables created outside app.main have no counter row yet
+        conn.execute(upsert_insert(db, Counter.__table__).values(table_name=table).on_conflict_do_nothing())
+        last = conn.execute(stmt).scalar()
+    return last - count + 1
+
+
+def clear_tombstones(db: Session, table: str, row_ids):
+    """Forget deletions of ids that were inserted again; ``row_ids`` is a list or a SELECT of ids."""
+    db.connection().execute(
+        delete(Tombstone).where(Tombstone.table_name == table, Tombstone.row_id.in_(row_ids))
+    )
+
+
+def _write_tombstones(db: Session, entries):
+    stmt = upsert_insert(db, Tombstone.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["table_name", "row_id"], set_={"version": stmt.excluded.version}
+    )
+    db.connection().execute(stmt, entries)
+
+
+@event.listens_for(Session, "before_flush")
+def _assign_versions(session, flush_context, instances):
+    changed, deleted = {}, {}
+    for obj in session.new:
+        if type(obj) in VERSIONED:
+            changed.setdefault(VERSIONED[type(obj)], []).append(obj)
+    for obj in session.dirty:
+        if type(obj) in VERSIONED and session.is_modified(obj, include_collections=False):
+            changed.setdefault(VERSIONED[type(obj)], []).append(obj)
+    for obj in session.deleted:
+        if type(obj) in VERSIONED:
+            deleted.setdefault(VERSIONED[type(obj)], []).append(obj)
+
+    tombstones = []
+    for table in changed.keys() | deleted.keys():
+        objs, gone = changed.get(table, []), deleted.get(table, [])
+        version = reserve(session, table, len(objs) + len(gone))
+        for obj in objs:
+            obj.version = version
+            version += 1
+        pk = TABLES[table][1].key
+        for obj in gone:
+            tombstones.append({"table_name": table, "row_id": getattr(obj, pk), "version": version})
+            version += 1
+    if tombstones:
+        _write_tombstones(session, tombstones)
+
+
+@event.listens_for(Session, "after_flush")
+def _clear_reinserted(session, flush_context):
+    inserted = {}
+    for obj in session.new:
+        if type(obj) in VERSIONED:
+            table = VERSIONED[type(obj)]
+            inserted.setdefault(table, []).append(getattr(obj, TABLES[table][1].key))
+    for table, row_ids in inserted.items():
+        clear_tombstones(session, table, row_ids)
+
+
+def initialize(db: Session):
+    """Create missing counter rows and version rows that were written without one.
+
+    Rows with version 0 (from before the feed existed, or inserted by hand) get
+    ``counter + primary key``, which keeps versions unique per table.
+    """
+    for table, (model, pk_column, _) in TABLES.items():
+        db.execute(upsert_insert(db, Counter.__table__).values(table_name=table).on_conflict_do_nothing())
+        unversioned = db.scalar(select(func.max(pk_column)).where(model.version == 0))
+        if unversioned is not None:
+            base = reserve(db, table, unversioned) - 1
+            db.execute(update(model).where(model.version == 0).values(version=base + pk_column))
+    db.commit()
+
+
+def versions(db: Session) -> dict:
+    """Current version of every table; any write to a table changes its version."""
+    current = dict(db.execute(select(Counter.table_name, Counter.version)).all())
+    db.commit()
+    return {table: current.get(table, 0) for table in TABLES}
+
+
+def feed(db: Session, table: str, since: int = 0, limit: int = FEED_PAGE_SIZE):
+    """Rows changed and ids deleted after version ``since``, oldest change first.
+
+    ``since=0`` is a full load. When ``has_more`` is set, ask again with the
+    returned ``version``.
+    """
+    model, pk_column, schema = TABLES[table]
+    current, pruned = db.execute(
+        select(Counter.version, Counter.pruned_through).where(Counter.table_name == table)
+    ).one_or_none() or (0, 0)
+    result = {"table": table, "since": since, "version": current, "has_more": False,
+              "reset": False, "changes": [], "deleted": []}
+    if 0 < since < pruned:
+        result["reset"] = True
+        db.commit()
+        return result
+
+    window = (model.version > since, model.version <= current)
+    rows = db.execute(
+        select(*columns_for(schema)).where(*window).order_by(model.version).limit(limit + 1)
+    ).all()
+    tombstones = []
+    if since > 0:
+        tombstones = db.execute(
+            select(Tombstone.row_id, Tombstone.version)
+            .where(Tombstone.table_name == table, Tombstone.version > since, Tombstone.version <= current)
+            .order_by(Tombstone.version).limit(limit + 1)
+        ).all()
+    db.commit()
+
+    names = tuple(schema.model_fields)
+    entries = sorted([(row.version, row) for row in rows] + [(t.version, t.row_id) for t in tombstones],
+                     key=lambda entry: entry[0])
+    if len(entries) > limit:
+        entries = entries[:limit]
+        result["has_more"] = True
+        result["version"] = entries[-1][0]
+    for _, entry in entries:
+        if isinstance(entry, int):
+            result["deleted"].append(entry)
+        else:
+            result["changes"].append(dict(zip(names, entry)))
+    return result
+
+
+def prune(db: Session, keep: int):
+    """Drop tombstones older than the last ``keep`` versions of each table."""
+    removed = 0
+    for table in TABLES:
+        current = db.scalar(select(Counter.version).where(Counter.table_name == table)) or 0
+        through = current - keep
+        if through <= 0:
+            continue
+        removed += db.execute(
+            delete(Tombstone).where(Tombstone.table_name == table, Tombstone.version <= through)
+        ).rowcount
+        db.execute(
+            update(Counter).where(Counter.table_name == table, Counter.pruned_through < through)
+            .values(pruned_through=through)
+        )
+    db.commit()
+    return removed
+
+
+def main(argv):
+    from app import migrations
+    from app.database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Maintain the change feed.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    prune_parser = commands.add_parser("prune", help="drop old tombstones")
+    prune_parser.add_argument("--keep", type=int, default=100000, help="versions of history to keep per table")
+    commands.add_parser("stamp", help="version rows written outside the app (version 0)")
+    args = parser.parse_args(argv)
+
+    migrations.upgrade(engine)
+    with SessionLocal() as db:
+        if args.command == "stamp":
+            initialize(db)
+            print("Unversioned rows stamped.")
+            return 0
+        removed = prune(db, args.keep)
+    print(f"Removed {removed} tombstones.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
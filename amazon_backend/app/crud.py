@@ -1,5 +1,101 @@
+from collections import defaultdict
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
-from app import models, schemas
+from app import audit, auth, cache, changes, events, models, schemas, summaries
+from app.pagination import DEFAULT_PAGE_SIZE, keyset_page
+from app.serialization import columns_for
+
+# Sort keys accepted by the list endpoints; each one is backed by an index
+USER_SORTS = {"user_id": models.User.user_id, "email": models.User.email}
+PRODUCT_SORTS = {"product_id": models.Product.product_id, "price": models.Product.price}
+ORDER_SORTS = {"id": models.Order.id, "order_date": models.Order.order_date,
+               "total_amount": models.Order.total_amount}
+
+class VersionConflict(Exception):
+    """The row was changed after the client read the version it sent in ``If-Match``."""
+
+    def __init__(self, table: str, row_id: int, expected: int, current: int):
+        super().__init__(f"{table} {row_id} was changed: it is at version {current}, not {expected}.")
+        self.expected = expected
+        self.current = current
+
+def _not_found_or_conflict(db: Session, table: str, row_id: int, expected_version: int | None):
+    # Only runs when the conditional statement matched nothing
+    db.rollback()  # also returns a reserved version
+    if expected_version is None:
+        return
+    model, pk_column, _ = changes.TABLES[table]
+    current = db.scalar(select(model.version).where(pk_column == row_id))
+    db.commit()
+    if current is not None:
+        raise VersionConflict(table, row_id, expected_version, current)
+
+def _patch(db: Session, table: str, row_id: int, fields: dict, tracked: tuple,
+           expected_version: int | None = None):
+    """Apply ``fields`` to one row with a single ``UPDATE ... RETURNING``; returns (old, new) rows.
+
+    ``tracked`` are the columns whose previous values the caller needs (summary
+    and cache partition inputs). They are read only when ``fields`` changes one
+    of them; otherwise ``old`` is None. Both are None when the row does not
+    exist. The UPDATE after such a read also matches the version read, and the
+    two are repeated if the row changed in between: SQLite has no row locks,
+    and summaries fed stale old values would drift. The retry rolls back the
+    whole transaction, so stage audit entries, events and invalidations only
+    once this returns a row.
+
+    With ``expected_version`` every statement also matches the row's version,
+    so a row changed since the client read it is left alone and
+    ``VersionConflict`` is raised. The check costs no extra query on success.
+    """
+    model, pk_column, schema = changes.TABLES[table]
+    match = [pk_column == row_id]
+    if expected_version is not None:
+        match.append(model.version == expected_version)
+    if not fields:
+        new = db.execute(select(*columns_for(schema)).where(*match)).one_or_none()
+        if new is None:
+            _not_found_or_conflict(db, table, row_id, expected_version)
+        return None, new
+    while True:
+        old, guard = None, match
+        if fields.keys() & {column.key for column in tracked}:
+            old = db.execute(select(*tracked, model.version).where(*match).with_for_update()).one_or_none()
+            if old is None:
+                _not_found_or_conflict(db, table, row_id, expected_version)
+                return None, None
+            guard = (pk_column == row_id, model.version == old.version)
+        new = db.execute(
+            update(model).where(*guard)
+            .values(**fields, version=changes.reserve(db, table, 1))
+            .returning(*columns_for(schema))
+            .execution_options(synchronize_session=False)
+        ).one_or_none()
+        if new is not None:
+            return old, new
+        if old is None or expected_version is not None:
+            _not_found_or_conflict(db, table, row_id, expected_version)
+            return None, None
+        db.rollback()  # changed after the read: read it again
+
+def _unchanged(db: Session, row):
+    # An empty PATCH: nothing to log, invalidate or publish, and no version was reserved
+    db.commit()
+    return row._asdict()
+
+def _log_update(db: Session, admin_name: str | None, table: str):
+    # Recorded once _patch has found the row: its retry rolls back whatever was staged before
+    if admin_name is not None:
+        log_admin_activity(db, admin_name, "update", table)
+
+def get_row(db: Session, table: str, row_id: int):
+    """One user, product or order in its response schema; None when it does not exist."""
+    _, pk_column, schema = changes.TABLES[table]
+    row = db.execute(select(*columns_for(schema)).where(pk_column == row_id)).one_or_none()
+    db.commit()
+    return row._asdict() if row is not None else None
 
 # -------------------- USERS -------------------- #
 def create_user(db: Session, user: schemas.UserCreate):
@@ -9,54 +105,161 @@ def create_user(db: Session, user: schemas.UserCreate):
         raise Exception("User ID already exists.")
 
     db_user = models.User(**user.dict())
+    db_user.password = auth.ensure_hashed(db_user.password)
     db.add(db_user)
+    cache.invalidate(db, "users", db_user.role)
+    events.publish(db, "users", "insert", row=db_user)
     db.commit()
-    db.refresh(db_user)
     return db_user
 
 
-def get_users(db: Session):
-    return db.query(models.User).all()
+def filter_users(role: str | None = None):
+    stmt = select(models.User)
+    if role is not None:
+        stmt = stmt.where(models.User.role == role)
+    return stmt
 
-def update_user(db: Session, user_id: int, user: schemas.UserCreate):
-    db_user = db.query(models.User).filter(models.User.user_id == user_id).first()
-    if db_user:
-        for field, value in user.dict().items():
-            setattr(db_user, field, value)
-        db.commit()
-        db.refresh(db_user)
-    return db_user
+def get_users(db: Session, limit: int = DEFAULT_PAGE_SIZE, after: str | None = None,
+              sort: str = "user_id", descending: bool = False, role: str | None = None, columns=None):
+    return keyset_page(db, filter_users(role), sort, USER_SORTS[sort], models.User.user_id,
+                       limit, after, descending, columns)
+
+def _update_user(db: Session, user_id: int, fields: dict, expected_version: int | None,
+                 admin_name: str | None, revoke_sessions: bool):
+    if "password" in fields:
+        fields["password"] = auth.ensure_hashed(fields["password"])
+    # The old role is not read back: a role change invalidates the lists of every role instead
+    _, new = _patch(db, "users", user_id, fields, (), expected_version)
+    if new is None:
+        return None
+    if not fields:
+        return _unchanged(db, new)
+    _log_update(db, admin_name, "users")
+    roles = models.User.role.type.enums if "role" in fields else (new.role,)
+    cache.invalidate(db, "users", *roles)
+    events.publish(db, "users", "update", row=new)
+    db.commit()
+    if revoke_sessions:
+        auth.sessions.revoke_user(user_id)
+    return new._asdict()
+
+# revoke_sessions=False leaves ending the user's login sessions to the caller, which
+# app.async_crud does from a worker thread: the database session store blocks
+
+def update_user(db: Session, user_id: int, user: schemas.UserCreate, expected_version: int | None = None,
+                admin_name: str | None = None, revoke_sessions: bool = True):
+    # Replaces every field but the id, which the path decides
+    return _update_user(db, user_id, user.model_dump(exclude={"user_id"}), expected_version, admin_name,
+                        revoke_sessions)
+
+def patch_user(db: Session, user_id: int, user: schemas.UserUpdate, expected_version: int | None = None,
+               admin_name: str | None = None, revoke_sessions: bool = True):
+    return _update_user(db, user_id, user.model_dump(exclude_unset=True), expected_version, admin_name,
+                        revoke_sessions)
 
-def delete_user(db: Session, user_id: int):
+def _detach_orders(db: Session, user_id: int):
+    # Deleting a user nulls the user_id of their orders. Do it here, versioned and summarized
+    # like any order update, instead of leaving it to the relationship during the flush.
+    Order = models.Order
+    rows = db.execute(
+        select(Order.id, Order.user_id, Order.order_date, Order.status, Order.total_amount)
+        .where(Order.user_id == user_id).order_by(Order.id)
+    ).all()
+    if not rows:
+        return
+    version = changes.reserve(db, "orders", len(rows))
+    db.execute(update(Order), [{"id": row.id, "user_id": None, "version": version + offset}
+                               for offset, row in enumerate(rows)])
+    summaries.orders_changed(db, [
+        (summaries.snapshot_order(row), summaries.snapshot_order(SimpleNamespace(
+            user_id=None, order_date=row.order_date, status=row.status, total_amount=row.total_amount)))
+        for row in rows
+    ])
+    cache.invalidate(db, "orders", user_id)
+    for offset, row in enumerate(rows):
+        events.publish(db, "orders", "update", row={**row._asdict(), "user_id": None, "version": version + offset})
+
+def delete_user(db: Session, user_id: int, revoke_sessions: bool = True):
     db_user = db.query(models.User).filter(models.User.user_id == user_id).first()
     if db_user:
+        _detach_orders(db, user_id)
         db.delete(db_user)
+        cache.invalidate(db, "users", db_user.role)
+        events.publish(db, "users", "delete", user_id)
         db.commit()
+        if revoke_sessions:
+            auth.sessions.revoke_user(user_id)
     return {"deleted": True}
 
+def get_user_by_email(db: Session, email: str):
+    # users.email is unique, so this is a single index lookup
+    db_user = db.scalars(select(models.User).where(models.User.email == email)).first()
+    db.commit()
+    return db_user
+
+def set_user_password(db: Session, user_id: int, password_hash: str):
+    db.execute(update(models.User).where(models.User.user_id == user_id).values(password=password_hash))
+    db.commit()
+
 # -------------------- PRODUCTS -------------------- #
 def create_product(db: Session, product: schemas.ProductCreate):
     db_product = models.Product(**product.dict())
     db.add(db_product)
+    summaries.product_changed(db, None, summaries.snapshot_product(db_product))
+    cache.invalidate(db, "products", db_product.category)
+    events.publish(db, "products", "insert", row=db_product)
     db.commit()
-    db.refresh(db_product)
     return db_product
 
-def get_products(db: Session):
-    return db.query(models.Product).all()
+def filter_products(category: str | None = None, seller_id: int | None = None,
+                    min_price: float | None = None, max_price: float | None = None):
+    stmt = select(models.Product)
+    if category is not None:
+        stmt = stmt.where(models.Product.category == category)
+    if seller_id is not None:
+        stmt = stmt.where(models.Product.seller_id == seller_id)
+    if min_price is not None:
+        stmt = stmt.where(models.Product.price >= min_price)
+    if max_price is not None:
+        stmt = stmt.where(models.Product.price <= max_price)
+    return stmt
 
-def update_product(db: Session, product_id: int, product: schemas.ProductCreate):
-    db_product = db.query(models.Product).filter(models.Product.product_id == product_id).first()
-    if db_product:
-        for field, value in product.dict().items():
-            setattr(db_product, field, value)
-        db.commit()
-        db.refresh(db_product)
-    return db_product
+def get_products(db: Session, limit: int = DEFAULT_PAGE_SIZE, after: str | None = None,
+                 sort: str = "product_id", descending: bool = False, columns=None, **filters):
+    return keyset_page(db, filter_products(**filters), sort, PRODUCT_SORTS[sort],
+                       models.Product.product_id, limit, after, descending, columns)
+
+def _update_product(db: Session, product_id: int, fields: dict, expected_version: int | None,
+                    admin_name: str | None):
+    Product = models.Product
+    old, new = _patch(db, "products", product_id, fields, (Product.category, Product.stock, Product.price),
+                      expected_version)
+    if new is None:
+        return None
+    if not fields:
+        return _unchanged(db, new)
+    _log_update(db, admin_name, "products")
+    if old is not None:
+        summaries.product_changed(db, summaries.snapshot_product(old), summaries.snapshot_product(new))
+    cache.invalidate(db, "products", old.category if old else new.category, new.category)
+    events.publish(db, "products", "update", row=new)
+    db.commit()
+    return new._asdict()
+
+def update_product(db: Session, product_id: int, product: schemas.ProductCreate,
+                   expected_version: int | None = None, admin_name: str | None = None):
+    return _update_product(db, product_id, product.model_dump(), expected_version, admin_name)
+
+def patch_product(db: Session, product_id: int, product: schemas.ProductUpdate,
+                  expected_version: int | None = None, admin_name: str | None = None):
+    return _update_product(db, product_id, product.model_dump(exclude_unset=True), expected_version, admin_name)
 
 def delete_product(db: Session, product_id: int):
     db_product = db.query(models.Product).filter(models.Product.product_id == product_id).first()
     if db_product:
+        summaries.product_changed(db, summaries.snapshot_product(db_product), None)
+        cache.invalidate(db, "products", db_product.category)
+        events.publish(db, "products", "delete", product_id)
         db.delete(db_product)
         db.commit()
     return {"deleted": True}
@@ -65,43 +268,215 @@ def delete_product(db: Session, product_id: int):
 def create_order(db: Session, order: schemas.OrderCreate):
     db_order = models.Order(**order.dict())
     db.add(db_order)
+    db.flush()  # applies the order_date default
+    summaries.order_changed(db, None, summaries.snapshot_order(db_order))
+    cache.invalidate(db, "orders", db_order.user_id)
+    events.publish(db, "orders", "insert", row=db_order)
     db.commit()
-    db.refresh(db_order)
     return db_order
 
-def get_orders(db: Session):
-    return db.query(models.Order).all()
+def filter_orders(status: str | None = None, user_id: int | None = None,
+                  date_from: datetime | None = None, date_to: datetime | None = None,
+                  min_amount: float | None = None, max_amount: float | None = None):
+    stmt = select(models.Order)
+    if status is not None:
+        stmt = stmt.where(models.Order.status == status)
+    if user_id is not None:
+        stmt = stmt.where(models.Order.user_id == user_id)
+    if date_from is not None:
+        stmt = stmt.where(models.Order.order_date >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(models.Order.order_date < date_to)
+    if min_amount is not None:
+        stmt = stmt.where(models.Order.total_amount >= min_amount)
+    if max_amount is not None:
+        stmt = stmt.where(models.Order.total_amount <= max_amount)
+    return stmt
 
-def get_orders_by_user(db: Session, user_id: int):
-    return db.query(models.Order).filter(models.Order.user_id == user_id).all()
+def get_orders(db: Session, limit: int = DEFAULT_PAGE_SIZE, after: str | None = None,
+               sort: str = "id", descending: bool = False, columns=None, **filters):
+    return keyset_page(db, filter_orders(**filters), sort, ORDER_SORTS[sort], models.Order.id,
+                       limit, after, descending, columns)
 
-def update_order(db: Session, order_id: int, order: schemas.OrderCreate):
-    db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if db_order:
-        for field, value in order.dict().items():
-            setattr(db_order, field, value)
+def get_orders_by_user(db: Session, user_id: int, **page):
+    return get_orders(db, user_id=user_id, **page)
+
+def _update_order(db: Session, order_id: int, fields: dict, expected_version: int | None,
+                  admin_name: str | None):
+    Order = models.Order
+    old, new = _patch(db, "orders", order_id, fields,
+                      (Order.user_id, Order.order_date, Order.status, Order.total_amount), expected_version)
+    if new is None:
+        return None
+    if not fields:
+        return _unchanged(db, new)
+    _log_update(db, admin_name, "orders")
+    if old is not None:
+        summaries.order_changed(db, summaries.snapshot_order(old), summaries.snapshot_order(new))
+    cache.invalidate(db, "orders", old.user_id if old else new.user_id, new.user_id)
+    events.publish(db, "orders", "update", row=new)
+    db.commit()
+    return new._asdict()
+
+def update_order(db: Session, order_id: int, order: schemas.OrderCreate, expected_version: int | None = None,
+                 admin_name: str | None = None):
+    return _update_order(db, order_id, order.model_dump(), expected_version, admin_name)
+
+def patch_order(db: Session, order_id: int, order: schemas.OrderUpdate, expected_version: int | None = None,
+                admin_name: str | None = None):
+    return _update_order(db, order_id, order.model_dump(exclude_unset=True), expected_version, admin_name)
+
+def transition_orders(db: Session, transition: schemas.OrderStatusTransition, admin_name: str):
+    """Move the selected orders to ``transition.status`` in one transaction.
+
+    Orders already in that status are left alone. Records one audit entry that
+    summarizes the change instead of one per order, so call this instead of
+    ``log_admin_activity`` beforehand.
+    """
+    Order = models.Order
+    if transition.ids is not None:
+        selection = select(Order).where(Order.id.in_(transition.ids))
+        selected = f"{len(transition.ids)} ids"
+    else:
+        criteria = transition.filter.model_dump(exclude_none=True)
+        selection = filter_orders(**criteria)
+        selected = "filter " + ", ".join(f"{name}={value}" for name, value in criteria.items())
+    rows = db.execute(
+        selection.with_only_columns(Order.id, Order.user_id, Order.order_date, Order.status, Order.total_amount)
+        .where(Order.status != transition.status).order_by(Order.id).with_for_update()
+    ).all()
+    if not rows:
         db.commit()
-        db.refresh(db_order)
-    return db_order
+        return {"status": transition.status, "updated": 0}
+
+    version = changes.reserve(db, "orders", len(rows))
+    # ORM bulk UPDATE by primary key: one statement executed with every parameter set
+    db.execute(update(Order), [{"id": row.id, "status": transition.status, "version": version + offset}
+                               for offset, row in enumerate(rows)])
+    summaries.orders_changed(db, [
+        (summaries.snapshot_order(row), summaries.snapshot_order(SimpleNamespace(
+            user_id=row.user_id, order_date=row.order_date, status=transition.status,
+            total_amount=row.total_amount)))
+        for row in rows
+    ])
+    cache.invalidate(db, "orders")
+    for offset, row in enumerate(rows):
+        events.publish(db, "orders", "update", row={
+            **row._asdict(), "status": transition.status, "version": version + offset})
+    previous = defaultdict(int)
+    for row in rows:
+        previous[row.status] += 1
+    details = (f"{len(rows)} orders -> {transition.status} (" +
+               ", ".join(f"{count} {status}" for status, count in sorted(previous.items())) +
+               f"; selected by {selected})")
+    log_admin_activity(db, admin_name, "bulk_status", "orders", details)
+    db.commit()
+    return {"status": transition.status, "updated": len(rows)}
 
 def delete_order(db: Session, order_id: int):
     db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
     if db_order:
+        summaries.order_changed(db, summaries.snapshot_order(db_order), None)
+        cache.invalidate(db, "orders", db_order.user_id)
+        events.publish(db, "orders", "delete", order_id)
         db.delete(db_order)
         db.commit()
     return {"deleted": True}
 
-def log_admin_activity(db: Session, admin_name: str, action: str, target_table: str):
-    from app.models import AdminActivityLog
-    log = AdminActivityLog(
-        admin_name=admin_name,
-        action=action,
-        target_table=target_table
+class ProductNotFound(LookupError):
+    pass
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id: int, requested: int, available: int):
+        super().__init__(f"Product {product_id} has {available} in stock, {requested} requested.")
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+
+def checkout(db: Session, request: schemas.CheckoutRequest):
+    """Place an order for several products and take their stock in one transaction.
+
+    Stock is decremented with one conditional ``UPDATE ... WHERE stock >= qty``
+    per product instead of read-modify-write, so concurrent checkouts can never
+    oversell; when any line cannot be served, nothing is reserved. Products are
+    updated in id order so that concurrent checkouts lock rows in the same order.
+    """
+    quantities = defaultdict(int)
+    for line in request.items:
+        quantities[line.product_id] += line.quantity
+
+    Product = models.Product
+    reserved = []
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        row = db.execute(
+            update(Product)
+            .where(Product.product_id == product_id, Product.stock >= quantity)
+            .values(stock=Product.stock - quantity)
+            .returning(*columns_for(schemas.Product))
+            .execution_options(synchronize_session=False)
+        ).one_or_none()
+        if row is None:
+            db.rollback()
+            available = db.scalar(select(Product.stock).where(Product.product_id == product_id))
+            db.commit()
+            if available is None:
+                raise ProductNotFound(f"Product {product_id} does not exist.")
+            raise InsufficientStock(product_id, quantity, available)
+        reserved.append((product_id, quantity, row))
+
+    db_order = models.Order(
+        user_id=request.user_id,
+        status=request.status,
+        total_amount=round(sum(float(row.price) * quantity for _, quantity, row in reserved), 2),
+        items=[models.OrderItem(product_id=product_id, quantity=quantity, unit_price=float(row.price))
+               for product_id, quantity, row in reserved],
     )
-    db.add(log)
+    db.add(db_order)
+
+    # The stock UPDATEs bypass the flush hook of app.changes; version the products here,
+    # late in the transaction so the counter row is locked as briefly as possible
+    version = changes.reserve(db, "products", len(reserved))
+    db.execute(update(Product), [{"product_id": product_id, "version": version + offset}
+                                 for offset, (product_id, _, _) in enumerate(reserved)])
+    db.flush()  # order id, date and version
+
+    summaries.products_changed(db, [
+        (summaries.snapshot_product(SimpleNamespace(category=row.category, stock=row.stock + quantity, price=row.price)),
+         summaries.snapshot_product(row))
+        for _, quantity, row in reserved
+    ])
+    summaries.order_changed(db, None, summaries.snapshot_order(db_order))
+    cache.invalidate(db, "products", *{row.category for _, _, row in reserved})
+    cache.invalidate(db, "orders", db_order.user_id)
+    for offset, (_, _, row) in enumerate(reserved):
+        events.publish(db, "products", "update", row={**row._asdict(), "version": version + offset})
+    events.publish(db, "orders", "insert", row=db_order)
     db.commit()
-    db.refresh(log)
-    return log
+    return db_order
+
+def log_admin_activity(db: Session, admin_name: str, action: str, target_table: str,
+                       details: str | None = None):
+    # Must run before the mutation commits; see app.audit
+    audit.record(db, admin_name, action, target_table, details)
+
+def filter_admin_logs(admin_name: str | None = None, action: str | None = None,
+                      target_table: str | None = None, time_from: datetime | None = None,
+                      time_to: datetime | None = None):
+    stmt = select(models.AdminActivityLog)
+    if admin_name is not None:
+        stmt = stmt.where(models.AdminActivityLog.admin_name == admin_name)
+    if action is not None:
+        stmt = stmt.where(models.AdminActivityLog.action == action)
+    if target_table is not None:
+        stmt = stmt.where(models.AdminActivityLog.target_table == target_table)
+    if time_from is not None:
+        stmt = stmt.where(models.AdminActivityLog.timestamp >= time_from)
+    if time_to is not None:
+        stmt = stmt.where(models.AdminActivityLog.timestamp < time_to)
+    return stmt
 
-def get_admin_logs(db: Session):
-    return db.query(models.AdminActivityLog).order_by(models.AdminActivityLog.timestamp.desc()).all()
+def get_admin_logs(db: Session, limit: int = DEFAULT_PAGE_SIZE, after: str | None = None,
+                   descending: bool = True, columns=None, **filters):
+    return keyset_page(db, filter_admin_logs(**filters), "timestamp", models.AdminActivityLog.timestamp,
+                       models.AdminActivityLog.id, limit, after, descending, columns)
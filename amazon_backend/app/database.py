@@ -1,11 +1,111 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from app.metrics import TimedQueuePool
+
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./amazon.db")
+DB_PROFILE = os.getenv("DB_PROFILE", "wal")
+
+# PRAGMAs applied to every new SQLite connection, per profile.
+#   legacy: SQLite defaults (rollback journal, synchronous=FULL)
+#   wal:    readers never block the writer and commits skip the per-transaction fsync
+#   bulk:   for one-off loads into a scratch database; unsafe on power loss
+SQLITE_PROFILES = {
+    "legacy": {},
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -64000,  # KiB, i.e. 64 MB per connection
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+    "bulk": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "busy_timeout": 30000,
+        "cache_size": -256000,
+        "mmap_size": 1073741824,
+        "temp_store": "MEMORY",
+    },
+}
+
+# Individual PRAGMAs can be overridden on top of the profile
+SQLITE_PRAGMA_ENV = {
+    "journal_mode": "DB_SQLITE_JOURNAL_MODE",
+    "synchronous": "DB_SQLITE_SYNCHRONOUS",
+    "busy_timeout": "DB_SQLITE_BUSY_TIMEOUT",
+    "cache_size": "DB_SQLITE_CACHE_SIZE",
+    "mmap_size": "DB_SQLITE_MMAP_SIZE",
+    "temp_store": "DB_SQLITE_TEMP_STORE",
+}
+
+
+def sqlite_pragmas(profile: str = DB_PROFILE):
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {profile!r}; expected one of {sorted(SQLITE_PROFILES)}")
+    pragmas = dict(SQLITE_PROFILES[profile])
+    for name, variable in SQLITE_PRAGMA_ENV.items():
+        if os.getenv(variable):
+            pragmas[name] = os.environ[variable]
+    return pragmas
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas: dict):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def engine_options(url: str):
+    options = {
+        "poolclass": TimedQueuePool,  # reports checkout waits to /metrics
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+    }
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+        if ":memory:" in url or url.rstrip("/") == "sqlite:":
+            # Pool sizing does not apply to the single-connection in-memory pool
+            options = {"connect_args": options["connect_args"]}
+    else:
+        options["pool_pre_ping"] = True
+        options["pool_recycle"] = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    return options
+
+
+def create_db_engine(url: str = SQLALCHEMY_DATABASE_URL, profile: str = DB_PROFILE):
+    db_engine = create_engine(url, **engine_options(url))
+    if db_engine.dialect.name == "sqlite":
+        pragmas = sqlite_pragmas(profile)
+
+        @event.listens_for(db_engine, "connect")
+        def on_connect(dbapi_connection, connection_record):
+            apply_sqlite_pragmas(dbapi_connection, pragmas)
+
+    return db_engine
+
+
+engine = create_db_engine()
+# A forked worker (e.g. gunicorn --preload) must not reuse the parent's pooled
+# connections; it starts with an empty pool and leaves the parent's alone
+os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+# Crud functions end their transaction before returning (reads included), which
+# hands the connection back to the pool before a sync endpoint's response is
+# serialized on the threadpool. Holding it through serialization deadlocks the
+# pool once concurrent requests exceed threadpool size plus pool size. Committing
+# without expiring keeps the loaded objects usable for serialization.
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+Base = declarative_base()
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./amazon.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+def upsert_insert(db, table):
+    """INSERT construct for the session's dialect that supports ``on_conflict_do_update``."""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
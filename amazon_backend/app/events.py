@@ -0,0 +1,364 @@
+"""In-process pub/sub of data changes, streamed to dashboards as server-sent events.
+
+The crud mutators, the bulk importer and the audit log call ``publish`` inside
+their transaction; like cache invalidations, the events are staged on the
+session and handed to the broker only once it commits (and dropped on
+rollback), so subscribers never hear about changes they cannot read yet.
+
+``GET /events`` subscribes a client. Each subscriber has a buffer of at most
+``EVENTS_BUFFER_SIZE`` pending events, coalesced by row: a row updated ten
+times before the client is written to again is sent once, with its latest
+values, and a row inserted and deleted in between is not sent at all. When a
+subscriber falls so far behind that its buffer is full, the pending events of
+the table being written are replaced by a single ``reset`` event for it and
+further events of that table are dropped until the reset is sent. Publishers
+never wait for subscribers; a slow dashboard only costs itself detail.
+
+Events carry ``table``, ``action`` (``insert``, ``update``, ``delete`` or
+``reset``), and, for users, products and orders, the row ``id``, its change
+feed ``version`` and the ``row`` in its response schema (not for deletes).
+Admin log entries arrive as ``insert`` events of ``admin_logs``. On ``reset``
+a client catches up with ``GET /changes/{table}?since=<last version seen>``
+(or reloads the admin logs). Bulk imports and transactions with more changes
+than a buffer holds publish a ``reset`` right away. A client is written to at
+most once per ``EVENTS_FLUSH_INTERVAL``, with everything pending.
+
+The broker lives in one process. With ``EVENTS_RELAY=database`` (the default
+of ``app.serve`` with several workers) each write transaction also stores its
+events as one row of ``change_events``. The row's position comes from
+``change_counters`` like a row version, so positions become visible in commit
+order. Every worker's ``relay`` polls that table each
+``EVENTS_RELAY_INTERVAL`` seconds and hands the new events to its
+subscribers, its own included: delivering those right away would let an
+older change from another worker arrive after a newer local one. Rows older
+than ``EVENTS_RELAY_RETENTION`` seconds are deleted. With the relay off,
+subscribers only see the changes made by the process serving them.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.orm import Session
+from app import changes, metrics, models, schemas
+from app.database import SessionLocal
+from app.serialization import dumps
+
+EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", "1000"))
+EVENTS_FLUSH_INTERVAL = float(os.getenv("EVENTS_FLUSH_INTERVAL", "0.25"))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+EVENTS_MAX_SUBSCRIBERS = int(os.getenv("EVENTS_MAX_SUBSCRIBERS", "1000"))
+EVENTS_RELAY = os.getenv("EVENTS_RELAY", "off")  # "database": share events between worker processes
+EVENTS_RELAY_INTERVAL = float(os.getenv("EVENTS_RELAY_INTERVAL", "0.5"))
+EVENTS_RELAY_RETENTION = float(os.getenv("EVENTS_RELAY_RETENTION", "300"))
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = "pending_change_events"
+RELAY_COUNTER = "change_events"  # change_counters row handing out relay positions
+RELAY_BATCH = 1000
+
+SCHEMAS = {name: schema for name, (_, _, schema) in changes.TABLES.items()}
+SCHEMAS["admin_logs"] = schemas.AdminActivityLog
+TABLES = tuple(SCHEMAS)
+
+_sequence = itertools.count()  # keys for events that do not name a row
+
+
+# -------------------- Publishing -------------------- #
+
+def publish(db: Session, table: str, action: str, row_id=None, row=None, count: int = 1):
+    """Send a change to subscribers once ``db`` commits.
+
+    ``row`` is an ORM object, a mapping or a ``Row`` with the table's response
+    fields; it is read after the commit, so ORM defaults and versions are set.
+    A ``reset`` with ``count`` stands for that many changes not listed.
+    """
+    db.info.setdefault(PENDING_KEY, []).append((table, action, row_id, row, count))
+
+
+def _as_dict(table: str, row):
+    if row is None or isinstance(row, dict):
+        return row
+    if hasattr(row, "_asdict"):
+        return row._asdict()
+    return {name: getattr(row, name) for name in SCHEMAS[table].model_fields}
+
+
+def _build(pending):
+    counts = {}
+    for table, _, _, _, count in pending:
+        counts[table] = counts.get(table, 0) + count
+    events, reset = [], set()
+    for table, action, row_id, row, count in pending:
+        if counts[table] > EVENTS_BUFFER_SIZE or action == "reset":
+            # More than any subscriber could buffer: one reset instead of building every row
+            if table not in reset:
+                reset.add(table)
+                events.append({"table": table, "action": "reset", "count": counts[table]})
+            continue
+        body = {"table": table, "action": action}
+        row = _as_dict(table, row)
+        if table in changes.TABLES:
+            _, pk_column, _ = changes.TABLES[table]
+            body["id"] = row_id if row_id is not None else row[pk_column.key]
+            if row is not None:
+                body["version"] = row["version"]
+        if row is not None and action != "delete":
+            body["row"] = row
+        events.append(body)
+    return events
+
+
+@event.listens_for(Session, "before_commit")
+def _store_pending(session):
+    if EVENTS_RELAY != "database" or not session.info.get(PENDING_KEY):
+        return
+    session.flush()  # sets the versions and ids the events carry
+    relay.store(session, _build(session.info.pop(PENDING_KEY)))  # delivered by the relay
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending and broker.subscribers:
+        broker.publish(_build(pending))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+# -------------------- Subscribers -------------------- #
+
+def _key(body):
+    if body["action"] == "reset":
+        return body["table"], "reset"
+    if "id" in body:
+        return body["table"], body["id"]
+    return body["table"], next(_sequence)
+
+
+def _merge(previous, body):
+    """Coalesce two events of one row; None when they cancel out."""
+    if previous["action"] == "reset":
+        return {**body, "count": previous["count"] + body["count"]}
+    if previous["action"] == "insert":
+        if body["action"] == "delete":
+            return None
+        if body["action"] == "update":
+            return {**body, "action": "insert"}
+    return body
+
+
+class Subscriber:
+    """Buffers events for one client; filled from any thread, drained by its event loop."""
+
+    def __init__(self, loop, tables, buffer_size=EVENTS_BUFFER_SIZE):
+        self.loop = loop
+        self.tables = frozenset(tables)
+        self.buffer_size = buffer_size
+        self.pending = OrderedDict()
+        self.resetting = set()
+        self.ready = asyncio.Event()
+        self.overflows = 0
+        self._lock = threading.Lock()
+        self._woken = False
+
+    def offer(self, events) -> bool:
+        """Buffer ``events``; False once the subscriber's event loop is gone."""
+        with self._lock:
+            for body in events:
+                table = body["table"]
+                if table not in self.tables:
+                    continue
+                if table in self.resetting:
+                    self.pending[(table, "reset")]["count"] += body.get("count", 1)
+                    continue
+                key = _key(body)
+                if key in self.pending:
+                    merged = _merge(self.pending.pop(key), body)
+                    if merged is not None:
+                        self.pending[key] = merged
+                elif len(self.pending) < self.buffer_size:
+                    self.pending[key] = body
+                else:
+                    self._overflow(table, body.get("count", 1))
+            if self.pending and not self._woken:
+                try:
+                    self.loop.call_soon_threadsafe(self.ready.set)
+                except RuntimeError:  # loop closed without the stream's cleanup running
+                    return False
+                self._woken = True
+        return True
+
+    def _overflow(self, table, count):
+        dropped = [key for key in self.pending if key[0] == table]
+        for key in dropped:
+            del self.pending[key]
+        self.pending[(table, "reset")] = {"table": table, "action": "reset", "count": len(dropped) + count}
+        self.resetting.add(table)
+        self.overflows += 1
+        OVERFLOWS.inc(table)
+
+    def drain(self):
+        with self._lock:
+            events = list(self.pending.values())
+            self.pending.clear()
+            self.resetting.clear()
+            self.ready.clear()
+            self._woken = False
+        return events
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Broker:
+    def __init__(self, max_subscribers=EVENTS_MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self.subscribers = ()  # replaced, never mutated, so publishers can iterate without the lock
+        self._lock = threading.Lock()
+
+    def subscribe(self, tables=TABLES) -> Subscriber:
+        """Register a subscriber drained by the running event loop."""
+        subscriber = Subscriber(asyncio.get_running_loop(), tables)
+        with self._lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                raise TooManySubscribers(f"{len(self.subscribers)} event streams are open already.")
+            self.subscribers = self.subscribers + (subscriber,)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self.subscribers = tuple(s for s in self.subscribers if s is not subscriber)
+
+    def publish(self, events):
+        for table in {body["table"] for body in events}:
+            PUBLISHED.inc(table, amount=sum(body["table"] == table for body in events))
+        for subscriber in self.subscribers:
+            if not subscriber.offer(events):
+                self.unsubscribe(subscriber)
+
+
+broker = Broker()
+
+
+# -------------------- Relay between worker processes -------------------- #
+
+class Relay:
+    """Stores each transaction's events in ``change_events`` and delivers them in position order."""
+
+    def __init__(self, session_factory=SessionLocal, interval=EVENTS_RELAY_INTERVAL,
+                 retention=EVENTS_RELAY_RETENTION):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.retention = retention
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def store(self, db: Session, events):
+        position = changes.reserve(db, RELAY_COUNTER, 1)
+        db.connection().execute(insert(models.ChangeEvent).values(
+            position=position, created_at=datetime.utcnow(),
+            payload=dumps(events).decode()))
+
+    def start(self):
+        """Start polling; a no-op unless ``EVENTS_RELAY=database``."""
+        if EVENTS_RELAY != "database" or self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="change-event-relay", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        last, next_prune = None, time.monotonic()
+        while not self._stop.wait(self.interval):
+            try:
+                last = self.poll(last)
+                if time.monotonic() >= next_prune:
+                    self.prune()
+                    next_prune = time.monotonic() + self.retention / 10
+            except Exception:
+                logger.exception("Relaying change events failed.")
+
+    def poll(self, last):
+        """Deliver events stored after position ``last``; returns the position reached."""
+        Event = models.ChangeEvent
+        with self.session_factory() as db:
+            if last is None or not broker.subscribers:
+                # Nobody listens: skip ahead instead of replaying events to later subscribers
+                last = db.scalar(select(func.coalesce(func.max(Event.position), 0)))
+                db.commit()
+                return last
+            rows = db.execute(
+                select(Event.position, Event.payload)
+                .where(Event.position > last).order_by(Event.position).limit(RELAY_BATCH)
+            ).all()
+            db.commit()
+        for row in rows:
+            events = json.loads(row.payload)
+            RELAYED.inc(amount=len(events))
+            broker.publish(events)
+        return rows[-1].position if rows else last
+
+    def prune(self):
+        Event = models.ChangeEvent
+        with self.session_factory() as db:
+            db.execute(delete(Event).where(Event.created_at < datetime.utcnow() - timedelta(seconds=self.retention)))
+            db.commit()
+
+
+relay = Relay()
+
+PUBLISHED = metrics.Counter("change_events_published_total", "Change events handed to subscribers.", ("table",))
+OVERFLOWS = metrics.Counter("change_event_overflows_total",
+                            "Subscriber buffers that overflowed and were reset.", ("table",))
+SUBSCRIBERS = metrics.Gauge("change_event_subscribers", "Open event streams.", (),
+                            lambda: {(): len(broker.subscribers)})
+RELAYED = metrics.Counter("change_events_relayed_total", "Change events read back from change_events.")
+metrics.REGISTRY += [PUBLISHED, OVERFLOWS, SUBSCRIBERS, RELAYED]
+
+
+# -------------------- Server-sent events -------------------- #
+
+def _sse(name, data: bytes) -> bytes:
+    return b"event: " + name.encode() + b"\ndata: " + data + b"\n\n"
+
+
+async def stream(subscriber: Subscriber, hello: dict, dumps):
+    """Yield the SSE body for ``subscriber``; unsubscribes when the client goes away."""
+    try:
+        yield f"retry: {int(EVENTS_HEARTBEAT * 1000)}\n\n".encode() + _sse("ready", dumps(hello))
+        while True:
+            try:
+                await asyncio.wait_for(subscriber.ready.wait(), EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            # Let a burst of commits pile up (and coalesce) before writing
+            await asyncio.sleep(EVENTS_FLUSH_INTERVAL)
+            events = subscriber.drain()
+            if events:
+                yield b"".join(_sse(body["action"], dumps(body)) for body in events)
+    finally:
+        broker.unsubscribe(subscriber)
@@ -0,0 +1,430 @@
+"""Synthetic data for load testing: users, sellers, products and orders with their lines.
+
+    python -m app.generate --users 200000 --products 500000 --orders 5000000
+
+Rows are appended after the highest existing ids of the database given by
+DATABASE_URL, so point it at a scratch file to start from nothing. The same
+``--seed`` and sizes always produce the same rows, whatever ``--workers`` is
+(only the password salt differs).
+
+What the data looks like:
+
+* the first ``--sellers`` new users are sellers and the rest customers. All of
+  them can log in with ``--password``, which is hashed once and shared.
+* products belong to sellers and customers place orders with Zipf-like skew
+  (``--skew``; 0 is uniform), so a few sellers and customers account for much
+  of the volume. Each order has 1 to ``--max-items`` lines, which favour
+  popular products. Its total is the sum of its lines at the product's price.
+* order dates run from ``--start`` to ``--end``. Volume grows by ``--growth``
+  a year, peaks before Christmas (``--seasonality``, 0 to 1), dips at weekends
+  and follows the hour of the day. Ids increase with the date. Recent orders
+  are still pending or shipped and older ones delivered or cancelled.
+
+Loading is built for speed. Worker processes generate chunks of ``--batch``
+rows as plain tuples while the main process writes the previous chunk. Each
+chunk is one executemany on the DBAPI cursor with the ``bulk`` SQLite
+PRAGMAs. The secondary indexes and the search index triggers are dropped
+first and rebuilt once after the load, followed by the summary tables and
+ANALYZE. ``--keep-indexes`` skips the dropping, which is faster when adding a
+little to a big database. Versions for the change feed are reserved up front,
+so the feed picks up the new rows.
+"""
+import argparse
+import itertools
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.orm import sessionmaker
+from app import auth, changes, migrations, models, search, summaries
+from app.database import SQLALCHEMY_DATABASE_URL, create_db_engine
+
+GENERATE_BATCH_SIZE = 50000
+
+CATEGORIES = {
+    # category: (share of products, median price, product nouns)
+    "electronics": (0.18, 120.0, ["headphones", "charger", "speaker", "camera", "keyboard", "monitor", "router"]),
+    "books": (0.16, 15.0, ["novel", "cookbook", "biography", "atlas", "textbook", "comic", "journal"]),
+    "clothing": (0.15, 35.0, ["jacket", "t-shirt", "jeans", "sweater", "dress", "scarf", "hoodie"]),
+    "home": (0.12, 45.0, ["lamp", "rug", "pillow", "curtain", "mirror", "clock", "vase"]),
+    "kitchen": (0.10, 30.0, ["kettle", "blender", "pan", "knife set", "mug", "toaster", "grater"]),
+    "toys": (0.08, 25.0, ["puzzle", "doll", "robot", "board game", "kite", "blocks", "train set"]),
+    "sports": (0.08, 40.0, ["yoga mat", "dumbbell", "tent", "bicycle pump", "ball", "backpack", "bottle"]),
+    "beauty": (0.07, 18.0, ["shampoo", "lotion", "perfume", "lipstick", "serum", "brush", "soap"]),
+    "shoes": (0.06, 60.0, ["sneakers", "boots", "sandals", "heels", "slippers", "loafers", "clogs"]),
+}
+ADJECTIVES = ["red", "blue", "black", "wireless", "leather", "organic", "compact", "vintage", "smart",
+              "steel", "wooden", "portable", "classic", "deluxe", "mini", "soft", "waterproof", "silver"]
+DESCRIPTION_WORDS = ["great", "for", "everyday", "use", "with", "warranty", "gift", "durable", "design",
+                     "home", "travel", "office", "kids", "new", "edition", "pack", "premium", "light"]
+FIRST_NAMES = ["James", "Mary", "Ahmed", "Fatima", "Wei", "Mei", "Carlos", "Sofia", "Ivan", "Olga", "Kwame",
+               "Amara", "Hiroshi", "Yuki", "Liam", "Emma", "Ravi", "Priya", "Omar", "Layla", "Noah", "Zara"]
+LAST_NAMES = ["Smith", "Khan", "Li", "Garcia", "Ivanov", "Mensah", "Tanaka", "Brown", "Patel", "Hassan",
+              "Schmidt", "Silva", "Kim", "Nguyen", "Cohen", "Rossi", "Okafor", "Dubois", "Novak", "Haddad"]
+STREETS = ["Main", "Oak", "Pine", "Maple", "Cedar", "Elm", "Lake", "Hill", "Park", "River", "Station"]
+CITIES = ["Springfield", "Riverside", "Fairview", "Lahore", "Karachi", "Austin", "Leeds", "Lyon", "Osaka"]
+
+# Relative order volume by hour of day and by weekday (Monday first)
+HOUR_WEIGHTS = [2, 1, 1, 1, 1, 2, 3, 5, 6, 7, 8, 8, 9, 9, 8, 8, 8, 9, 10, 11, 12, 11, 8, 4]
+MINUTES = [f"{hour:02d}:{minute:02d}" for hour in range(24) for minute in range(60)]  # sort in time order
+MINUTE_WEIGHTS = list(itertools.accumulate(HOUR_WEIGHTS[hour] for hour in range(24) for _ in range(60)))
+SECONDS = [f"{second:02d}.000000" for second in range(60)]
+WEEKDAY_WEIGHTS = [1.05, 1.0, 1.0, 0.98, 0.97, 0.88, 0.92]
+PEAK_DAY_OF_YEAR = 340  # early December
+# Status mix by order age in days: (maximum age, {status: weight})
+STATUS_BY_AGE = [
+    (2, {"pending": 60, "shipped": 35, "cancelled": 5}),
+    (10, {"pending": 5, "shipped": 45, "delivered": 45, "cancelled": 5}),
+    (math.inf, {"delivered": 94, "cancelled": 6}),
+]
+QUANTITY_WEIGHTS = [70, 20, 7, 3]  # 1, 2, 3 or 4 of a product per line
+
+# Columns written per table, in the order the generated tuples hold them
+COLUMNS = {
+    "users": ["user_id", "name", "email", "password", "phone_number", "address", "role", "version"],
+    "products": ["product_id", "seller_id", "name", "description", "price", "stock", "category", "version"],
+    "orders": ["id", "user_id", "total_amount", "status", "order_date", "version"],
+    "order_items": ["order_id", "product_id", "quantity", "unit_price"],
+}
+LOADED_TABLES = [models.User.__table__, models.Product.__table__, models.Order.__table__,
+                 models.OrderItem.__table__]
+
+
+# -------------------- Distributions -------------------- #
+
+def zipf_cumulative(count: int, skew: float):
+    """Cumulative weights for ranks 1..count with weight ``1 / rank ** skew``."""
+    return list(itertools.accumulate(1.0 / rank ** skew for rank in range(1, count + 1)))
+
+
+def ranked_ids(first_id: int, count: int, seed: int, name: str):
+    """Ids in popularity order, shuffled so popular rows are spread over the id range."""
+    ids = list(range(first_id, first_id + count))
+    random.Random(f"{seed}:{name}:ranks").shuffle(ids)
+    return ids
+
+
+def day_weight(day: date, start: date, growth: float, seasonality: float):
+    years = (day - start).days / 365.0
+    season = math.cos(2 * math.pi * (day.timetuple().tm_yday - PEAK_DAY_OF_YEAR) / 365.0)
+    return (1 + growth) ** years * (1 + seasonality * season) * WEEKDAY_WEIGHTS[day.weekday()]
+
+
+def orders_per_day(total: int, start: date, end: date, growth: float, seasonality: float):
+    """Split ``total`` orders over the days from ``start`` to ``end`` by weight, largest remainders first."""
+    days = [start + timedelta(days=n) for n in range((end - start).days + 1)]
+    weights = [day_weight(day, start, growth, seasonality) for day in days]
+    scale = total / sum(weights)
+    shares = [weight * scale for weight in weights]
+    counts = [int(share) for share in shares]
+    leftover = total - sum(counts)
+    for index in sorted(range(len(days)), key=lambda i: counts[i] - shares[i])[:leftover]:
+        counts[index] += 1
+    return list(zip(days, counts))
+
+
+def status_weights(age: int):
+    for max_age, weights in STATUS_BY_AGE:
+        if age <= max_age:
+            return list(weights), list(weights.values())
+
+
+# -------------------- Chunk generators -------------------- #
+
+# Set in every worker process by _init_worker
+_context = {}
+
+
+def _init_worker(context: dict):
+    _context.clear()
+    _context.update(context)
+    if "customer_ids" in context:
+        _context["customer_weights"] = zipf_cumulative(len(context["customer_ids"]), context["skew"])
+        _context["product_weights"] = zipf_cumulative(len(context["product_ids"]), context["skew"])
+    if "seller_ids" in context:
+        _context["seller_weights"] = zipf_cumulative(len(context["seller_ids"]), context["skew"])
+
+
+def _users(task):
+    first_id, count, version, index = task
+    ctx = _context
+    rng = random.Random(f"{ctx['seed']}:users:{index}")
+    rows = []
+    for user_id in range(first_id, first_id + count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        rows.append((
+            user_id, f"{first} {last}", f"{first}.{last}.{user_id}@example.com".lower(), ctx["password"],
+            f"+1-555-{rng.randrange(1000):03d}-{rng.randrange(10000):04d}" if rng.random() < 0.8 else None,
+            f"{rng.randrange(1, 9999)} {rng.choice(STREETS)} St, {rng.choice(CITIES)}" if rng.random() < 0.9
+            else None,
+            "seller" if user_id < ctx["first_customer_id"] else "customer",
+            version + user_id - first_id,
+        ))
+    return (rows,)
+
+
+def _products(task):
+    first_id, count, version, index = task
+    ctx = _context
+    rng = random.Random(f"{ctx['seed']}:products:{index}")
+    categories = list(CATEGORIES)
+    picks = rng.choices(categories, cum_weights=list(itertools.accumulate(c[0] for c in CATEGORIES.values())),
+                        k=count)
+    sellers = rng.choices(ctx["seller_ids"], cum_weights=ctx["seller_weights"], k=count)
+    rows = []
+    for offset, (category, seller_id) in enumerate(zip(picks, sellers)):
+        _, median_price, nouns = CATEGORIES[category]
+        product_id = first_id + offset
+        rows.append((
+            product_id, seller_id, f"{rng.choice(ADJECTIVES)} {rng.choice(nouns)} {product_id}",
+            " ".join(rng.choices(DESCRIPTION_WORDS, k=rng.randint(4, 16))),
+            round(max(0.99, rng.lognormvariate(math.log(median_price), 0.6)), 2),
+            0 if rng.random() < 0.05 else rng.randrange(1, 500), category, version + offset,
+        ))
+    return (rows,)
+
+
+def _orders(task):
+    """Orders and their lines for a run of consecutive days; returns ``(orders, order_items)``."""
+    first_id, days, version, index = task
+    ctx = _context
+    rng = random.Random(f"{ctx['seed']}:orders:{index}")
+    item_counts = range(1, ctx["max_items"] + 1)
+    item_weights = list(itertools.accumulate(1 / n for n in item_counts))
+    quantity_weights = list(itertools.accumulate(QUANTITY_WEIGHTS))
+    prices, first_product_id = ctx["prices"], ctx["product_ids_start"]
+    orders, items = [], []
+    order_id = first_id
+    # Draws are made for a whole day at a time, which is much faster than per order
+    for day, count in days:
+        statuses, weights = status_weights((ctx["end"] - day).days)
+        minutes = sorted(rng.choices(MINUTES, cum_weights=MINUTE_WEIGHTS, k=count))
+        seconds = rng.choices(SECONDS, k=count)
+        customers = rng.choices(ctx["customer_ids"], cum_weights=ctx["customer_weights"], k=count)
+        lines = rng.choices(item_counts, cum_weights=item_weights, k=count)
+        products = rng.choices(ctx["product_ids"], cum_weights=ctx["product_weights"], k=sum(lines))
+        quantities = rng.choices((1, 2, 3, 4), cum_weights=quantity_weights, k=len(products))
+        prefix = day.isoformat()
+        line = 0
+        for minute, second, user_id, status, count_lines in zip(
+                minutes, seconds, customers, rng.choices(statuses, weights, k=count), lines):
+            total = 0.0
+            for product_id, quantity in zip(products[line:line + count_lines], quantities[line:line + count_lines]):
+                price = prices[product_id - first_product_id]
+                total += price * quantity
+                items.append((order_id, product_id, quantity, price))
+            line += count_lines
+            # SQLAlchemy's SQLite DateTime format, so the rows read back like ORM-written ones
+            orders.append((order_id, user_id, round(total, 2), status, f"{prefix} {minute}:{second}",
+                           version + order_id - first_id))
+            order_id += 1
+    return orders, items
+
+
+def _order_tasks(days, first_id: int, version: int, batch: int):
+    """Group consecutive days into tasks of about ``batch`` orders."""
+    tasks, pending, size = [], [], 0
+    for day, count in days:
+        pending.append((day, count))
+        size += count
+        if size >= batch:
+            tasks.append((first_id, pending, version, len(tasks)))
+            first_id, version, pending, size = first_id + size, version + size, [], 0
+    if pending:
+        tasks.append((first_id, pending, version, len(tasks)))
+    return tasks
+
+
+# -------------------- Loading -------------------- #
+
+class Loader:
+    """Writes tuples with one executemany per chunk and reports rows per second."""
+
+    def __init__(self, engine, workers: int):
+        self.engine = engine
+        self.workers = workers
+        self.written = {}
+
+    def _write(self, conn, table: str, rows):
+        columns = COLUMNS[table]
+        if conn.dialect.paramstyle == "qmark":
+            placeholders = ", ".join("?" * len(columns))
+            conn.exec_driver_sql(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+        else:
+            conn.execute(insert(models.Base.metadata.tables[table]), [dict(zip(columns, row)) for row in rows])
+        self.written[table] = self.written.get(table, 0) + len(rows)
+
+    def run(self, tables: tuple, generate, tasks, context: dict, keep: bool = False):
+        """Generate ``tasks`` in worker processes and write the chunks in order.
+
+        ``generate`` returns one list of rows per table in ``tables``. With
+        ``keep`` the rows of the first table are returned as well.
+        """
+        started = time.perf_counter()
+        before = sum(self.written.values())
+        if self.workers > 1:
+            pool = multiprocessing.Pool(self.workers, _init_worker, (context,))
+            chunks = pool.imap(generate, tasks)
+        else:
+            pool = None
+            _init_worker(context)
+            chunks = map(generate, tasks)
+        collected = []
+        try:
+            with self.engine.connect() as conn:
+                for parts in chunks:
+                    for table, rows in zip(tables, parts):
+                        self._write(conn, table, rows)
+                    conn.commit()
+                    if keep:
+                        collected.extend(parts[0])
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        rows = sum(self.written.values()) - before
+        elapsed = time.perf_counter() - started
+        print(f"{'+'.join(tables):<20} {rows:>12,} rows {elapsed:>8.1f}s {rows / max(elapsed, 1e-9):>12,.0f} rows/s")
+        return collected
+
+
+def _next_id(db, column):
+    return (db.scalar(select(func.max(column))) or 0) + 1
+
+
+def _drop_indexes(engine):
+    for table in LOADED_TABLES:
+        for index in table.indexes:
+            index.drop(bind=engine, checkfirst=True)
+    with engine.begin() as conn:
+        if conn.dialect.name == "sqlite":
+            conn.execute(text("DROP TRIGGER IF EXISTS products_fts_insert"))
+
+
+def _build_indexes(engine):
+    for table in LOADED_TABLES:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def _build_search_index(db):
+    if not search.uses_fts(db):
+        return
+    fts_existed = db.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+    ).first()
+    search.initialize(db)  # recreates the trigger; a new index is filled here
+    if fts_existed:
+        search.rebuild(db)
+
+
+def _analyze(db):
+    if db.get_bind().dialect.name == "sqlite":
+        db.execute(text("ANALYZE"))
+        db.commit()
+
+
+def _timed(label: str, step, *args):
+    started = time.perf_counter()
+    step(*args)
+    print(f"{label:<20} {'':>17} {time.perf_counter() - started:>8.1f}s")
+
+
+def generate(args):
+    engine = create_db_engine(SQLALCHEMY_DATABASE_URL, profile="bulk")
+    Session = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    migrations.upgrade(engine)
+    loader = Loader(engine, args.workers)
+    sellers = min(args.sellers if args.sellers is not None else max(args.users // 50, 1), args.users)
+    if args.products and not sellers:
+        raise SystemExit("Products need at least one seller.")
+    if args.orders and not (args.users - sellers and args.products):
+        raise SystemExit("Orders need customers and products.")
+
+    with Session() as db:
+        first_user = _next_id(db, models.User.user_id)
+        first_product = _next_id(db, models.Product.product_id)
+        first_order = _next_id(db, models.Order.id)
+        versions = {table: changes.reserve(db, table, count)
+                    for table, count in (("users", args.users), ("products", args.products),
+                                         ("orders", args.orders)) if count}
+        # Ids about to be written that were deleted before are live again
+        for table, start in (("users", first_user), ("products", first_product), ("orders", first_order)):
+            db.execute(delete(models.Tombstone).where(models.Tombstone.table_name == table,
+                                                      models.Tombstone.row_id >= start))
+        db.commit()
+
+    total_started = time.perf_counter()
+    if not args.keep_indexes:
+        _drop_indexes(engine)
+
+    context = {"seed": args.seed, "skew": args.skew, "password": auth.hash_password(args.password),
+               "first_customer_id": first_user + sellers}
+    loader.run(("users",), _users, [
+        (first_user + n, min(args.batch, args.users - n), versions.get("users", 0) + n, index)
+        for index, n in enumerate(range(0, args.users, args.batch))
+    ], context)
+
+    context["seller_ids"] = ranked_ids(first_user, sellers, args.seed, "sellers")
+    products = loader.run(("products",), _products, [
+        (first_product + n, min(args.batch, args.products - n), versions.get("products", 0) + n, index)
+        for index, n in enumerate(range(0, args.products, args.batch))
+    ], context, keep=True)
+
+    if args.orders:
+        context = {
+            "seed": args.seed, "skew": args.skew, "max_items": args.max_items, "end": args.end,
+            "customer_ids": ranked_ids(first_user + sellers, args.users - sellers, args.seed, "customers"),
+            "product_ids": ranked_ids(first_product, args.products, args.seed, "products"),
+            "product_ids_start": first_product,
+            "prices": [row[4] for row in products],
+        }
+        days = orders_per_day(args.orders, args.start, args.end, args.growth, args.seasonality)
+        loader.run(("orders", "order_items"), _orders,
+                   _order_tasks(days, first_order, versions["orders"], args.batch), context)
+
+    with Session() as db:
+        if not args.keep_indexes:
+            _timed("indexes", _build_indexes, engine)
+            _timed("search index", _build_search_index, db)
+        _timed("summaries", summaries.rebuild, db)
+        _timed("analyze", _analyze, db)
+    rows = sum(loader.written.values())
+    elapsed = time.perf_counter() - total_started
+    print(f"{'total':<20} {rows:>12,} rows {elapsed:>8.1f}s {rows / elapsed:>12,.0f} rows/s")
+    engine.dispose()
+
+
+def main(argv):
+    today = date.today()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--sellers", type=int, help="how many of the users are sellers (default users / 50)")
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--max-items", type=int, default=4, help="most lines per order")
+    parser.add_argument("--start", type=date.fromisoformat, default=today - timedelta(days=730))
+    parser.add_argument("--end", type=date.fromisoformat, default=today)
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of customer, seller and "
+                                                                "product popularity; 0 is uniform")
+    parser.add_argument("--seasonality", type=float, default=0.4, help="0 to 1, size of the December peak")
+    parser.add_argument("--growth", type=float, default=0.3, help="yearly growth of the order volume")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--password", default="password", help="password of every generated user")
+    parser.add_argument("--batch", type=int, default=GENERATE_BATCH_SIZE, help="rows per chunk and commit")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="generator processes")
+    parser.add_argument("--keep-indexes", action="store_true", help="load with the indexes in place")
+    args = parser.parse_args(argv)
+    if args.start > args.end or not 0 <= args.seasonality < 1 or args.max_items < 1:
+        parser.error("need --start <= --end, 0 <= --seasonality < 1 and --max-items >= 1")
+    generate(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,176 @@
+"""Retention for ``admin_activity_logs``: move old rows into compressed monthly partitions.
+
+Archived rows are written as gzip NDJSON files under
+``AUDIT_ARCHIVE_DIR/<YYYY-MM>/<first id>-<last id>.ndjson.gz``, each sorted by
+(timestamp, id), and stay queryable through ``query_archive``
+(``GET /admin-logs/archive``). Run the job with::
+
+    python -m app.log_archive --older-than-days 90
+
+A partition file is written under a ``.tmp`` name, the rows are deleted and
+committed, and only then is the file renamed. If the job dies in between, the
+next run keeps or discards the leftover ``.tmp`` file depending on whether its
+rows are still in the table, so rows are never lost or archived twice.
+"""
+import argparse
+import gzip
+import heapq
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+from app import models
+from app.pagination import InvalidCursor, decode_cursor, encode_cursor
+
+AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", "./archive/admin_logs")
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "90"))
+
+Log = models.AdminActivityLog
+COLUMNS = ["id", "admin_name", "action", "target_table", "timestamp", "details"]
+SUFFIX = ".ndjson.gz"
+
+
+def _month(timestamp: datetime):
+    return timestamp.strftime("%Y-%m")
+
+
+def _first_id(path: Path):
+    return int(path.name.split("-")[0])
+
+
+def recover(db: Session, directory: str = AUDIT_ARCHIVE_DIR):
+    """Finish or discard partition files left behind by an interrupted run."""
+    for path in Path(directory).glob(f"*/*{SUFFIX}.tmp"):
+        if db.get(Log, _first_id(path)) is None:
+            path.rename(path.with_suffix(""))  # rows were deleted: the file is the only copy
+        else:
+            path.unlink()  # delete never committed: rows are still in the table
+
+
+def archive(db: Session, older_than: datetime, directory: str = AUDIT_ARCHIVE_DIR, batch_size: int = 5000):
+    """Move every log older than ``older_than`` into its monthly partition; returns the row count."""
+    recover(db, directory)
+    stmt = (
+        select(*(getattr(Log, name) for name in COLUMNS))
+        .where(Log.timestamp < older_than)
+        .order_by(Log.timestamp, Log.id)
+        .execution_options(yield_per=batch_size)
+    )
+
+    written, current, rows = [], None, []
+
+    def write_partition():
+        path = Path(directory, current, f"{rows[0]['id']}-{rows[-1]['id']}{SUFFIX}.tmp")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        written.append(path)
+
+    count = 0
+    for row in db.execute(stmt):
+        month = _month(row.timestamp)
+        if month != current and rows:
+            write_partition()
+            rows = []
+        current = month
+        rows.append({**row._asdict(), "timestamp": row.timestamp.isoformat()})
+        count += 1
+        if len(rows) >= batch_size * 20:
+            write_partition()
+            rows = []
+    if rows:
+        write_partition()
+
+    if count:
+        db.execute(delete(Log).where(Log.timestamp < older_than))
+        db.commit()
+    for path in written:
+        path.rename(path.with_suffix(""))
+    return count
+
+
+# ---------- Queries over archived partitions ----------
+
+def _read_partition(path: Path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+            yield row
+
+
+def _row_key(row):
+    return row["timestamp"], row["id"]
+
+
+def query_archive(limit: int, after: str | None = None, admin_name: str | None = None,
+                  action: str | None = None, target_table: str | None = None,
+                  time_from: datetime | None = None, time_to: datetime | None = None,
+                  directory: str = AUDIT_ARCHIVE_DIR):
+    """One page of archived logs in (timestamp, id) order; returns ``(rows, next_cursor)``.
+
+    Only the month partitions overlapping the time range are opened, and files
+    are merge-read lazily, so a page costs what it takes to reach its rows.
+    """
+    start = None
+    if after:
+        start = decode_cursor(after, "timestamp", Log.timestamp)
+        if start[0] is None:
+            raise InvalidCursor("Malformed cursor.")
+
+    months = sorted(p for p in Path(directory).glob("*") if p.is_dir())
+    low = max(filter(None, [time_from, start and start[0]]), default=None)
+    if low is not None:
+        months = [m for m in months if m.name >= _month(low)]
+    if time_to is not None:
+        months = [m for m in months if m.name <= _month(time_to)]
+
+    page = []
+    for month in months:
+        files = [_read_partition(path) for path in sorted(month.glob(f"*{SUFFIX}"))]
+        for row in heapq.merge(*files, key=_row_key):
+            if start is not None and _row_key(row) <= start:
+                continue
+            if time_from is not None and row["timestamp"] < time_from:
+                continue
+            if time_to is not None and row["timestamp"] >= time_to:
+                break
+            if admin_name is not None and row["admin_name"] != admin_name:
+                continue
+            if action is not None and row["action"] != action:
+                continue
+            if target_table is not None and row["target_table"] != target_table:
+                continue
+            page.append(row)
+            if len(page) > limit:
+                last = page[limit - 1]
+                return page[:limit], encode_cursor("timestamp", last["timestamp"], last["id"])
+    return page, None
+
+
+def main(argv):
+    from app import migrations
+    from app.database import SessionLocal, engine
+
+    parser = argparse.ArgumentParser(description="Archive old admin activity logs.")
+    parser.add_argument("--older-than-days", type=int, default=AUDIT_RETENTION_DAYS)
+    parser.add_argument("--directory", default=AUDIT_ARCHIVE_DIR)
+    args = parser.parse_args(argv)
+
+    migrations.upgrade(engine)
+    cutoff = datetime.utcnow() - timedelta(days=args.older_than_days)
+    with SessionLocal() as db:
+        count = archive(db, cutoff, args.directory)
+    print(f"Archived {count} admin log entries older than {cutoff:%Y-%m-%d %H:%M}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
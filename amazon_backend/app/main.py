@@ -1,9 +1,36 @@
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from app import routes
-from app.database import engine, Base
+from fastapi.middleware.gzip import GZipMiddleware
+from app import audit, events, metrics, migrations, routes
+from app.database import engine
+
+API_MODE = os.getenv("API_MODE", "sync")
+# app.serve migrates once before starting its workers and turns this off for them
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "1") == "1"
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if MIGRATE_ON_STARTUP:
+        migrations.upgrade(engine)
+    audit.writer.start()
+    events.relay.start()  # only with EVENTS_RELAY=database
+    app.state.ready = True
+    yield
+    app.state.ready = False  # fail readiness checks while draining
+    audit.writer.stop()  # writes out whatever is still queued
+    events.relay.stop()
 
-app = FastAPI()
-app.include_router(routes.router)
\ No newline at end of file
+app = FastAPI(lifespan=lifespan)
+app.state.ready = False
+app.add_middleware(GZipMiddleware, minimum_size=1000)  # for clients sending Accept-Encoding: gzip
+metrics.install(app)  # added last, so it wraps GZip and sees the compressed response sizes
+metrics.watch_engine("sync", engine)
+if API_MODE == "async":
+    # Registered first, so the async user/product/order handlers win on shared paths
+    from app import async_routes
+    from app.async_database import async_engine
+    app.include_router(async_routes.router)
+    metrics.watch_engine("async", async_engine.sync_engine)
+app.include_router(routes.router)
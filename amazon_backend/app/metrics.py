@@ -0,0 +1,376 @@
+"""Request and database metrics in Prometheus text format, plus slow-request profiles.
+
+``install(app)`` adds a middleware that records, per route template:
+
+- request latency, request and response payload sizes (as sent, i.e. after gzip)
+- the number of SQL statements and the time spent in them per request, counted
+  by SQLAlchemy cursor hooks that attribute each statement to the request
+  running it (sync endpoints on the threadpool included, via the context copied
+  into the worker thread)
+
+and, process-wide, per-statement query time, time spent waiting for a pooled
+connection (``TimedQueuePool``, used by both engines) and the current pool
+usage. ``GET /metrics`` serves everything for a Prometheus scrape. Numbers are
+per process: with several workers, scrape each one.
+
+With ``PROFILE_SAMPLE_RATE`` above 0 a random fraction of requests runs under
+a sampling profiler that snapshots every thread's stack each
+``PROFILE_INTERVAL_MS``. Profiles of requests slower than ``PROFILE_SLOW_MS``
+are written to ``PROFILE_DIR`` as collapsed stacks (one ``frame;frame;... count``
+line per stack), which flamegraph.pl and speedscope read. Threads idling in a
+wait are left out; other requests running at the same time do show up.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter as Tally
+from contextvars import ContextVar
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "500"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+SIZE_BUCKETS = (0, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+UNMATCHED_ROUTE = "<unmatched>"  # keeps 404 scans from adding a label value per path
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                le = bound if bound == "+Inf" else _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(values[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = Tally()
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        lines += [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+                  for labels, value in sorted(values.items())]
+        return lines
+
+
+class Gauge:
+    """Values read when rendering: ``collect()`` returns ``{label values: value}``."""
+
+    def __init__(self, name: str, help: str, labelnames, collect):
+        self.name, self.help, self.labelnames, self.collect = name, help, tuple(labelnames), collect
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        lines += [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+                  for labels, value in sorted(self.collect().items())]
+        return lines
+
+
+# -------------------- Metrics -------------------- #
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Time to serve a request.",
+                            ("method", "route", "status"))
+REQUEST_SIZE = Histogram("http_request_size_bytes", "Request body size.",
+                         ("method", "route"), SIZE_BUCKETS)
+RESPONSE_SIZE = Histogram("http_response_size_bytes", "Response body size as sent.",
+                          ("method", "route"), SIZE_BUCKETS)
+REQUEST_QUERIES = Histogram("http_request_db_queries", "SQL statements executed per request.",
+                            ("method", "route"), COUNT_BUCKETS)
+REQUEST_DB_TIME = Histogram("http_request_db_seconds", "Time spent in SQL statements per request.",
+                            ("method", "route"))
+QUERY_LATENCY = Histogram("db_query_duration_seconds", "Duration of one SQL statement.",
+                          ("statement",), QUERY_BUCKETS)
+POOL_WAIT = Histogram("db_pool_checkout_wait_seconds", "Time waiting for a pooled connection.",
+                      ("pool",), QUERY_BUCKETS)
+PROFILES = Counter("slow_request_profiles_total", "Profiles of slow requests written to PROFILE_DIR.",
+                   ("route",))
+
+_in_progress = Tally()  # (method,) -> requests being served
+_engines = {}
+
+
+def _collect_pool(attribute, minimum=None):
+    def collect():
+        values = {}
+        for name, engine in _engines.items():
+            pool = engine.pool
+            if hasattr(pool, attribute):
+                value = getattr(pool, attribute)()
+                values[(name,)] = value if minimum is None else max(value, minimum)
+        return values
+    return collect
+
+
+IN_PROGRESS = Gauge("http_requests_in_progress", "Requests being served.", ("method",), lambda: dict(_in_progress))
+POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections checked out of the pool.", ("pool",),
+                         _collect_pool("checkedout"))
+POOL_SIZE = Gauge("db_pool_size", "Configured pool size.", ("pool",), _collect_pool("size"))
+POOL_OVERFLOW = Gauge("db_pool_overflow", "Connections open beyond the pool size.", ("pool",),
+                      _collect_pool("overflow", minimum=0))
+
+REGISTRY = [REQUEST_LATENCY, REQUEST_SIZE, RESPONSE_SIZE, REQUEST_QUERIES, REQUEST_DB_TIME, QUERY_LATENCY,
+            POOL_WAIT, IN_PROGRESS, POOL_CHECKED_OUT, POOL_SIZE, POOL_OVERFLOW, PROFILES]
+
+
+def render() -> bytes:
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return ("\n".join(lines) + "\n").encode()
+
+
+def watch_engine(name: str, engine):
+    """Report the pool of ``engine`` under ``pool="<name>"``."""
+    _engines[name] = engine
+
+
+# -------------------- Pool checkout wait -------------------- #
+
+class _TimedGet:
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - started, self.metrics_name)
+
+
+class TimedQueuePool(_TimedGet, QueuePool):
+    metrics_name = "sync"
+
+
+class TimedAsyncQueuePool(_TimedGet, AsyncAdaptedQueuePool):
+    metrics_name = "async"
+
+
+# -------------------- SQL statements -------------------- #
+
+class RequestStats:
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+_current: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+STATEMENT_KINDS = {"select", "insert", "update", "delete", "with"}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    elapsed = time.perf_counter() - started
+    kind = statement.lstrip()[:6].lower().rstrip()
+    QUERY_LATENCY.observe(elapsed, kind if kind in STATEMENT_KINDS else "other")
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+# -------------------- Slow request profiles -------------------- #
+
+IDLE_FILES = ("threading.py", "queue.py", "selectors.py")
+
+
+class Sampler:
+    """Collects the stacks of all threads every ``interval`` seconds until stopped."""
+
+    _lock = threading.Lock()  # one profile at a time keeps the overhead bounded
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks = Tally()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not Sampler._lock.acquire(blocking=False):
+            return False
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        Sampler._lock.release()
+
+    def _run(self):
+        names = {}
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == me or os.path.basename(frame.f_code.co_filename) in IDLE_FILES:
+                    continue
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def dump(self, method: str, route: str, elapsed: float, directory: str = PROFILE_DIR):
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        slug = "".join(c if c.isalnum() else "_" for c in route).strip("_") or "root"
+        target = path / f"{time.strftime('%Y%m%d-%H%M%S')}-{method}-{slug}-{elapsed * 1000:.0f}ms.folded"
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(f"# {method} {route} {elapsed * 1000:.1f} ms, {self.samples} samples "
+                    f"every {self.interval * 1000:g} ms\n")
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        for old in sorted(path.glob("*.folded"))[:-PROFILE_MAX_FILES]:
+            old.unlink(missing_ok=True)
+        return target
+
+
+# -------------------- Middleware -------------------- #
+
+class MetricsMiddleware:
+    def __init__(self, app, sample_rate: float = PROFILE_SAMPLE_RATE, slow_ms: float = PROFILE_SLOW_MS,
+                 interval_ms: float = PROFILE_INTERVAL_MS):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow = slow_ms / 1000
+        self.interval = interval_ms / 1000
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        stats = RequestStats()
+        token = _current.set(stats)
+        response = {"status": 500, "size": 0}
+        request_size = 0
+
+        async def receive_counting():
+            nonlocal request_size
+            message = await receive()
+            if message["type"] == "http.request":
+                request_size += len(message.get("body", b""))
+            return message
+
+        async def send_counting(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["size"] += len(message.get("body", b""))
+            await send(message)
+
+        sampler = None
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            sampler = Sampler(self.interval)
+            if not sampler.start():
+                sampler = None
+        _in_progress[(method,)] += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive_counting, send_counting)
+        finally:
+            elapsed = time.perf_counter() - started
+            _in_progress[(method,)] -= 1
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            REQUEST_LATENCY.observe(elapsed, method, route, response["status"])
+            REQUEST_SIZE.observe(request_size, method, route)
+            RESPONSE_SIZE.observe(response["size"], method, route)
+            REQUEST_QUERIES.observe(stats.queries, method, route)
+            REQUEST_DB_TIME.observe(stats.db_time, method, route)
+            if sampler is not None:
+                sampler.stop()
+                if elapsed >= self.slow:
+                    sampler.dump(method, route, elapsed)
+                    PROFILES.inc(route)
+
+
+def install(app):
+    """Add the middleware and the SQL hooks; a no-op with ``METRICS_ENABLED=0``."""
+    if not METRICS_ENABLED:
+        return
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+    app.add_middleware(MetricsMiddleware)
@@ -0,0 +1,199 @@
+"""Versioned schema migrations.
+
+Each migration has a version number and runs once per database; applied
+versions are recorded in ``schema_migrations``. Run them before starting the
+server (``python -m app.serve`` does this before forking its workers)::
+
+    python -m app.migrations upgrade
+    python -m app.migrations status
+
+A migration runs in its own transaction together with its
+``schema_migrations`` row, after taking a lock that serializes concurrent
+runners: ``BEGIN IMMEDIATE`` on SQLite, an advisory lock on PostgreSQL. A
+runner that waited for the lock re-reads the applied versions, so every
+migration is applied exactly once no matter how many processes start at the
+same time. Migrations must still be idempotent (``checkfirst``, ``IF NOT
+EXISTS``): some databases commit DDL on their own, so a failed migration can
+leave part of its work behind and is then run again.
+
+Migration 1 creates every table of ``app.models`` that is missing. A new table
+therefore exists on fresh databases before its own migration runs, which is
+one more reason for the idempotency rule. Add new migrations at the end of
+``MIGRATIONS`` and never change one that has shipped.
+"""
+import argparse
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateColumn
+from app import changes, models, search, summaries
+from app.database import Base
+
+# Kept out of Base.metadata so it is never created by anything but this module
+history = Table(
+    "schema_migrations", MetaData(),
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+POSTGRES_LOCK_ID = 7_310_592  # any constant shared by all runners
+LOCK_RETRY_SECONDS = 0.5
+
+Migration = namedtuple("Migration", "version name apply")
+MIGRATIONS = []
+
+
+def migration(version: int, name: str):
+    def register(apply):
+        assert not MIGRATIONS or MIGRATIONS[-1].version < version, "versions must increase"
+        MIGRATIONS.append(Migration(version, name, apply))
+        return apply
+    return register
+
+
+def add_missing_columns_and_indexes(conn, tables=None):
+    """Add the columns and indexes of ``app.models`` that existing tables lack."""
+    inspector = inspect(conn)
+    for table in tables or Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
+# -------------------- Migrations -------------------- #
+
+@migration(1, "create tables")
+def _create_tables(conn):
+    Base.metadata.create_all(bind=conn)
+
+
+@migration(2, "add columns and indexes missing from tables created by older versions")
+def _add_missing(conn):
+    add_missing_columns_and_indexes(conn)
+
+
+@migration(3, "fill the dashboard summary tables")
+def _fill_summaries(conn):
+    with Session(bind=conn) as db:
+        summaries.rebuild(db)
+
+
+@migration(4, "version rows for the change feed")
+def _version_rows(conn):
+    with Session(bind=conn) as db:
+        changes.initialize(db)
+
+
+@migration(5, "full-text index for product search")
+def _search_index(conn):
+    with Session(bind=conn) as db:
+        search.initialize(db)
+
+
+@migration(6, "customer order summary and the (user_id, order_date) index on orders")
+def _customer_summary(conn):
+    models.CustomerOrderSummary.__table__.create(bind=conn, checkfirst=True)
+    add_missing_columns_and_indexes(conn, [models.Order.__table__, models.CustomerOrderSummary.__table__])
+    with Session(bind=conn) as db:
+        summaries.rebuild_customers(db)
+
+
+@migration(7, "change events relayed between worker processes")
+def _change_events(conn):
+    models.ChangeEvent.__table__.create(bind=conn, checkfirst=True)
+
+
+# -------------------- Runner -------------------- #
+
+def _lock(conn):
+    """Begin the migration transaction, waiting until no other runner holds it."""
+    if conn.dialect.name == "sqlite":
+        # The driver leaves DDL outside transactions; take the write lock up front instead.
+        # Another runner may hold it for longer than the busy timeout.
+        while True:
+            try:
+                conn.exec_driver_sql("BEGIN IMMEDIATE")
+                return
+            except OperationalError as e:
+                if "locked" not in str(e.orig):
+                    raise
+                conn.rollback()
+                time.sleep(LOCK_RETRY_SECONDS)
+    elif conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": POSTGRES_LOCK_ID})
+
+
+def applied(conn):
+    """Versions recorded in ``schema_migrations``; empty for a new database."""
+    if not inspect(conn).has_table(history.name):
+        return set()
+    return set(conn.execute(select(history.c.version)).scalars())
+
+
+def pending(conn):
+    done = applied(conn)
+    return [m for m in MIGRATIONS if m.version not in done]
+
+
+def current_version(conn):
+    return max(applied(conn), default=0)
+
+
+def upgrade(engine, log=print):
+    """Apply every pending migration in order; returns how many were applied."""
+    with engine.connect() as conn:
+        if not pending(conn):
+            return 0
+        conn.rollback()
+        _lock(conn)
+        history.create(bind=conn, checkfirst=True)
+        conn.commit()
+        count = 0
+        for step in MIGRATIONS:
+            _lock(conn)
+            try:
+                if step.version in applied(conn):
+                    conn.rollback()  # another runner got here first
+                    continue
+                step.apply(conn)
+                conn.execute(history.insert().values(version=step.version, name=step.name,
+                                                     applied_at=datetime.utcnow()))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            log(f"applied migration {step.version}: {step.name}")
+            count += 1
+        return count
+
+
+def main(argv):
+    from app.database import engine
+
+    parser = argparse.ArgumentParser(description="Migrate the database schema.")
+    parser.add_argument("command", choices=["upgrade", "status"])
+    args = parser.parse_args(argv)
+
+    if args.command == "upgrade":
+        count = upgrade(engine)
+        print(f"{count} migrations applied." if count else "Schema is up to date.")
+        return 0
+    with engine.connect() as conn:
+        done = applied(conn)
+    for step in MIGRATIONS:
+        print(f"{'applied' if step.version in done else 'pending':<8} {step.version:>4}  {step.name}")
+    return 0 if done >= {step.version for step in MIGRATIONS} else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DECIMAL, ForeignKey, Enum, Float, DateTime
+from sqlalchemy import Column, Integer, String, Text, DECIMAL, ForeignKey, Enum, Float, DateTime, Index, Date
 from sqlalchemy.orm import relationship
 from app.database import Base
 from datetime import datetime
@@ -11,30 +11,53 @@ class User(Base):
     password = Column(String(255), nullable=False)
     phone_number = Column(String(20), nullable=True)
     address = Column(Text, nullable=True)
-    role = Column(Enum("customer", "seller", "admin", name="user_roles"), nullable=False)
+    role = Column(Enum("customer", "seller", "admin", name="user_roles"), nullable=False, index=True)
+    version = Column(Integer, nullable=False, default=0, server_default="0", index=True)  # see app.changes
     orders = relationship("Order", back_populates="user")
 
 
 class Product(Base):
     __tablename__ = "products"
     product_id = Column(Integer, primary_key=True, index=True)
-    seller_id = Column(Integer, ForeignKey("users.user_id"))
+    seller_id = Column(Integer, ForeignKey("users.user_id"), index=True)
     name = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
-    price = Column(DECIMAL(10, 2), nullable=False)
-    stock = Column(Integer, nullable=False)
-    category = Column(String(100), nullable=True)
+    price = Column(DECIMAL(10, 2), nullable=False, index=True)
+    stock = Column(Integer, nullable=False, index=True)
+    category = Column(String(100), nullable=True, index=True)
+    version = Column(Integer, nullable=False, default=0, server_default="0", index=True)
     
 class Order(Base):
     __tablename__ = "orders"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.user_id"))
-    total_amount = Column(Float)
-    status = Column(String, default="pending")
-    order_date = Column(DateTime, default=datetime.utcnow)
+    user_id = Column(Integer, ForeignKey("users.user_id"), index=True)
+    total_amount = Column(Float, index=True)
+    status = Column(String, default="pending", index=True)
+    order_date = Column(DateTime, default=datetime.utcnow, index=True)
+    version = Column(Integer, nullable=False, default=0, server_default="0", index=True)
 
     user = relationship("User", back_populates="orders")
+    items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        # status filter combined with the order_date sort
+        Index("ix_orders_status_order_date", "status", "order_date"),
+        # a customer's order history, newest first, and their latest order
+        Index("ix_orders_user_id_order_date", "user_id", "order_date"),
+    )
+
+
+class OrderItem(Base):
+    __tablename__ = "order_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey("products.product_id"), nullable=False, index=True)
+    quantity = Column(Integer, nullable=False)
+    unit_price = Column(Float, nullable=False)  # product price at checkout
+
+    order = relationship("Order", back_populates="items")
     
 class AdminActivityLog(Base):
     __tablename__ = "admin_activity_logs"
@@ -43,4 +66,83 @@ class AdminActivityLog(Base):
     admin_name = Column(String, nullable=False)
     action = Column(String, nullable=False)  # e.g., add/update/delete
     target_table = Column(String, nullable=False)  # e.g., users/products/orders
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    details = Column(String, nullable=True)  # summary of a bulk action, e.g. what it changed
+
+    __table_args__ = (
+        Index("ix_admin_activity_logs_target_table_timestamp", "target_table", "timestamp"),
+    )
+
+
+# ---------- Summary tables, maintained incrementally by app.summaries ----------
+
+class OrderDailySummary(Base):
+    __tablename__ = "order_daily_summary"
+
+    day = Column(Date, primary_key=True)
+    status = Column(String, primary_key=True)  # "" for orders without a status
+    order_count = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+
+
+class CategoryInventorySummary(Base):
+    __tablename__ = "category_inventory_summary"
+
+    category = Column(String(100), primary_key=True)  # "" for uncategorized products
+    product_count = Column(Integer, nullable=False, default=0)
+    total_stock = Column(Integer, nullable=False, default=0)
+    stock_value = Column(Float, nullable=False, default=0.0)
+
+
+class CustomerOrderSummary(Base):
+    __tablename__ = "customer_order_summary"
+
+    user_id = Column(Integer, primary_key=True)
+    order_count = Column(Integer, nullable=False, default=0)
+    lifetime_value = Column(Float, nullable=False, default=0.0, index=True)  # top customers read this index
+    last_order_date = Column(DateTime, nullable=True)
+
+
+# ---------- Change feed bookkeeping, maintained by app.changes ----------
+
+class ChangeCounter(Base):
+    __tablename__ = "change_counters"
+
+    table_name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)  # last version handed out
+    pruned_through = Column(Integer, nullable=False, default=0)  # tombstones up to here are gone
+
+
+class Tombstone(Base):
+    __tablename__ = "tombstones"
+
+    table_name = Column(String(50), primary_key=True)
+    row_id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_tombstones_table_name_version", "table_name", "version"),
+    )
+
+
+# ---------- Change events relayed between worker processes by app.events ----------
+
+class ChangeEvent(Base):
+    __tablename__ = "change_events"
+
+    position = Column(Integer, primary_key=True, autoincrement=False)  # from change_counters, in commit order
+    created_at = Column(DateTime, nullable=False, index=True)
+    payload = Column(Text, nullable=False)  # JSON list of the transaction's events
+
+
+# ---------- Login sessions shared by worker processes, used by app.auth ----------
+
+class AuthSession(Base):
+    __tablename__ = "auth_sessions"
+
+    token_hash = Column(String(64), primary_key=True)  # SHA-256 of the token, never the token itself
+    user_id = Column(Integer, nullable=False, index=True)
+    name = Column(String(255), nullable=False)
+    email = Column(String(255), nullable=False)
+    role = Column(String(20), nullable=False)
+    expires_at = Column(Float, nullable=False, index=True)  # Unix time
@@ -0,0 +1,101 @@
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# Cursors are opaque to clients: base64 of [sort name, last sort value, last primary key]
+def encode_cursor(sort: str, value, pk: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    elif isinstance(value, Decimal):
+        value = str(value)
+    raw = json.dumps([sort, value, pk], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, column):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, value, pk = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Malformed cursor.")
+    if cursor_sort != sort:
+        raise InvalidCursor("Cursor was issued for a different sort order.")
+    if value is not None:
+        python_type = column.type.python_type
+        if python_type is datetime:
+            value = datetime.fromisoformat(value)
+        elif python_type is Decimal:
+            value = Decimal(str(value))  # float when the page was selected with a cast
+    return value, int(pk)
+
+
+def keyset_filter(column, pk_column, value, pk: int, descending: bool):
+    # NULLs sort first when ascending and last when descending (see keyset_order)
+    if descending:
+        if value is None:
+            return and_(column.is_(None), pk_column < pk)
+        return or_(column < value, and_(column == value, pk_column < pk), column.is_(None))
+    if value is None:
+        return or_(column.is_not(None), and_(column.is_(None), pk_column > pk))
+    return or_(column > value, and_(column == value, pk_column > pk))
+
+
+def keyset_order(column, pk_column, descending: bool):
+    if column is pk_column:
+        return [pk_column.desc() if descending else pk_column.asc()]
+    if descending:
+        return [column.desc().nulls_last(), pk_column.desc()]
+    return [column.asc().nulls_first(), pk_column.asc()]
+
+
+def keyset_select(stmt, sort: str, column, pk_column, limit: int,
+                  after: str | None = None, descending: bool = False):
+    """Restrict ``stmt`` to the page after ``after`` ordered by (column, pk).
+
+    One extra row is selected so ``split_page`` can tell whether more pages follow.
+    """
+    if after:
+        value, pk = decode_cursor(after, sort, column)
+        if column is pk_column:
+            stmt = stmt.where(pk_column < pk if descending else pk_column > pk)
+        else:
+            stmt = stmt.where(keyset_filter(column, pk_column, value, pk, descending))
+    return stmt.order_by(*keyset_order(column, pk_column, descending)).limit(limit + 1)
+
+
+def split_page(rows, sort: str, column, pk_column, limit: int):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, getattr(last, column.key), getattr(last, pk_column.key))
+    return rows, next_cursor
+
+
+def keyset_page(db: Session, stmt, sort: str, column, pk_column, limit: int,
+                after: str | None = None, descending: bool = False, columns=None):
+    """Fetch one page of ``stmt``; returns ``(rows, next_cursor)``.
+
+    ``next_cursor`` is None on the last page. With ``columns`` (which must
+    include the sort and primary key columns) rows are tuples of just those
+    columns instead of ORM objects.
+    """
+    stmt = keyset_select(stmt, sort, column, pk_column, limit, after, descending)
+    if columns is not None:
+        rows = db.execute(stmt.with_only_columns(*columns)).all()
+    else:
+        rows = db.scalars(stmt).all()
+    db.commit()
+    return split_page(rows, sort, column, pk_column, limit)
@@ -1,7 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import date, datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
 from sqlalchemy.orm import Session
-from app import schemas, crud
+from app import schemas, crud, aggregates, analytics, auth, bulk, changes, events, log_archive, metrics, migrations, search
+from app.cache import response_cache
+from app.serialization import columns_for, dumps, encode_columns, encode_rows
 from app.database import SessionLocal
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor
 
 router = APIRouter()
 
@@ -14,80 +23,554 @@ def get_db():
 
 ADMIN_NAME = "admin"  # In production, replace this with actual session context
 
+class PageParams:
+    """Common keyset pagination query parameters for list endpoints."""
+
+    def __init__(
+        self,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        after: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header"),
+        order: Literal["asc", "desc"] = "asc",
+        format: Literal["rows", "columns"] = Query("rows", description="`columns`: one array per field"),
+    ):
+        self.limit = limit
+        self.after = after
+        self.descending = order == "desc"
+        self.encode = encode_columns if format == "columns" else encode_rows
+
+def paginate(response: Response, fetch, page: PageParams, **kwargs):
+    try:
+        rows, next_cursor = fetch(limit=page.limit, after=page.after,
+                                  descending=page.descending, **kwargs)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+def if_match(if_match: Optional[str] = Header(None, description='Version the update expects, e.g. `"42"`')):
+    """Version from an ``If-Match`` header; None without one or for ``*``."""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = if_match.strip().removeprefix("W/").strip('"')
+    if not tag.isdigit():
+        raise HTTPException(status_code=400, detail='If-Match must be a row version, e.g. "42".')
+    return int(tag)
+
+def version_conflict(e: crud.VersionConflict):
+    return HTTPException(status_code=409, detail=str(e), headers={"ETag": f'"{e.current}"'})
+
+def with_etag(response: Response, row, not_found: str):
+    """``row`` with its version as ``ETag``, for ``If-Match`` on the next update; 404 for None."""
+    if row is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    response.headers["ETag"] = f'"{row["version"]}"'
+    return row
+
+def cached_page(request: Request, response: Response, table: str, partition, schema, fetch,
+                page: PageParams, **kwargs):
+    """``paginate`` through the response cache; ``partition`` is the value of the table's partition filter.
+
+    Only the columns of ``schema`` are selected, and encoded without going through the schema.
+    """
+    lookup = response_cache.lookup(request, table, partition)
+    if lookup.entry is None:
+        rows = paginate(response, fetch, page, columns=columns_for(schema), **kwargs)
+        lookup.store(page.encode(schema, rows), response.headers.get("X-Next-Cursor"))
+    return lookup.response()
+
+# ---------------- AUTH ----------------
+def _session_response(token: str, session: auth.LoginSession):
+    return {**session._asdict(), "expires_at": datetime.utcfromtimestamp(session.expires_at), "token": token}
+
+def bearer_token(authorization: Optional[str] = Header(None)):
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Missing bearer token.")
+    return token
+
+@router.post("/auth/login", response_model=schemas.LoginResponse)
+async def login(credentials: schemas.LoginRequest, db: Session = Depends(get_db)):
+    user = await run_in_threadpool(crud.get_user_by_email, db, credentials.email)
+    stored = user.password if user else None
+    if not await auth.verify_password_async(credentials.password, stored):
+        raise HTTPException(status_code=401, detail="Invalid email or password.")
+    if auth.needs_rehash(stored):
+        new_hash = await auth.hash_password_async(credentials.password)
+        await run_in_threadpool(crud.set_user_password, db, user.user_id, new_hash)
+    # The database session store runs a transaction of its own
+    token, session = await run_in_threadpool(auth.sessions.issue, user)
+    return _session_response(token, session)
+
+@router.get("/auth/session", response_model=schemas.LoginSession)
+def read_session(token: str = Depends(bearer_token)):
+    session = auth.sessions.get(token)
+    if session is None:
+        raise HTTPException(status_code=401, detail="Session expired or unknown.")
+    return _session_response(token, session)
+
+@router.post("/auth/logout")
+def logout(token: str = Depends(bearer_token)):
+    return {"logged_out": auth.sessions.revoke(token)}
+
 # ---------------- USERS ----------------
 @router.post("/users/", response_model=schemas.User)
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    created_user = crud.create_user(db, user)
     crud.log_admin_activity(db, admin_name=ADMIN_NAME, action="add", target_table="users")
+    created_user = crud.create_user(db, user)
     return created_user
 
 @router.get("/users/", response_model=list[schemas.User])
-def read_users(db: Session = Depends(get_db)):
-    return crud.get_users(db)
+def read_users(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    sort: Literal["user_id", "email"] = "user_id",
+    role: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    return cached_page(request, response, "users", role, schemas.User,
+                       lambda **kw: crud.get_users(db, **kw), page, sort=sort, role=role)
+
+@router.get("/users/{user_id}", response_model=schemas.User)
+def read_user(user_id: int, response: Response, db: Session = Depends(get_db)):
+    return with_etag(response, crud.get_row(db, "users", user_id), "User not found.")
 
 @router.put("/users/{user_id}", response_model=schemas.User)
-def update_user(user_id: int, user: schemas.UserCreate, db: Session = Depends(get_db)):
-    updated_user = crud.update_user(db, user_id, user)
-    crud.log_admin_activity(db, admin_name=ADMIN_NAME, action="update", target_table="users")
-    return updated_user
+def update_user(
+    user_id: int,
+    user: schemas.UserCreate,
+    response: Response,
+    expected_version: Optional[int] = Depends(if_match),
+    db: Session = Depends(get_db),
+):
+    try:
+        updated = crud.update_user(db, user_id, user, expected_version, admin_name=ADMIN_NAME)
+    except crud.VersionConflict as e:
+        raise version_conflict(e)
+    return with_etag(response, updated, "User not found.")
+
+@router.patch("/users/{user_id}", response_model=schemas.User)
+def patch_user(
+    user_id: int,
+    user: schemas.UserUpdate,
+    response: Response,
+    expected_version: Optional[int] = Depends(if_match),
+    db: Session = Depends(get_db),
+):
+    try:
+        patched = crud.patch_user(db, user_id, user, expected_version, admin_name=ADMIN_NAME)
+    except crud.VersionConflict as e:
+        raise version_conflict(e)
+    return with_etag(response, patched, "User not found.")
 
 @router.delete("/users/{user_id}")
 def delete_user(user_id: int, db: Session = Depends(get_db)):
-    deleted = crud.delete_user(db, user_id)
     crud.log_admin_activity(db, admin_name=ADMIN_NAME, action="delete", target_table="users")
+    deleted = crud.delete_user(db, user_id)
     return deleted
 
+@router.get("/users/{user_id}/orders", response_model=list[schemas.Order])
+def read_user_order_history(
+    user_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    order: Literal["asc", "desc"] = "desc",
+    format: Literal["rows", "columns"] = "rows",
+    db: Session = Depends(get_db),
+):
+    """The user's orders by date, newest first unless ``order=asc``."""
+    page = PageParams(limit=limit, after=after, order=order, format=format)
+    return cached_page(request, response, "orders", user_id, schemas.Order,
+                       lambda **kw: crud.get_orders_by_user(db, user_id, **kw), page, sort="order_date")
+
+@router.get("/users/{user_id}/stats", response_model=schemas.CustomerStats)
+def read_user_stats(user_id: int, db: Session = Depends(get_db)):
+    stats = aggregates.customer_stats(db, user_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="User not found.")
+    return stats
+
+@router.get("/customers/top", response_model=list[schemas.TopCustomer])
+def read_top_customers(limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE), db: Session = Depends(get_db)):
+    customers = aggregates.top_customers(db, limit)
+    db.commit()
+    return customers
+
 # ---------------- PRODUCTS ----------------
 @router.post("/products/", response_model=schemas.Product)
 def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)):
-    created_product = crud.create_product(db, product)
     crud.log_admin_activity(db, admin_name=ADMIN_NAME, action="add", target_table="products")
+    created_product = crud.create_product(db, product)
     return created_product
 
 @router.get("/products/", response_model=list[schemas.Product])
-def read_products(db: Session = Depends(get_db)):
-    return crud.get_products(db)
+def read_products(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    sort: Literal["product_id", "price"] = "product_id",
+    category: Optional[str] = None,
+    seller_id: Optional[int] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    db: Session = Depends(get_db),
+):
+    return cached_page(request, response, "products", category, schemas.Product,
+                       lambda **kw: crud.get_products(db, **kw), page, sort=sort, category=category,
+                       seller_id=seller_id, min_price=min_price, max_price=max_price)
+
+@router.get("/products/search", response_model=schemas.ProductSearch)
+def search_products(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    category: Optional[str] = None,
+    prefix: bool = Query(True, description="Match words starting with each term"),
+    limit: int = Query(search.SEARCH_PAGE_SIZE, ge=1, le=search.MAX_SEARCH_PAGE_SIZE),
+    offset: int = Query(0, ge=0, le=search.MAX_SEARCH_OFFSET),
+    db: Session = Depends(get_db),
+):
+    # Facets count every category, so any product change can alter the response
+    lookup = response_cache.lookup(request, "products")
+    if lookup.entry is None:
+        lookup.store(dumps(search.search_products(db, q, category=category, limit=limit,
+                                                  offset=offset, prefix=prefix)), None)
+    return lookup.response()
+
+@router.get("/products/suggest", response_model=list[schemas.ProductSuggestion])
+def suggest_products(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(search.SUGGESTION_LIMIT, ge=1, le=search.MAX_SEARCH_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    lookup = response_cache.lookup(request, "products")
+    if lookup.entry is None:
+        lookup.store(encode_rows(schemas.ProductSuggestion, search.suggest(db, q, limit)), None)
+    return lookup.response()
+
+@router.get("/products/{product_id}", response_model=schemas.Product)
+def read_product(product_id: int, response: Response, db: Session = Depends(get_db)):
+    return with_etag(response, crud.get_row(db, "products", product_id), "Product not found.")
 
 @router.put("/products/{product_id}", response_model=schemas.Product)
-def update_product(product_id: int, product: schemas.ProductCreate, db: Session = Depends(get_db)):
-    updated_product = crud.update_product(db, product_id, product)
-    crud.log_admin_activity(db, admin_name=ADMIN_NAME, action="update", target_table="products")
-    return updated_product
+def update_product(
+    product_id: int,
+    product: schemas.ProductCreate,
+    response: Response,
+    expected_version: Optional[int] = Depends(if_match),
+    db: Session = Depends(get_db),
+):
+    try:
+        updated = crud.update_product(db, product_id, product, expected_version, admin_name=ADMIN_NAME)
+    except crud.VersionConflict as e:
+        raise version_conflict(e)
+    return with_etag(response, updated, "Product not found.")
+
+@router.patch("/products/{product_id}", response_model=schemas.Product)
+def patch_product(
+    product_id: int,
+    product: schemas.ProductUpdate,
+    response: Response,
+    expected_version: Optional[int] = Depends(if_match),
+    db: Session = Depends(get_db),
+):
+    try:
+        patched = crud.patch_product(db, product_id, product, expected_version, admin_name=ADMIN_NAME)
+    except crud.VersionConflict as e:
+        raise version_conflict(e)
+    return with_etag(response, patched, "Product not found.")
 
 @router.delete("/products/{product_id}")
 def delete_product(product_id: int, db: Session = Depends(get_db)):
-    deleted = crud.delete_product(db, product_id)
     crud.log_admin_activity(db, admin_name=ADMIN_NAME, action="delete", target_table="products")
+    deleted = crud.delete_product(db, product_id)
     return deleted
 
 # ---------------- ORDERS ----------------
 @router.post("/orders/", response_model=schemas.Order)
 def create_order(order: schemas.OrderCreate, db: Session = Depends(get_db)):
-    created_order = crud.create_order(db, order)
     crud.log_admin_activity(db, admin_name=ADMIN_NAME, action="add", target_table="orders")
+    created_order = crud.create_order(db, order)
     return created_order
 
+@router.post("/orders/checkout", response_model=schemas.OrderWithItems)
+def checkout(request: schemas.CheckoutRequest, db: Session = Depends(get_db)):
+    crud.log_admin_activity(db, admin_name=ADMIN_NAME, action="checkout", target_table="orders")
+    try:
+        return crud.checkout(db, request)
+    except crud.ProductNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except crud.InsufficientStock as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
 @router.get("/orders/", response_model=list[schemas.Order])
-def read_all_orders(db: Session = Depends(get_db)):
-    return crud.get_orders(db)
+def read_all_orders(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    sort: Literal["id", "order_date", "total_amount"] = "id",
+    status: Optional[str] = None,
+    user_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    db: Session = Depends(get_db),
+):
+    return cached_page(request, response, "orders", user_id, schemas.Order,
+                       lambda **kw: crud.get_orders(db, **kw), page, sort=sort, status=status,
+                       user_id=user_id, date_from=date_from, date_to=date_to,
+                       min_amount=min_amount, max_amount=max_amount)
 
 @router.get("/orders/user/{user_id}", response_model=list[schemas.Order])
-def read_orders_by_user(user_id: int, db: Session = Depends(get_db)):
-    return crud.get_orders_by_user(db, user_id)
+def read_orders_by_user(
+    user_id: int,
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
+    sort: Literal["id", "order_date", "total_amount"] = "id",
+    db: Session = Depends(get_db),
+):
+    return cached_page(request, response, "orders", user_id, schemas.Order,
+                       lambda **kw: crud.get_orders_by_user(db, user_id, **kw), page, sort=sort)
+
+@router.get("/orders/{order_id}", response_model=schemas.Order)
+def read_order(order_id: int, response: Response, db: Session = Depends(get_db)):
+    return with_etag(response, crud.get_row(db, "orders", order_id), "Order not found.")
 
 @router.put("/orders/{order_id}", response_model=schemas.Order)
-def update_order(order_id: int, order: schemas.OrderCreate, db: Session = Depends(get_db)):
-    updated_order = crud.update_order(db, order_id, order)
-    crud.log_admin_activity(db, admin_name=ADMIN_NAME, action="update", target_table="orders")
-    return updated_order
+def update_order(
+    order_id: int,
+    order: schemas.OrderCreate,
+    response: Response,
+    expected_version: Optional[int] = Depends(if_match),
+    db: Session = Depends(get_db),
+):
+    try:
+        updated = crud.update_order(db, order_id, order, expected_version, admin_name=ADMIN_NAME)
+    except crud.VersionConflict as e:
+        raise version_conflict(e)
+    return with_etag(response, updated, "Order not found.")
+
+@router.patch("/orders/{order_id}", response_model=schemas.Order)
+def patch_order(
+    order_id: int,
+    order: schemas.OrderUpdate,
+    response: Response,
+    expected_version: Optional[int] = Depends(if_match),
+    db: Session = Depends(get_db),
+):
+    try:
+        patched = crud.patch_order(db, order_id, order, expected_version, admin_name=ADMIN_NAME)
+    except crud.VersionConflict as e:
+        raise version_conflict(e)
+    return with_etag(response, patched, "Order not found.")
 
 @router.delete("/orders/{order_id}")
 def delete_order(order_id: int, db: Session = Depends(get_db)):
-    deleted = crud.delete_order(db, order_id)
     crud.log_admin_activity(db, admin_name=ADMIN_NAME, action="delete", target_table="orders")
+    deleted = crud.delete_order(db, order_id)
     return deleted
 
+@router.post("/orders/status", response_model=schemas.OrderStatusTransitionResult)
+def transition_orders(transition: schemas.OrderStatusTransition, db: Session = Depends(get_db)):
+    # Logs one summarizing entry itself, in the same transaction
+    try:
+        return crud.transition_orders(db, transition, admin_name=ADMIN_NAME)
+    except OperationalError as e:
+        # SQLite gave up waiting for the write lock; nothing was changed
+        if "locked" not in str(e.orig):
+            raise
+        raise HTTPException(status_code=503, detail="The database is busy; retry the transition.",
+                            headers={"Retry-After": "1"})
+
+# ---------------- BULK IMPORT / EXPORT ----------------
+BulkTableName = Literal["users", "products", "orders"]
+
+def run_import(db: Session, table: str, lines, fmt: str, mode: str):
+    result = bulk.import_rows(db, table, lines, fmt, upsert=mode == "upsert")
+    if result["written"]:
+        crud.log_admin_activity(db, admin_name=ADMIN_NAME, action=f"bulk_{mode}", target_table=table)
+        db.commit()
+    return result
+
+@router.post("/bulk/{table}", response_model=schemas.BulkImportResult)
+async def bulk_import(
+    table: BulkTableName,
+    request: Request,
+    format: Optional[Literal["ndjson", "csv"]] = None,
+    mode: Literal["insert", "upsert"] = "insert",
+    db: Session = Depends(get_db),
+):
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    # The body is parsed and written batch by batch while it is still being received
+    return await run_in_threadpool(run_import, db, table, bulk.iter_lines(request.stream()), format, mode)
+
+@router.get("/export/{table}")
+def export_table(table: BulkTableName, format: Literal["ndjson", "csv"] = "ndjson"):
+    return StreamingResponse(
+        bulk.export_rows(table, format),
+        media_type=bulk.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{format}"'},
+    )
 
+# ---------------- CHANGE FEED ----------------
+@router.get("/changes", response_model=dict[str, int])
+def read_versions(db: Session = Depends(get_db)):
+    return changes.versions(db)
+
+@router.get("/changes/{table}", response_model=schemas.ChangeFeed)
+def read_changes(
+    table: BulkTableName,
+    since: int = Query(0, ge=0, description="`version` from the previous call; 0 loads everything"),
+    limit: int = Query(changes.FEED_PAGE_SIZE, ge=1, le=changes.MAX_FEED_PAGE_SIZE),
+    db: Session = Depends(get_db),
+):
+    return Response(content=dumps(changes.feed(db, table, since, limit)), media_type="application/json")
+
+# ---------------- EVENTS ----------------
+def current_versions():
+    with SessionLocal() as db:
+        return changes.versions(db)
+
+@router.get("/events", response_class=StreamingResponse)
+async def stream_events(
+    tables: Optional[list[Literal["users", "products", "orders", "admin_logs"]]] = Query(
+        None, description="Tables to follow; all of them by default"),
+):
+    # Server-sent events; see app.events. Subscribes before reading the versions sent in
+    # the `ready` event, so no change committed in between is missed.
+    try:
+        subscriber = events.broker.subscribe(tables or events.TABLES)
+    except events.TooManySubscribers as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    try:
+        versions = await run_in_threadpool(current_versions)
+    except Exception:
+        events.broker.unsubscribe(subscriber)
+        raise
+    return StreamingResponse(
+        events.stream(subscriber, {"versions": versions}, dumps),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},  # no proxy buffering
+    )
+
+# ---------------- DASHBOARD ----------------
+@router.get("/dashboard/aggregates", response_model=schemas.DashboardAggregates)
+def read_dashboard_aggregates(
+    period: Literal["day", "week"] = "day",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    top_n: int = Query(10, ge=1, le=100),
+    low_stock_threshold: int = Query(10, ge=0),
+    db: Session = Depends(get_db),
+):
+    return aggregates.dashboard(db, period, date_from, date_to, top_n, low_stock_threshold)
+
+
+# ---------------- ANALYTICS ----------------
+@router.get("/analytics/{report}")
+def read_analytics(
+    report: Literal["revenue", "funnel", "cohorts", "customers", "categories"],
+    period: Literal["day", "week", "month"] = "month",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: int = Query(10, ge=1, le=analytics.MAX_TOP_CUSTOMERS),
+    format: Literal["json", "arrow"] = "json",
+):
+    # Served from the Parquet snapshot; never touches the database
+    try:
+        manifest, table = analytics.run_report(report, period=period, date_from=date_from,
+                                               date_to=date_to, limit=limit)
+    except (analytics.SnapshotMissing, RuntimeError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    headers = {"X-Snapshot-Created-At": manifest["created_at"]}
+    if format == "arrow":
+        return Response(analytics.to_arrow_stream(table), media_type="application/vnd.apache.arrow.stream",
+                        headers=headers)
+    body = {"report": report, "snapshot": {"created_at": manifest["created_at"], "versions": manifest["versions"]},
+            "columns": table.to_pydict()}
+    return Response(dumps(body), media_type="application/json", headers=headers)
+
+# ---------------- ADMIN LOGS ----------------
 @router.get("/admin-logs", response_model=list[schemas.AdminActivityLog])
-def get_logs(db: Session = Depends(get_db)):
-    return crud.get_admin_logs(db)
+def get_logs(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    order: Literal["asc", "desc"] = "desc",
+    admin_name: Optional[str] = None,
+    action: Optional[str] = None,
+    target_table: Optional[str] = None,
+    time_from: Optional[datetime] = None,
+    time_to: Optional[datetime] = None,
+    format: Literal["rows", "columns"] = "rows",
+    db: Session = Depends(get_db),
+):
+    page = PageParams(limit=limit, after=after, order=order, format=format)
+    schema = schemas.AdminActivityLog
+    rows = paginate(response, lambda **kw: crud.get_admin_logs(db, **kw), page, columns=columns_for(schema),
+                    admin_name=admin_name, action=action, target_table=target_table,
+                    time_from=time_from, time_to=time_to)
+    next_cursor = response.headers.get("X-Next-Cursor")
+    return Response(page.encode(schema, rows), media_type="application/json",
+                    headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+@router.get("/admin-logs/archive", response_model=list[schemas.AdminActivityLog])
+def get_archived_logs(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    admin_name: Optional[str] = None,
+    action: Optional[str] = None,
+    target_table: Optional[str] = None,
+    time_from: Optional[datetime] = None,
+    time_to: Optional[datetime] = None,
+):
+    """Logs moved out of the table by the retention job, oldest first."""
+    try:
+        rows, next_cursor = log_archive.query_archive(
+            limit, after, admin_name=admin_name, action=action, target_table=target_table,
+            time_from=time_from, time_to=time_to,
+        )
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+# ---------------- CACHE ----------------
+@router.get("/cache/stats")
+def cache_stats():
+    return response_cache.snapshot()
+
+# ---------------- METRICS ----------------
+@router.get("/metrics", include_in_schema=False)
+def read_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# ---------------- HEALTH ----------------
+@router.get("/health/live", include_in_schema=False)
+async def liveness():
+    # Runs on the event loop, so it only fails when the worker stopped serving
+    return {"status": "alive"}
+
+@router.get("/health/ready", include_in_schema=False)
+def readiness(request: Request, db: Session = Depends(get_db)):
+    problems = []
+    if not request.app.state.ready:
+        problems.append("starting up or shutting down")
+    try:
+        outstanding = migrations.pending(db.connection())
+        db.commit()
+        if outstanding:
+            problems.append(f"{len(outstanding)} schema migrations pending")
+    except SQLAlchemyError as e:
+        problems.append(f"database unavailable: {e.__class__.__name__}")
+    if problems:
+        return JSONResponse({"status": "unavailable", "problems": problems}, status_code=503)
+    return {"status": "ready", "schema_version": migrations.MIGRATIONS[-1].version}
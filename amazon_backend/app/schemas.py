@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional
 from datetime import datetime
 
@@ -17,12 +17,37 @@ class UserCreate(UserBase):
     email: str
     password: str
 
+class UserUpdate(BaseModel):
+    # PATCH body: only the fields sent are changed; required columns cannot be set to null
+    name: str = None
+    email: str = None
+    password: str = None
+    phone_number: Optional[str] = None
+    address: Optional[str] = None
+    role: str = None
+
 class User(UserBase):
     user_id: int
-    password: str
+    version: int
 
     class Config:
-        orm_mode = True
+        from_attributes = True
+
+# ------------------ AUTH ------------------ #
+
+class LoginRequest(BaseModel):
+    email: str
+    password: str
+
+class LoginSession(BaseModel):
+    user_id: int
+    name: str
+    email: str
+    role: str
+    expires_at: datetime
+
+class LoginResponse(LoginSession):
+    token: str
 
 # ------------------ PRODUCT ------------------ #
 
@@ -36,12 +61,40 @@ class ProductBase(BaseModel):
 class ProductCreate(ProductBase):
     seller_id: int
 
+class ProductUpdate(BaseModel):
+    name: str = None
+    description: Optional[str] = None
+    price: float = None
+    stock: int = None
+    category: Optional[str] = None
+    seller_id: int = None
+
 class Product(ProductBase):
     product_id: int
     seller_id: int
+    version: int
 
     class Config:
-        orm_mode = True
+        from_attributes = True
+
+# ------------------ PRODUCT SEARCH ------------------ #
+
+class CategoryFacet(BaseModel):
+    category: Optional[str]
+    count: int
+
+class ProductSearch(BaseModel):
+    query: str
+    total: int  # matches across all pages
+    offset: int
+    limit: int
+    next_offset: Optional[int]
+    results: list[Product]  # best match first
+    facets: list[CategoryFacet]  # matches per category, ignoring the category filter
+
+class ProductSuggestion(BaseModel):
+    product_id: int
+    name: str
 
 # ------------------ ORDER ------------------ #
 
@@ -52,19 +105,155 @@ class OrderBase(BaseModel):
 class OrderCreate(OrderBase):
     user_id: int
 
+class OrderUpdate(BaseModel):
+    user_id: int = None
+    total_amount: float = None
+    status: str = None
+
 class Order(OrderBase):
     id: int
     user_id: int
     order_date: datetime
+    version: int
 
     class Config:
         from_attributes = True
         
 class AdminActivityLog(BaseModel):
+    id: int
     admin_name: str
     action: str
     target_table: str
     timestamp: datetime
+    details: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+# ------------------ ORDER STATUS TRANSITION ------------------ #
+
+class OrderFilter(BaseModel):
+    status: Optional[str] = None
+    user_id: Optional[int] = None
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+
+class OrderStatusTransition(BaseModel):
+    status: str  # the new status
+    ids: Optional[list[int]] = Field(None, min_length=1, max_length=10000)
+    filter: Optional[OrderFilter] = None
+
+    @model_validator(mode="after")
+    def one_selection(self):
+        if (self.ids is None) == (self.filter is None):
+            raise ValueError("Send either `ids` or `filter`.")
+        return self
+
+class OrderStatusTransitionResult(BaseModel):
+    status: str
+    updated: int  # orders matched that were not in `status` already
+
+# ------------------ CHECKOUT ------------------ #
+
+class CheckoutLine(BaseModel):
+    product_id: int
+    quantity: int = Field(gt=0)
+
+class CheckoutRequest(BaseModel):
+    user_id: int
+    items: list[CheckoutLine] = Field(min_length=1)
+    status: Optional[str] = "pending"
+
+class OrderItem(BaseModel):
+    product_id: int
+    quantity: int
+    unit_price: float
 
     class Config:
         from_attributes = True
+
+class OrderWithItems(Order):
+    items: list[OrderItem]
+
+# ------------------ DASHBOARD ------------------ #
+
+class Overview(BaseModel):
+    users: int
+    products: int
+    orders: int
+    revenue: float
+
+class StatusTotal(BaseModel):
+    status: Optional[str]
+    order_count: int
+    revenue: float
+
+class PeriodTotal(BaseModel):
+    period: str
+    order_count: int
+    revenue: float
+
+class TopCustomer(BaseModel):
+    user_id: int
+    name: str
+    email: str
+    order_count: int
+    total_spent: float
+    last_order_date: Optional[datetime] = None
+
+class CustomerStats(BaseModel):
+    user_id: int
+    order_count: int
+    lifetime_value: float
+    last_order_date: Optional[datetime] = None
+
+class LowStockProduct(BaseModel):
+    product_id: int
+    name: str
+    category: Optional[str]
+    stock: int
+
+class CategoryTotal(BaseModel):
+    category: Optional[str]
+    product_count: int
+    total_stock: int
+    stock_value: float
+
+class DashboardAggregates(BaseModel):
+    overview: Overview
+    orders_by_status: list[StatusTotal]
+    orders_by_period: list[PeriodTotal]
+    top_customers: list[TopCustomer]
+    low_stock_products: list[LowStockProduct]
+    products_by_category: list[CategoryTotal]
+
+# ------------------ CHANGE FEED ------------------ #
+
+class ChangeFeed(BaseModel):
+    table: str
+    since: int
+    version: int  # pass as `since` on the next call
+    has_more: bool
+    reset: bool  # history before `since` was pruned: reload from since=0
+    changes: list[dict]  # rows in the table's response schema
+    deleted: list[int]
+
+# ------------------ BULK IMPORT ------------------ #
+
+class ProductImport(ProductCreate):
+    product_id: Optional[int] = None
+
+class OrderImport(OrderCreate):
+    id: Optional[int] = None
+    order_date: Optional[datetime] = None
+
+class BulkRowError(BaseModel):
+    line: int
+    error: str
+
+class BulkImportResult(BaseModel):
+    written: int
+    failed: int
+    errors: list[BulkRowError]
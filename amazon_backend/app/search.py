@@ -0,0 +1,206 @@
+"""Full-text product search.
+
+On SQLite, ``products_fts`` is an FTS5 index over the name, description and
+category of ``products``. It is an external-content table: it stores only the
+index and reads the text from ``products``. Triggers on ``products`` keep it in
+step with every write path (ORM, the Core statements of checkout and bulk
+import, plain SQL). The update trigger only fires when one of the indexed
+columns changes, so stock and price updates never touch the index.
+
+Results are ranked with BM25, with name matches weighted above category and
+description matches. Every search term matches words that start with it
+(``hea`` finds "heels", "headphones"), which is what a typeahead box needs.
+Other databases fall back to a case-insensitive ``LIKE`` scan, which is also
+what benchmarks/bench_search.py compares the index against.
+
+Rebuild or verify the index from the command line::
+
+    python -m app.search rebuild
+    python -m app.search check
+"""
+import re
+import sys
+
+from sqlalchemy import case, func, literal_column, or_, select, table, text
+from sqlalchemy.exc import DatabaseError
+from sqlalchemy.orm import Session
+from app import models, schemas
+from app.serialization import columns_for
+
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 100
+MAX_SEARCH_OFFSET = 10000
+SUGGESTION_LIMIT = 10
+
+# bm25() weights of the indexed columns, in index order
+NAME_WEIGHT, DESCRIPTION_WEIGHT, CATEGORY_WEIGHT = 10.0, 1.0, 2.0
+
+FTS_DDL = [
+    # prefix='2 3' adds prefix indexes for the short prefixes typed first in a typeahead box
+    """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, description, category,
+        content='products', content_rowid='product_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, description, category)
+        VALUES (new.product_id, new.name, new.description, new.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description, category)
+        VALUES ('delete', old.product_id, old.name, old.description, old.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, description, category ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description, category)
+        VALUES ('delete', old.product_id, old.name, old.description, old.category);
+        INSERT INTO products_fts(rowid, name, description, category)
+        VALUES (new.product_id, new.name, new.description, new.category);
+    END""",
+]
+
+Product = models.Product
+
+
+def uses_fts(db: Session) -> bool:
+    return db.get_bind().dialect.name == "sqlite"
+
+
+def initialize(db: Session):
+    """Create the index and its triggers if missing; a new index is filled from ``products``."""
+    if not uses_fts(db):
+        return
+    exists = db.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+    ).first()
+    for statement in FTS_DDL:
+        db.execute(text(statement))
+    if not exists:
+        rebuild(db)
+    db.commit()
+
+
+def rebuild(db: Session):
+    db.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+    db.commit()
+
+
+def check(db: Session) -> bool:
+    """True when the index matches the content of ``products``."""
+    try:
+        db.execute(text("INSERT INTO products_fts(products_fts, rank) VALUES ('integrity-check', 1)"))
+        return True
+    except DatabaseError:
+        return False
+    finally:
+        db.rollback()
+
+
+def terms(query: str) -> list[str]:
+    """Words of a user query; punctuation and FTS5 operators are dropped."""
+    return re.findall(r"\w+", query.lower())
+
+
+def match_expression(words: list[str], prefix: bool = True) -> str:
+    # Quoted, so words like AND/NEAR are searched for instead of parsed as operators
+    return " ".join(f'"{word}"*' if prefix else f'"{word}"' for word in words)
+
+
+def _fts_matches(words, prefix, name_only=False):
+    expression = match_expression(words, prefix)
+    if name_only:
+        expression = f"name : ({expression})"
+    score = f"bm25(products_fts, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT}, {CATEGORY_WEIGHT})"
+    match = (
+        select(literal_column("rowid").label("product_id"), literal_column(score).label("score"))
+        .select_from(table("products_fts"))
+        .where(text("products_fts MATCH :match").bindparams(match=expression))
+        .subquery("matches")
+    )
+    return match, match.c.product_id, match.c.score
+
+
+def _like_matches(words, prefix, name_only=False):
+    # Every word has to occur in one of the columns; name hits rank first
+    searched = (Product.name,) if name_only else (Product.name, Product.description, Product.category)
+    conditions = [or_(*(column.ilike(f"%{word}%") for column in searched)) for word in words]
+    score = case((or_(*(Product.name.ilike(f"%{word}%") for word in words)), 0), else_=1)
+    match = select(Product.product_id, score.label("score")).where(*conditions).subquery("matches")
+    return match, match.c.product_id, match.c.score
+
+
+def search_products(db: Session, query: str, category: str | None = None, limit: int = SEARCH_PAGE_SIZE,
+                    offset: int = 0, prefix: bool = True, use_fts: bool | None = None):
+    """One page of ranked matches for ``query`` with category facets, as a ``ProductSearch`` dict."""
+    words = terms(query)
+    result = {"query": query, "total": 0, "offset": offset, "limit": limit, "next_offset": None,
+              "results": [], "facets": []}
+    if not words:
+        db.commit()
+        return result
+    if use_fts is None:
+        use_fts = uses_fts(db)
+    match, product_id, score = (_fts_matches if use_fts else _like_matches)(words, prefix)
+
+    joined = select().select_from(match).join(Product, Product.product_id == product_id)
+    facets = db.execute(
+        joined.add_columns(Product.category, func.count().label("count"))
+        .group_by(Product.category).order_by(func.count().desc(), Product.category)
+    ).all()
+    if category is not None:
+        joined = joined.where(Product.category == category)
+    total = sum(count for facet, count in facets if category is None or facet == category)
+    rows = db.execute(
+        joined.add_columns(*columns_for(schemas.Product))
+        .order_by(score, Product.product_id).limit(limit).offset(offset)
+    ).all() if offset < total else []
+    db.commit()
+
+    names = tuple(schemas.Product.model_fields)
+    result.update(
+        total=total,
+        next_offset=offset + limit if offset + limit < total else None,
+        results=[dict(zip(names, row)) for row in rows],
+        facets=[{"category": facet, "count": count} for facet, count in facets],
+    )
+    return result
+
+
+def suggest(db: Session, query: str, limit: int = SUGGESTION_LIMIT):
+    """Best matching ``(product_id, name)`` rows for a typeahead box; only names are searched."""
+    words = terms(query)
+    if not words:
+        return []
+    match, product_id, score = (_fts_matches if uses_fts(db) else _like_matches)(words, True, name_only=True)
+    rows = db.execute(
+        select(Product.product_id, Product.name).select_from(match)
+        .join(Product, Product.product_id == product_id)
+        .order_by(score, Product.product_id).limit(limit)
+    ).all()
+    db.commit()
+    return rows
+
+
+def main(argv):
+    from app import migrations
+    from app.database import SessionLocal, engine
+
+    if len(argv) != 1 or argv[0] not in ("rebuild", "check"):
+        print("usage: python -m app.search rebuild|check")
+        return 2
+    migrations.upgrade(engine)
+    with SessionLocal() as db:
+        if not uses_fts(db):
+            print("The search index is only used on SQLite.")
+            return 0
+        initialize(db)
+        if argv[0] == "rebuild":
+            rebuild(db)
+            print("Search index rebuilt.")
+            return 0
+        ok = check(db)
+        print("Search index is consistent." if ok else "Search index is out of date; run rebuild.")
+        return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
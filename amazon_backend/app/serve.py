@@ -0,0 +1,55 @@
+"""Production entry point: migrate once, then serve with one worker process per core.
+
+    python -m app.serve --workers 4 --port 8000
+
+The schema migrations run here, in the parent, before any worker exists, so
+workers never race on schema changes; they start with
+``MIGRATE_ON_STARTUP=0``. The parent then closes its database connections
+and hands over to uvicorn, which starts each worker as a fresh interpreter.
+Each worker imports the app and builds its own engine and connection pool.
+
+Per-process state is made safe for several workers unless configured
+explicitly: login sessions move to the database (``AUTH_SESSION_STORE``),
+the per-process response cache is turned off (``CACHE_BACKEND``; use
+``redis`` to share one) and change events are relayed between the workers
+through the database (``EVENTS_RELAY``). Metrics are per worker.
+
+``/health/live`` answers as long as a worker's event loop runs;
+``/health/ready`` also checks the database and the schema version and fails
+while a worker starts or shuts down.
+"""
+import argparse
+import os
+import sys
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Run the API with several worker processes.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY, help="default: WEB_CONCURRENCY or cores")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    if args.workers > 1:
+        os.environ.setdefault("AUTH_SESSION_STORE", "database")
+        os.environ.setdefault("CACHE_BACKEND", "off")
+        os.environ.setdefault("EVENTS_RELAY", "database")
+    os.environ["MIGRATE_ON_STARTUP"] = "0"  # inherited by the workers
+
+    import uvicorn
+    from app import migrations
+    from app.database import engine
+
+    migrations.upgrade(engine)
+    engine.dispose()  # the workers open their own connections
+
+    uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.workers,
+                log_level=args.log_level, timeout_graceful_shutdown=30)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,299 @@
+"""Incrementally maintained summary tables for order, customer and inventory metrics.
+
+Every order and product mutation passes a snapshot of the row before and after
+the change to ``order_changed``/``product_changed`` inside the same transaction,
+so the summary rows always agree with the base tables once committed.
+
+Order counts and lifetime value per customer are kept the same way. A
+customer's last order date only ever grows through increments; when an order
+is deleted or moved to another customer or date, the customer is recomputed
+from the ``(user_id, order_date)`` index just before the commit, once the
+change has been flushed.
+
+Rebuild or verify the summaries from the command line::
+
+    python -m app.summaries rebuild
+    python -m app.summaries check
+"""
+import sys
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import case, delete, event, func, insert, select, update
+from sqlalchemy.orm import Session
+from app import models
+from app.database import upsert_insert
+
+OrderSnapshot = namedtuple("OrderSnapshot", "day status amount user_id ordered_at")
+ProductSnapshot = namedtuple("ProductSnapshot", "category stock value")
+
+STALE_CUSTOMERS_KEY = "stale_customer_summaries"
+RECOMPUTE_BATCH = 500
+
+CustomerSummary = models.CustomerOrderSummary
+
+
+def snapshot_order(order):
+    if order is None or order.order_date is None:
+        return None
+    return OrderSnapshot(order.order_date.date(), order.status or "", float(order.total_amount or 0),
+                         order.user_id, order.order_date)
+
+
+def snapshot_product(product):
+    if product is None:
+        return None
+    stock = product.stock or 0
+    return ProductSnapshot(product.category or "", stock, stock * float(product.price or 0))
+
+
+def _increment(db: Session, model, keys: dict, deltas: dict):
+    # Atomic "insert or add" so concurrent writers never lose an increment
+    table = model.__table__
+    stmt = upsert_insert(db, table).values(**keys, **deltas)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={name: table.c[name] + stmt.excluded[name] for name in deltas},
+    )
+    db.execute(stmt)
+
+
+def _increment_customer(db: Session, user_id: int, count: int, value: float, last):
+    table = CustomerSummary.__table__
+    stmt = upsert_insert(db, table).values(user_id=user_id, order_count=count, lifetime_value=value,
+                                           last_order_date=last)
+    current, offered = table.c.last_order_date, stmt.excluded.last_order_date
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={
+            "order_count": table.c.order_count + stmt.excluded.order_count,
+            "lifetime_value": table.c.lifetime_value + stmt.excluded.lifetime_value,
+            "last_order_date": case((current.is_(None), offered), (offered > current, offered), else_=current),
+        },
+    )
+    db.execute(stmt)
+
+
+def orders_changed(db: Session, changes):
+    """Apply many (old, new) order snapshot pairs with one upsert per affected key."""
+    deltas = defaultdict(lambda: [0, 0.0])
+    customers = defaultdict(lambda: [0, 0.0, None])
+    stale = set()
+    for old, new in changes:
+        if old == new:
+            continue
+        # A status change leaves the customer's count, value and last order date alone
+        customer_changed = (old is None or new is None or
+                            (old.user_id, old.ordered_at, old.amount) != (new.user_id, new.ordered_at, new.amount))
+        for snapshot, sign in ((old, -1), (new, 1)):
+            if snapshot is not None:
+                delta = deltas[(snapshot.day, snapshot.status)]
+                delta[0] += sign
+                delta[1] += sign * snapshot.amount
+                if customer_changed and snapshot.user_id is not None:
+                    delta = customers[snapshot.user_id]
+                    delta[0] += sign
+                    delta[1] += sign * snapshot.amount
+                    if sign > 0 and (delta[2] is None or snapshot.ordered_at > delta[2]):
+                        delta[2] = snapshot.ordered_at
+        if old is not None and old.user_id is not None and (
+                new is None or (new.user_id, new.ordered_at) != (old.user_id, old.ordered_at)):
+            stale.add(old.user_id)  # this may have been the customer's last order
+    for (day, status), (count, revenue) in deltas.items():
+        if count or revenue:
+            _increment(db, models.OrderDailySummary, {"day": day, "status": status},
+                       {"order_count": count, "revenue": revenue})
+    for user_id, (count, value, last) in customers.items():
+        if count or value or last is not None:
+            _increment_customer(db, user_id, count, value, last)
+    if stale:
+        db.info.setdefault(STALE_CUSTOMERS_KEY, set()).update(stale)
+
+
+def order_changed(db: Session, old: OrderSnapshot | None, new: OrderSnapshot | None):
+    orders_changed(db, [(old, new)])
+
+
+def products_changed(db: Session, changes):
+    """Apply many (old, new) product snapshot pairs with one upsert per affected category."""
+    deltas = defaultdict(lambda: [0, 0, 0.0])
+    for old, new in changes:
+        if old == new:
+            continue
+        for snapshot, sign in ((old, -1), (new, 1)):
+            if snapshot is not None:
+                delta = deltas[snapshot.category]
+                delta[0] += sign
+                delta[1] += sign * snapshot.stock
+                delta[2] += sign * snapshot.value
+    for category, (count, stock, value) in deltas.items():
+        if count or stock or value:
+            _increment(db, models.CategoryInventorySummary, {"category": category},
+                       {"product_count": count, "total_stock": stock, "stock_value": value})
+
+
+def product_changed(db: Session, old: ProductSnapshot | None, new: ProductSnapshot | None):
+    products_changed(db, [(old, new)])
+
+
+# ---------- Last order dates of customers who lost an order ----------
+
+def _latest_order_date(user_id_column):
+    return (select(func.max(models.Order.order_date))
+            .where(models.Order.user_id == user_id_column, models.Order.order_date.is_not(None))
+            .scalar_subquery())
+
+
+@event.listens_for(Session, "before_commit")
+def _recompute_stale_customers(session):
+    stale = session.info.pop(STALE_CUSTOMERS_KEY, None)
+    if not stale:
+        return
+    session.flush()  # the deletes and updates that made them stale
+    user_ids = sorted(stale)
+    for start in range(0, len(user_ids), RECOMPUTE_BATCH):
+        session.execute(
+            update(CustomerSummary)
+            .where(CustomerSummary.user_id.in_(user_ids[start:start + RECOMPUTE_BATCH]))
+            .values(last_order_date=_latest_order_date(CustomerSummary.user_id))
+        )
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_stale_customers(session):
+    session.info.pop(STALE_CUSTOMERS_KEY, None)
+
+
+# ---------- Rebuild and consistency check ----------
+
+def _order_totals_query():
+    day = func.date(models.Order.order_date)
+    status = func.coalesce(models.Order.status, "")
+    return (
+        select(day, status, func.count(), func.coalesce(func.sum(models.Order.total_amount), 0.0))
+        .where(models.Order.order_date.is_not(None))
+        .group_by(day, status)
+    )
+
+
+def _category_totals_query():
+    category = func.coalesce(models.Product.category, "")
+    return (
+        select(
+            category,
+            func.count(),
+            func.coalesce(func.sum(models.Product.stock), 0),
+            func.coalesce(func.sum(models.Product.stock * models.Product.price), 0.0),
+        )
+        .group_by(category)
+    )
+
+
+def _customer_totals_query():
+    Order = models.Order
+    return (
+        select(Order.user_id, func.count(), func.coalesce(func.sum(Order.total_amount), 0.0),
+               func.max(Order.order_date))
+        .where(Order.user_id.is_not(None), Order.order_date.is_not(None))
+        .group_by(Order.user_id)
+    )
+
+
+def _fill_customers(db: Session):
+    db.execute(delete(CustomerSummary))
+    db.execute(insert(CustomerSummary).from_select(
+        [CustomerSummary.user_id, CustomerSummary.order_count, CustomerSummary.lifetime_value,
+         CustomerSummary.last_order_date],
+        _customer_totals_query(),
+    ))
+
+
+def rebuild_customers(db: Session):
+    """Recompute only the per-customer summary."""
+    _fill_customers(db)
+    db.commit()
+
+
+def rebuild(db: Session):
+    """Recompute all summary tables from the base tables in one transaction."""
+    db.execute(delete(models.OrderDailySummary))
+    db.execute(delete(models.CategoryInventorySummary))
+    _fill_customers(db)
+    summary = models.OrderDailySummary
+    db.execute(insert(summary).from_select(
+        [summary.day, summary.status, summary.order_count, summary.revenue],
+        _order_totals_query(),
+    ))
+    summary = models.CategoryInventorySummary
+    db.execute(insert(summary).from_select(
+        [summary.category, summary.product_count, summary.total_stock, summary.stock_value],
+        _category_totals_query(),
+    ))
+    db.commit()
+
+
+def _close(a, b):
+    return abs(float(a) - float(b)) < 0.005
+
+
+def check(db: Session):
+    """Compare the summaries against the base tables; returns a list of mismatches."""
+    problems = []
+
+    expected = {(str(day), status): (count, total)
+                for day, status, count, total in db.execute(_order_totals_query())}
+    stored = {(str(row.day), row.status): (row.order_count, row.revenue)
+              for row in db.scalars(select(models.OrderDailySummary))
+              if row.order_count or abs(row.revenue) >= 0.005}
+    for key in sorted(expected.keys() | stored.keys()):
+        want, got = expected.get(key, (0, 0.0)), stored.get(key, (0, 0.0))
+        if want[0] != got[0] or not _close(want[1], got[1]):
+            problems.append(f"orders {key}: expected {want}, stored {got}")
+
+    expected = {category: (count, stock, value)
+                for category, count, stock, value in db.execute(_category_totals_query())}
+    stored = {row.category: (row.product_count, row.total_stock, row.stock_value)
+              for row in db.scalars(select(models.CategoryInventorySummary))
+              if row.product_count or row.total_stock or abs(row.stock_value) >= 0.005}
+    for key in sorted(expected.keys() | stored.keys()):
+        want, got = expected.get(key, (0, 0, 0.0)), stored.get(key, (0, 0, 0.0))
+        if want[:2] != got[:2] or not _close(want[2], got[2]):
+            problems.append(f"inventory {key!r}: expected {want}, stored {got}")
+
+    expected = {user_id: (count, total, last)
+                for user_id, count, total, last in db.execute(_customer_totals_query())}
+    stored = {row.user_id: (row.order_count, row.lifetime_value, row.last_order_date)
+              for row in db.scalars(select(CustomerSummary))
+              if row.order_count or abs(row.lifetime_value) >= 0.005 or row.last_order_date is not None}
+    for key in sorted(expected.keys() | stored.keys()):
+        want, got = expected.get(key, (0, 0.0, None)), stored.get(key, (0, 0.0, None))
+        if want[0] != got[0] or not _close(want[1], got[1]) or want[2] != got[2]:
+            problems.append(f"customer {key}: expected {want}, stored {got}")
+
+    return problems
+
+
+def main(argv):
+    from app import migrations
+    from app.database import SessionLocal, engine
+
+    if len(argv) != 1 or argv[0] not in ("rebuild", "check"):
+        print("usage: python -m app.summaries rebuild|check")
+        return 2
+    migrations.upgrade(engine)
+    db = SessionLocal()
+    try:
+        if argv[0] == "rebuild":
+            rebuild(db)
+            print("Summary tables rebuilt.")
+            return 0
+        problems = check(db)
+        for problem in problems:
+            print(problem)
+        print(f"{len(problems)} inconsistencies found.")
+        return 1 if problems else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,93 @@
+"""Requests/sec of the sync and async (API_MODE=async) stacks at increasing concurrency.
+
+Run from amazon_backend/::
+
+    python -m benchmarks.bench_async --orders 50000 --concurrency 1,10,50,100,200
+
+Each mode runs in its own process against the same seeded scratch database,
+driven in-process through httpx's ASGI transport.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import seed, summarize_latencies, use_scratch_database
+
+
+async def drive(app, path: str, concurrency: int, total: int):
+    import httpx
+
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+    return {"concurrency": concurrency, "requests": total,
+            "rps": total / elapsed, **summarize_latencies(latencies)}
+
+
+def worker(args):
+    use_scratch_database(args.db)
+    os.environ["API_MODE"] = args.worker
+    from app.main import app
+
+    async def run_levels():
+        # One event loop for all levels: async pool connections are bound to it
+        return [await drive(app, args.path, level, args.requests) for level in args.concurrency]
+
+    print(json.dumps(asyncio.run(run_levels())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--orders", type=int, default=50000)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per concurrency level")
+    parser.add_argument("--concurrency", type=lambda s: [int(n) for n in s.split(",")],
+                        default=[1, 10, 50, 100, 200])
+    parser.add_argument("--path", default="/orders/?limit=50&status=shipped&sort=order_date&order=desc")
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    parser.add_argument("--worker", choices=["sync", "async"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker(args)
+
+    args.db = use_scratch_database()
+    seed(args.users, args.products, args.orders)
+    try:
+        print(f"{'mode':<6} {'conc':>5} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+        for mode in args.modes.split(","):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_async", "--worker", mode, "--db", args.db,
+                 "--path", args.path, "--requests", str(args.requests),
+                 "--concurrency", ",".join(map(str, args.concurrency))],
+                check=True, stdout=subprocess.PIPE, text=True,
+            ).stdout
+            for row in json.loads(output.splitlines()[-1]):
+                print(f"{mode:<6} {row['concurrency']:>5} {row['rps']:>9.1f} "
+                      f"{row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f}")
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Concurrent read-modify-write updates of a few hot products, with and without If-Match.
+
+Run from amazon_backend/::
+
+    python -m benchmarks.bench_contention --writes 1000 --products 5 --concurrency 50
+
+Every writer reads a product (``GET /products/{id}``) and writes it back with
+one more unit of stock (``PUT``). ``blind`` sends the PUT unconditionally, as
+clients did before row versions were checked: writers that read the same
+version overwrite each other, and the lost increments show up as stock
+missing at the end. ``if-match`` sends the version it read; a stale write is
+refused with 409 and the writer reads again and retries, so no increment is
+lost.
+
+For each strategy the script prints the responses, the retries, the lost
+increments and the SQL statements per PUT and per applied increment (counted
+on the engine, including the GETs and the retries), and checks the summary
+tables. It exits non-zero when ``if-match`` lost an update.
+"""
+import argparse
+import asyncio
+import contextvars
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+from benchmarks.common import seed, summarize_latencies, use_scratch_database
+
+STRATEGIES = ["blind", "if-match"]
+
+phase = contextvars.ContextVar("phase", default="other")
+
+
+async def drive(app, strategy: str, product_ids, concurrency: int, retries: int):
+    import httpx
+
+    latencies, statuses, applied = [], Counter(), Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    # The ASGI transport runs the app in the caller's task, so ``phase`` reaches the engine hook
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://contention") as client:
+
+        async def one(product_id):
+            async with semaphore:
+                started = time.perf_counter()
+                for _ in range(retries + 1):
+                    phase.set("read")
+                    product = (await client.get(f"/products/{product_id}")).json()
+                    body = {key: product[key] for key in ("name", "description", "price", "category", "seller_id")}
+                    body["stock"] = product["stock"] + 1
+                    headers = {"If-Match": f'"{product["version"]}"'} if strategy == "if-match" else {}
+                    phase.set("write")
+                    response = await client.put(f"/products/{product_id}", json=body, headers=headers)
+                    statuses[response.status_code] += 1
+                    if response.status_code != 409:
+                        break
+                latencies.append(time.perf_counter() - started)
+                if response.status_code == 200:
+                    applied[product_id] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(product_id) for product_id in product_ids))
+        elapsed = time.perf_counter() - started
+    return statuses, applied, elapsed, latencies
+
+
+def reset_stock(products: int, stock: int):
+    from sqlalchemy import update
+    from app import models, summaries
+    from app.database import SessionLocal
+
+    with SessionLocal() as db:
+        db.execute(update(models.Product).values(stock=stock))
+        db.commit()
+        summaries.rebuild(db)
+    return {product_id: stock for product_id in range(1, products + 1)}
+
+
+def final_stock(product_ids):
+    from sqlalchemy import select
+    from app import models, summaries
+    from app.database import SessionLocal
+
+    with SessionLocal() as db:
+        stock = dict(db.execute(
+            select(models.Product.product_id, models.Product.stock)
+            .where(models.Product.product_id.in_(product_ids))
+        ).all())
+        problems = summaries.check(db)
+        db.commit()
+    return stock, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writes", type=int, default=1000, help="increments per strategy")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--products", type=int, default=5, help="hot products the writers compete for")
+    parser.add_argument("--retries", type=int, default=20, help="re-reads after a 409 before giving up")
+    parser.add_argument("--strategies", default=",".join(STRATEGIES))
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    path = use_scratch_database()
+    os.environ["API_MODE"] = args.mode
+    os.environ.setdefault("CACHE_BACKEND", "off")
+    seed(users=200, products=args.products, orders=0)
+    from sqlalchemy import event
+    from app.async_database import async_engine
+    from app.database import engine
+    from app.main import app
+
+    statements = Counter()
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements[phase.get()] += 1
+
+    for target in (engine, async_engine.sync_engine):
+        event.listen(target, "before_cursor_execute", count)
+
+    rng = random.Random(args.seed)
+    failed = False
+    try:
+        for strategy in args.strategies.split(","):
+            initial = reset_stock(args.products, 100)
+            product_ids = [rng.randrange(1, args.products + 1) for _ in range(args.writes)]
+            statements.clear()
+            statuses, applied, elapsed, latencies = asyncio.run(
+                drive(app, strategy, product_ids, args.concurrency, args.retries))
+            stock, problems = final_stock(list(initial))
+            lost = sum(initial[p] + applied[p] - stock[p] for p in initial)
+            puts = sum(statuses.values())
+            stats = summarize_latencies(latencies)
+
+            print(f"{strategy}: {args.writes} increments in {elapsed:.2f}s ({args.writes / elapsed:.1f}/s), "
+                  f"p50 {stats['p50_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms")
+            print("  PUT responses: " + ", ".join(f"{status}: {n}" for status, n in sorted(statuses.items())) +
+                  f"; retries {puts - args.writes}")
+            print(f"  applied {sum(applied.values())}, lost {lost}")
+            print(f"  statements per PUT {statements['write'] / puts:.2f}, per applied increment "
+                  f"{(statements['read'] + statements['write']) / max(1, sum(applied.values()) - lost):.2f} "
+                  f"(reads included)")
+            for problem in problems:
+                print(f"  FAIL {problem}")
+            if strategy == "if-match" and lost:
+                print("  FAIL updates were lost")
+            failed = failed or bool(problems) or (strategy == "if-match" and lost > 0)
+        return 1 if failed else 0
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
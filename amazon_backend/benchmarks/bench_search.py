@@ -0,0 +1,101 @@
+"""Product search latency: the FTS5 index vs. a LIKE scan over the same products.
+
+Run from amazon_backend/::
+
+    python -m benchmarks.bench_search --products 100000 --queries 200
+
+Products get names and descriptions drawn from a small vocabulary, then the
+same random queries (whole words, 2-4 letter typeahead prefixes and two-word
+queries) run through ``app.search.search_products`` once with the index and
+once with ``use_fts=False``. Both paths return a ranked first page plus the
+category facets. Note that LIKE matches substrings anywhere in a word, so its
+totals are a superset of the index's word-prefix matches.
+"""
+import argparse
+import os
+import random
+import time
+
+from benchmarks.common import seed, summarize_latencies, use_scratch_database
+
+ADJECTIVES = ["red", "blue", "wireless", "leather", "organic", "compact", "vintage", "smart", "steel",
+              "wooden", "portable", "classic", "deluxe", "mini", "heavy", "soft", "waterproof", "silver"]
+NOUNS = ["headphones", "heels", "kettle", "lamp", "backpack", "charger", "novel", "sneakers", "blender",
+         "watch", "jacket", "puzzle", "camera", "mug", "speaker", "tent", "keyboard", "shampoo", "ring"]
+FILLER = ["great", "for", "everyday", "use", "with", "warranty", "gift", "idea", "durable", "design",
+          "home", "travel", "office", "kids", "new", "edition", "pack", "of", "two", "premium"]
+
+
+def describe(products: int, rng: random.Random):
+    from sqlalchemy import bindparam, update
+    from app import models
+    from app.database import engine
+
+    rows = [{
+        "pid": i,
+        "name": f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}",
+        "description": " ".join(rng.choices(FILLER + ADJECTIVES + NOUNS, k=rng.randint(5, 20))),
+    } for i in range(1, products + 1)]
+    stmt = (update(models.Product).where(models.Product.product_id == bindparam("pid"))
+            .values(name=bindparam("name"), description=bindparam("description")))
+    with engine.begin() as conn:
+        conn.execute(stmt, rows)
+
+
+def make_queries(count: int, rng: random.Random):
+    words = ADJECTIVES + NOUNS
+    queries = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.4:
+            queries.append(rng.choice(words))
+        elif kind < 0.8:
+            word = rng.choice(words)
+            queries.append(word[:rng.randint(2, 4)])
+        else:
+            queries.append(f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)[:3]}")
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--page-size", type=int, default=20)
+    args = parser.parse_args()
+
+    path = use_scratch_database()
+    seed(users=1000, products=args.products, orders=0)
+    rng = random.Random(0)
+    describe(args.products, rng)
+    from app import search
+    from app.database import SessionLocal
+
+    try:
+        with SessionLocal() as db:
+            started = time.perf_counter()
+            search.initialize(db)
+            print(f"indexed {args.products} products in {time.perf_counter() - started:.2f}s")
+            queries = make_queries(args.queries, rng)
+            print(f"{'path':<6} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'matches/query':>14} {'speedup':>8}")
+            results = {}
+            for name, use_fts in (("like", False), ("fts", True)):
+                latencies, matches = [], 0
+                for query in queries:
+                    started = time.perf_counter()
+                    page = search.search_products(db, query, limit=args.page_size, use_fts=use_fts)
+                    latencies.append(time.perf_counter() - started)
+                    matches += page["total"]
+                results[name] = (summarize_latencies(latencies), matches / len(queries))
+            baseline = results["like"][0]["mean_ms"]
+            for name, (stats, matches) in results.items():
+                print(f"{name:<6} {stats['mean_ms']:>9.2f} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} "
+                      f"{matches:>14,.0f} {baseline / stats['mean_ms']:>7.1f}x")
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Rows/sec of list serialization: ORM objects through Pydantic vs. column tuples to JSON.
+
+Run from amazon_backend/::
+
+    python -m benchmarks.bench_serialization --orders 50000 --page-size 1000
+
+``pydantic`` is what a ``response_model=list[Schema]`` endpoint returning ORM
+objects costs: load full entities, validate them into the schema and dump JSON.
+``columns`` is the path the list endpoints use: select the schema's columns
+and encode the tuples directly (``app.serialization``). Both walk the whole
+table page by page; the two outputs are compared so the contract is unchanged.
+"""
+import argparse
+import json
+import os
+import time
+
+from benchmarks.common import seed, use_scratch_database
+
+
+def walk(fetch, encode, page_size: int):
+    """Fetch and encode every page; returns (rows, seconds, encoded pages)."""
+    rows, pages, after = 0, [], None
+    started = time.perf_counter()
+    while True:
+        page, after = fetch(limit=page_size, after=after)
+        pages.append(encode(page))
+        rows += len(page)
+        if after is None:
+            return rows, time.perf_counter() - started, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--orders", type=int, default=50000)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs per path")
+    args = parser.parse_args()
+
+    path = use_scratch_database()
+    seed(args.users, args.products, args.orders)
+    from pydantic import TypeAdapter
+    from app import crud, schemas, serialization
+    from app.database import SessionLocal
+
+    tables = [
+        ("users", crud.get_users, schemas.User),
+        ("products", crud.get_products, schemas.Product),
+        ("orders", crud.get_orders, schemas.Order),
+    ]
+    try:
+        print(f"{'table':<9} {'path':<9} {'rows':>7} {'rows/s':>11} {'speedup':>8}")
+        with SessionLocal() as db:
+            for table, get, schema in tables:
+                adapter = TypeAdapter(list[schema])
+                paths = {
+                    "pydantic": (lambda **kw: get(db, **kw),
+                                 lambda page: adapter.dump_json(adapter.validate_python(page, from_attributes=True))),
+                    "columns": (lambda **kw: get(db, columns=serialization.columns_for(schema), **kw),
+                                lambda page: serialization.encode_rows(schema, page)),
+                }
+                results = {}
+                for name, (fetch, encode) in paths.items():
+                    runs = [walk(fetch, encode, args.page_size) for _ in range(args.repeat)]
+                    rows, seconds, pages = min(runs, key=lambda run: run[1])
+                    results[name] = (rows, seconds, [json.loads(p) for p in pages])
+                if results["pydantic"][2] != results["columns"][2]:
+                    raise SystemExit(f"{table}: column path output differs from the schema output")
+                baseline = results["pydantic"][0] / results["pydantic"][1]
+                for name, (rows, seconds, _) in results.items():
+                    rate = rows / seconds
+                    print(f"{table:<9} {name:<9} {rows:>7} {rate:>11,.0f} {rate / baseline:>7.2f}x")
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Concurrent checkouts against a few low-stock products; fails on any oversell.
+
+Run from amazon_backend/::
+
+    python -m benchmarks.stress_checkout --checkouts 500 --products 5 --stock 40
+
+Every checkout asks for 1-3 units of one or two of the hot products, so most
+of them race for the same rows and many must be refused with 409. Afterwards
+the script checks that each product's stock went down by exactly the units
+sold and never below zero, that every order's total equals the sum of its
+lines, and that the dashboard summaries still match the base tables. It exits
+non-zero when any of these is violated.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+from benchmarks.common import seed, summarize_latencies, use_scratch_database
+
+
+async def drive(app, bodies, concurrency: int):
+    import httpx
+
+    latencies, statuses = [], Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    # The ASGI transport does not send lifespan events; run the app's own startup and shutdown
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://stress") as client:
+
+        async def one(body):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/orders/checkout", json=body)
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status_code] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(body) for body in bodies))
+        elapsed = time.perf_counter() - started
+    return statuses, elapsed, latencies
+
+
+def verify(initial_stock):
+    from sqlalchemy import func, select
+    from app import models, summaries
+    from app.database import SessionLocal
+
+    problems = []
+    with SessionLocal() as db:
+        sold = dict(db.execute(
+            select(models.OrderItem.product_id, func.sum(models.OrderItem.quantity))
+            .group_by(models.OrderItem.product_id)
+        ).all())
+        final = dict(db.execute(
+            select(models.Product.product_id, models.Product.stock)
+            .where(models.Product.product_id.in_(initial_stock))
+        ).all())
+        for product_id, stock in initial_stock.items():
+            if final[product_id] < 0:
+                problems.append(f"product {product_id}: negative stock {final[product_id]}")
+            if stock - sold.get(product_id, 0) != final[product_id]:
+                problems.append(f"product {product_id}: {stock} - {sold.get(product_id, 0)} sold "
+                                f"!= {final[product_id]} left")
+        line_totals = select(
+            models.OrderItem.order_id,
+            func.round(func.sum(models.OrderItem.quantity * models.OrderItem.unit_price), 2).label("total"),
+        ).group_by(models.OrderItem.order_id).subquery()
+        for order_id, total_amount, lines_total in db.execute(
+            select(models.Order.id, models.Order.total_amount, line_totals.c.total)
+            .join(line_totals, line_totals.c.order_id == models.Order.id)
+        ):
+            if abs(total_amount - lines_total) >= 0.005:
+                problems.append(f"order {order_id}: total {total_amount} != lines {lines_total}")
+        problems.extend(summaries.check(db))
+        db.commit()
+    return problems, sum(sold.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkouts", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--products", type=int, default=5, help="hot products the checkouts compete for")
+    parser.add_argument("--stock", type=int, default=40, help="initial stock of each hot product")
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    path = use_scratch_database()
+    os.environ["API_MODE"] = args.mode
+    seed(users=200, products=args.products, orders=0)
+    from sqlalchemy import update
+    from app import models, summaries
+    from app.database import SessionLocal
+    from app.main import app
+
+    with SessionLocal() as db:
+        db.execute(update(models.Product).values(stock=args.stock))
+        db.commit()
+        summaries.rebuild(db)
+    initial_stock = {product_id: args.stock for product_id in range(1, args.products + 1)}
+
+    rng = random.Random(args.seed)
+    bodies = [{
+        "user_id": rng.randrange(1, 201),
+        "items": [{"product_id": product_id, "quantity": rng.randint(1, 3)}
+                  for product_id in rng.sample(sorted(initial_stock), k=min(len(initial_stock), rng.randint(1, 2)))],
+    } for _ in range(args.checkouts)]
+
+    try:
+        statuses, elapsed, latencies = asyncio.run(drive(app, bodies, args.concurrency))
+        problems, units_sold = verify(initial_stock)
+        stats = summarize_latencies(latencies)
+        print(f"{args.checkouts} checkouts in {elapsed:.2f}s ({args.checkouts / elapsed:.1f}/s), "
+              f"p50 {stats['p50_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms")
+        print("responses: " + ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items())))
+        print(f"units sold: {units_sold} of {sum(initial_stock.values())}")
+        unexpected = set(statuses) - {200, 409}
+        if unexpected:
+            problems.append(f"unexpected response statuses {sorted(unexpected)}")
+        for problem in problems:
+            print(f"FAIL {problem}")
+        print("OK" if not problems else f"{len(problems)} problems")
+        return 1 if problems else 0
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""Endpoint load test and crud micro-benchmarks with JSON results for comparing runs.
+
+Run from amazon_backend/::
+
+    python -m benchmarks.suite run --scale 100k --out results/baseline.json
+    # ...change something...
+    python -m benchmarks.suite run --scale 100k --out results/candidate.json
+    python -m benchmarks.suite compare results/baseline.json results/candidate.json
+
+``run`` seeds a scratch SQLite database with ``--scale`` orders (users and
+products scale along: one user per 10 orders, one product per 5), or reuses
+the database given with ``--db``, which is kept. Every endpoint scenario
+is then driven in-process through httpx's ASGI transport at ``--concurrency``.
+Each scenario reports latency percentiles, requests/sec, the error count
+(responses with an unexpected status, 5xx included) and the peak Python
+memory allocated while serving a few extra requests under tracemalloc.
+Exceptions raised by the app are served as 500s, so they are counted as
+errors of their scenario and the run goes on. The crud functions behind
+the endpoints are timed directly. The response cache is off unless
+``--cache`` is given, so reads measure the database path.
+
+``compare`` prints the change of every shared metric and exits non-zero when
+a p50/p95 latency or a throughput got worse by more than ``--threshold``.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime
+
+from benchmarks.common import CATEGORIES, STATUSES, seed, summarize_latencies, use_scratch_database
+
+# path_and_body(i, rng, scale) -> (path, json body or None); ``requests`` overrides --requests
+Scenario = namedtuple("Scenario", "name method path_and_body requests ok", defaults=(None, (200,)))
+Scale = namedtuple("Scale", "users products orders")
+
+
+def parse_count(text: str) -> int:
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    text = text.strip().lower()
+    if text[-1] in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1]])
+    return int(text)
+
+
+def scale_for(orders: int) -> Scale:
+    return Scale(users=max(orders // 10, 100), products=max(orders // 5, 100), orders=orders)
+
+
+def _new_user(i, rng, scale):
+    user_id = scale.users + 1_000_000 + i
+    return "/users/", {"user_id": user_id, "name": f"bench {user_id}", "email": f"bench{user_id}@example.com",
+                       "password": "secret", "phone_number": None, "address": None, "role": "customer"}
+
+
+def _product_body(rng, scale):
+    return {"name": f"product {rng.randrange(scale.products)}", "description": None,
+            "price": round(rng.uniform(1, 500), 2), "stock": rng.randrange(0, 200),
+            "category": rng.choice(CATEGORIES), "seller_id": rng.randrange(1, scale.users + 1)}
+
+
+SCENARIOS = [
+    Scenario("list_users", "GET", lambda i, rng, s: ("/users/?limit=50&role=customer", None)),
+    Scenario("list_products", "GET", lambda i, rng, s: (
+        f"/products/?limit=50&category={rng.choice(CATEGORIES)}&sort=price", None)),
+    Scenario("list_orders", "GET", lambda i, rng, s: (
+        f"/orders/?limit=50&status={rng.choice(STATUSES)}&sort=order_date&order=desc", None)),
+    Scenario("orders_by_user", "GET", lambda i, rng, s: (f"/orders/user/{rng.randrange(1, s.users + 1)}", None)),
+    Scenario("search_products", "GET", lambda i, rng, s: (f"/products/search?q=product {rng.randrange(100)}", None)),
+    Scenario("suggest_products", "GET", lambda i, rng, s: (f"/products/suggest?q=pro", None)),
+    Scenario("change_feed", "GET", lambda i, rng, s: ("/changes/orders?since=0&limit=1000", None)),
+    Scenario("dashboard", "GET", lambda i, rng, s: ("/dashboard/aggregates", None), requests=100),
+    Scenario("admin_logs", "GET", lambda i, rng, s: ("/admin-logs?limit=100", None)),
+    Scenario("create_user", "POST", _new_user),
+    Scenario("create_order", "POST", lambda i, rng, s: ("/orders/", {
+        "user_id": rng.randrange(1, s.users + 1), "total_amount": round(rng.uniform(5, 900), 2),
+        "status": "pending"})),
+    Scenario("checkout", "POST", lambda i, rng, s: ("/orders/checkout", {
+        "user_id": rng.randrange(1, s.users + 1),
+        "items": [{"product_id": rng.randrange(1, s.products + 1), "quantity": 1}]}), ok=(200, 409)),
+    Scenario("update_product", "PUT", lambda i, rng, s: (
+        f"/products/{rng.randrange(1, s.products + 1)}", _product_body(rng, s))),
+    Scenario("patch_order", "PATCH", lambda i, rng, s: (
+        f"/orders/{rng.randrange(1, s.orders + 1)}", {"status": rng.choice(STATUSES)})),
+    Scenario("bulk_status", "POST", lambda i, rng, s: ("/orders/status", {
+        "status": rng.choice(STATUSES), "ids": rng.sample(range(1, s.orders + 1), min(100, s.orders))}),
+        requests=50),
+    # Deletes walk down from the highest seeded order id so every request removes a row
+    Scenario("delete_order", "DELETE", lambda i, rng, s: (f"/orders/{s.orders - i}", None)),
+]
+
+
+async def drive(client, scenario: Scenario, scale: Scale, total: int, concurrency: int, rng, offset: int):
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        nonlocal errors
+        path, body = scenario.path_and_body(offset + i, rng, scale)
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.request(scenario.method, path, json=body)
+            latencies.append(time.perf_counter() - started)
+        if response.status_code not in scenario.ok:
+            errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def asgi_client(app):
+    import httpx
+
+    # An exception in the app becomes a 500 that counts as an error instead of ending the run
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    return httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None)
+
+
+async def run_endpoints(app, scale: Scale, args):
+    results = {}
+    rng = random.Random(args.seed)
+    # The ASGI transport does not send lifespan events; run the app's own startup and shutdown
+    async with app.router.lifespan_context(app), asgi_client(app) as client:
+        for scenario in SCENARIOS:
+            if args.only and scenario.name not in args.only:
+                continue
+            total = min(scenario.requests or args.requests, args.requests)
+            offset = 0
+            await drive(client, scenario, scale, args.warmup, args.concurrency, rng, offset)
+            offset += args.warmup
+            latencies, errors, elapsed = await drive(client, scenario, scale, total, args.concurrency, rng, offset)
+            offset += total
+
+            tracemalloc.start()
+            await drive(client, scenario, scale, args.memory_requests, 1, rng, offset)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            results[scenario.name] = {
+                "method": scenario.method, "requests": total, "errors": errors,
+                "rps": total / elapsed, **summarize_latencies(latencies), "peak_kib": peak / 1024,
+            }
+            row = results[scenario.name]
+            print(f"{scenario.name:<18} {row['rps']:>9.1f} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+                  f"{row['p99_ms']:>8.2f} {row['peak_kib']:>9.0f} {errors:>6}")
+    return results
+
+
+def time_calls(call, repeat: int):
+    call()  # warm up
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    return {"calls": repeat, "ops_per_s": repeat / sum(samples), **summarize_latencies(samples)}
+
+
+def run_crud(scale: Scale, args):
+    from app import aggregates, changes, crud, schemas, search
+    from app.database import SessionLocal
+    from app.serialization import columns_for
+
+    rng = random.Random(args.seed)
+    user = columns_for(schemas.User)
+    product = columns_for(schemas.Product)
+    order = columns_for(schemas.Order)
+    benchmarks = {
+        "get_users": lambda db: crud.get_users(db, limit=50, role="customer", columns=user),
+        "get_products": lambda db: crud.get_products(db, limit=50, category=rng.choice(CATEGORIES),
+                                                     sort="price", columns=product),
+        "get_orders": lambda db: crud.get_orders(db, limit=50, status=rng.choice(STATUSES),
+                                                 sort="order_date", descending=True, columns=order),
+        "get_orders_by_user": lambda db: crud.get_orders_by_user(db, rng.randrange(1, scale.users + 1),
+                                                                 columns=order),
+        "get_user_by_email": lambda db: crud.get_user_by_email(db, f"user{rng.randrange(1, scale.users + 1)}"
+                                                                   "@example.com"),
+        "search_products": lambda db: search.search_products(db, f"product {rng.randrange(100)}"),
+        "change_feed": lambda db: changes.feed(db, "orders", 0, 1000),
+        "dashboard": lambda db: aggregates.dashboard(db),
+        "patch_order": lambda db: crud.patch_order(db, rng.randrange(1, scale.orders // 2),
+                                                   schemas.OrderUpdate(status=rng.choice(STATUSES))),
+        "update_product": lambda db: crud.update_product(db, rng.randrange(1, scale.products + 1),
+                                                         schemas.ProductCreate(**_product_body(rng, scale))),
+    }
+    results = {}
+    with SessionLocal() as db:
+        for name, call in benchmarks.items():
+            if args.only and name not in args.only:
+                continue
+            results[name] = time_calls(lambda: call(db), args.crud_repeat)
+            row = results[name]
+            print(f"{name:<18} {row['ops_per_s']:>9.1f} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+                  f"{row['p99_ms']:>8.2f}")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    scale = scale_for(parse_count(args.scale))
+    path = use_scratch_database(args.db)
+    fresh = args.db is None or not os.path.exists(args.db)
+    if not args.cache:
+        os.environ["CACHE_BACKEND"] = "off"
+    os.environ["API_MODE"] = args.mode
+    if fresh:
+        started = time.perf_counter()
+        seed(scale.users, scale.products, scale.orders, seed_value=args.seed)
+        print(f"seeded {sum(scale)} rows in {time.perf_counter() - started:.1f}s")
+    else:
+        from sqlalchemy import func, select
+        from app import models
+        from app.database import SessionLocal
+        with SessionLocal() as db:
+            scale = Scale(*(db.scalar(select(func.count()).select_from(model))
+                            for model in (models.User, models.Product, models.Order)))
+    from app.main import app
+    import sqlalchemy
+
+    try:
+        result = {
+            "meta": {
+                "started": datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+                "python": platform.python_version(), "sqlalchemy": sqlalchemy.__version__,
+                "platform": platform.platform(), "mode": args.mode, "cache": args.cache,
+                "rows": scale._asdict(), "concurrency": args.concurrency, "requests": args.requests,
+            },
+        }
+        print(f"{'endpoint':<18} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak KiB':>9} "
+              f"{'errors':>6}")
+        result["endpoints"] = asyncio.run(run_endpoints(app, scale, args))
+        print(f"\n{'crud':<18} {'ops/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        result["crud"] = run_crud(scale, args)
+    finally:
+        if args.db is None:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nwrote {args.out}")
+    return 0
+
+
+# (metric, True when higher is better)
+COMPARED = [("p50_ms", False), ("p95_ms", False), ("rps", True), ("ops_per_s", True)]
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    for key in ("rows", "mode", "cache", "concurrency"):
+        if baseline["meta"][key] != candidate["meta"][key]:
+            print(f"warning: runs differ in {key}: {baseline['meta'][key]} vs {candidate['meta'][key]}")
+    regressions = 0
+    print(f"{'benchmark':<28} {'metric':<10} {'baseline':>10} {'candidate':>10} {'change':>8}")
+    for section in ("endpoints", "crud"):
+        for name in sorted(baseline.get(section, {}).keys() & candidate.get(section, {}).keys()):
+            old, new = baseline[section][name], candidate[section][name]
+            for metric, higher_is_better in COMPARED:
+                if metric not in old or not old[metric]:
+                    continue
+                change = new[metric] / old[metric] - 1
+                worse = -change if higher_is_better else change
+                flag = ""
+                if worse > args.threshold:
+                    flag = "  REGRESSION"
+                    regressions += 1
+                print(f"{section + '.' + name:<28} {metric:<10} {old[metric]:>10.2f} {new[metric]:>10.2f} "
+                      f"{change:>+7.1%}{flag}")
+    print(f"\n{regressions} regressions beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="seed a database and run the benchmarks")
+    run_parser.add_argument("--scale", default="10k", help="orders to seed, e.g. 10k, 1m, 10m")
+    run_parser.add_argument("--db", help="SQLite file to reuse (seeded if missing) instead of a scratch one")
+    run_parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    run_parser.add_argument("--cache", action="store_true", help="keep the response cache on")
+    run_parser.add_argument("--requests", type=int, default=500, help="measured requests per endpoint")
+    run_parser.add_argument("--warmup", type=int, default=20)
+    run_parser.add_argument("--concurrency", type=int, default=10)
+    run_parser.add_argument("--memory-requests", type=int, default=10, help="requests traced for peak memory")
+    run_parser.add_argument("--crud-repeat", type=int, default=200, help="calls per crud micro-benchmark")
+    run_parser.add_argument("--only", type=lambda s: set(s.split(",")), help="comma separated benchmark names")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--out", help="write the results as JSON")
+
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown, 0.10 = 10%%")
+
+    args = parser.parse_args()
+    return run(args) if args.command == "run" else compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""Shared fixtures: every test runs against a freshly migrated SQLite file.
+
+The engine is created when ``app.database`` is imported, so the database URL
+and the settings read at import time are set here, before any app module.
+"""
+import os
+import tempfile
+
+DB_DIR = tempfile.mkdtemp(prefix="amazon-tests-")
+DB_PATH = os.path.join(DB_DIR, "test.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.setdefault("AUTH_PBKDF2_ITERATIONS", "1000")  # keeps user writes fast
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app import auth, cache, migrations, models
+from app.database import SessionLocal, engine
+from app.main import app
+
+
+@pytest.fixture(autouse=True)
+def database():
+    """A new, migrated database file and empty process-wide caches for each test."""
+    engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(DB_PATH + suffix):
+            os.remove(DB_PATH + suffix)
+    migrations.upgrade(engine, log=lambda *args: None)
+    cache.response_cache.backend = cache.create_backend("memory")
+    auth.sessions = auth.create_session_store("memory")
+    yield
+    engine.dispose()
+
+
+@pytest.fixture
+def db():
+    with SessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+def client():
+    # Not entered as a context manager: the lifespan would start the audit writer,
+    # and entries are easier to assert on when they are written at commit
+    return TestClient(app)
+
+
+def create_user(client, user_id, role="customer", password="secret"):
+    return client.post("/users/", json={
+        "user_id": user_id, "name": f"user{user_id}", "email": f"user{user_id}@example.com",
+        "password": password, "phone_number": None, "address": None, "role": role,
+    }).json()
+
+
+def create_product(client, seller_id, stock=10, price=5.0, category="books", name=None):
+    return client.post("/products/", json={
+        "name": name or f"product of {seller_id}", "description": "", "price": price,
+        "stock": stock, "category": category, "seller_id": seller_id,
+    }).json()
+
+
+def create_order(client, user_id, total_amount=20.0, status="pending"):
+    return client.post("/orders/", json={"user_id": user_id, "total_amount": total_amount,
+                                         "status": status}).json()
+
+
+def admin_logs(db, action=None):
+    Log = models.AdminActivityLog
+    stmt = select(Log).order_by(Log.id)
+    if action is not None:
+        stmt = stmt.where(Log.action == action)
+    rows = db.scalars(stmt).all()
+    db.commit()
+    return rows
@@ -0,0 +1,89 @@
+import asyncio
+import warnings
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import async_crud, auth, models, schemas
+from app.async_database import create_async_db_engine
+from tests.conftest import create_user
+
+
+def _on_event_loop():
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+@pytest.fixture
+def session_calls(monkeypatch):
+    """Records, per session store call, whether it ran on an event loop thread."""
+    calls = []
+    for name in ("issue", "revoke_user"):
+        original = getattr(auth.sessions, name)
+
+        def recording(*args, _name=name, _original=original):
+            calls.append((_name, _on_event_loop()))
+            return _original(*args)
+
+        monkeypatch.setattr(auth.sessions, name, recording)
+    return calls
+
+
+def test_login_issues_the_session_off_the_event_loop(client, session_calls):
+    create_user(client, 1, password="secret")
+    response = client.post("/auth/login", json={"email": "user1@example.com", "password": "secret"})
+    assert response.status_code == 200
+    assert client.get("/auth/session", headers={"Authorization": f"Bearer {response.json()['token']}"}
+                      ).json()["user_id"] == 1
+    assert session_calls == [("issue", False)]
+
+
+def test_changing_a_user_ends_their_sessions(client):
+    create_user(client, 1, password="secret")
+    token = client.post("/auth/login", json={"email": "user1@example.com", "password": "secret"}).json()["token"]
+    client.patch("/users/1", json={"password": "other"})
+    assert client.get("/auth/session", headers={"Authorization": f"Bearer {token}"}).status_code == 401
+
+
+def test_async_user_writes_revoke_sessions_off_the_event_loop(client, session_calls):
+    create_user(client, 1)
+
+    async def write():
+        engine = create_async_db_engine()
+        try:
+            async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("error", DeprecationWarning)
+                    await async_crud.patch_user(db, 1, schemas.UserUpdate(password="changed"))
+                await async_crud.patch_user(db, 1, schemas.UserUpdate())  # changes nothing
+                await async_crud.delete_user(db, 1)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(write())
+    assert session_calls == [("revoke_user", False), ("revoke_user", False)]
+
+
+def test_async_patch_hashes_the_password_off_the_event_loop(client, db, monkeypatch):
+    create_user(client, 1)
+    hashed_on_loop = []
+    original = auth.hash_password
+    monkeypatch.setattr(auth, "hash_password", lambda *args: (
+        hashed_on_loop.append(_on_event_loop()), original(*args))[1])
+
+    async def patch():
+        engine = create_async_db_engine()
+        try:
+            async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+                await async_crud.patch_user(session, 1, schemas.UserUpdate(password="changed"))
+        finally:
+            await engine.dispose()
+
+    asyncio.run(patch())
+    assert hashed_on_loop == [False]
+    stored = db.get(models.User, 1).password
+    db.commit()
+    assert auth.verify_password("changed", stored)
@@ -0,0 +1,40 @@
+import asyncio
+import random
+
+from fastapi import FastAPI
+from sqlalchemy import func, select
+
+from app import auth, changes, models, summaries
+from benchmarks import common, suite
+
+
+def test_app_exceptions_count_as_scenario_errors():
+    app = FastAPI()
+
+    @app.get("/fails/{i}")
+    def fails(i: int):
+        if i % 2:
+            raise RuntimeError("boom")
+        return {}
+
+    scenario = suite.Scenario("fails", "GET", lambda i, rng, scale: (f"/fails/{i}", None))
+
+    async def drive():
+        async with suite.asgi_client(app) as client:
+            return await suite.drive(client, scenario, suite.scale_for(10), 6, 2, random.Random(0), 0)
+
+    latencies, errors, _ = asyncio.run(drive())
+    assert len(latencies) == 6
+    assert errors == 3
+
+
+
+def test_seeded_rows_are_versioned_summarized_and_hashed(db):
+    common.seed(users=20, products=10, orders=30)
+    for model in (models.User, models.Product, models.Order):
+        assert db.scalar(select(func.count()).where(model.version == 0)) == 0
+    assert len(changes.feed(db, "orders")["changes"]) == 30
+    assert summaries.check(db) == []
+    passwords = set(db.scalars(select(models.User.password)))
+    db.commit()
+    assert len(passwords) == 1 and auth.verify_password("secret", passwords.pop())
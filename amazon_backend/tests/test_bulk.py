@@ -0,0 +1,63 @@
+import csv
+import io
+import json
+
+from app import auth, models
+from tests.conftest import create_user
+
+
+def _ndjson(*rows):
+    return "".join(json.dumps(row) + "\n" for row in rows)
+
+
+def _user(user_id, password="secret", role="customer"):
+    return {"user_id": user_id, "name": f"user{user_id}", "email": f"user{user_id}@example.com",
+            "password": password, "phone_number": None, "address": None, "role": role}
+
+
+def _login(client, user_id, password="secret"):
+    return client.post("/auth/login", json={"email": f"user{user_id}@example.com", "password": password})
+
+
+def test_user_export_leaves_out_password_hashes(client):
+    create_user(client, 1)
+    rows = [json.loads(line) for line in client.get("/export/users").text.splitlines()]
+    assert [row["user_id"] for row in rows] == [1]
+    assert "password" not in rows[0]
+    header = next(csv.reader(io.StringIO(client.get("/export/users?format=csv").text)))
+    assert "password" not in header and "email" in header
+
+
+def test_bulk_upsert_ends_the_sessions_of_upserted_users(client):
+    create_user(client, 1)
+    create_user(client, 2)
+    tokens = {user_id: _login(client, user_id).json()["token"] for user_id in (1, 2)}
+
+    result = client.post("/bulk/users?mode=upsert", content=_ndjson(_user(1, password="changed"))).json()
+    assert result["written"] == 1
+
+    def session(user_id):
+        return client.get("/auth/session", headers={"Authorization": f"Bearer {tokens[user_id]}"})
+
+    assert session(1).status_code == 401
+    assert session(2).status_code == 200
+    assert _login(client, 1, "changed").status_code == 200
+
+
+def test_bulk_import_hashes_plain_passwords_once_per_batch(client, db, monkeypatch):
+    hashed = auth.hash_password("kept")
+    batches = []
+    original = auth.ensure_hashed_many
+    monkeypatch.setattr(auth, "ensure_hashed_many", lambda passwords, *args: (
+        batches.append(list(passwords)) or original(batches[-1], *args)))
+
+    body = _ndjson(_user(1, "first"), _user(2, "second"), _user(3, hashed))
+    assert client.post("/bulk/users", content=body).json()["written"] == 3
+    assert len(batches) == 1
+
+    stored = dict(db.query(models.User.user_id, models.User.password).all())
+    db.commit()
+    assert all(auth.is_hashed(password) for password in stored.values())
+    assert stored[3] == hashed
+    assert _login(client, 1, "first").status_code == 200
+    assert _login(client, 3, "kept").status_code == 200
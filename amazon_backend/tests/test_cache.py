@@ -0,0 +1,50 @@
+from tests.conftest import create_product, create_user
+
+
+def _revalidate(client, url, etag):
+    return client.get(url, headers={"If-None-Match": etag})
+
+
+def test_unchanged_list_is_not_modified(client):
+    create_user(client, 1, role="seller")
+    create_product(client, 1)
+    first = client.get("/products/")
+    assert first.status_code == 200 and first.headers["ETag"]
+
+    again = _revalidate(client, "/products/", first.headers["ETag"])
+    assert again.status_code == 304
+    assert again.content == b""
+
+
+def test_a_write_invalidates_the_list(client):
+    create_user(client, 1, role="seller")
+    product = create_product(client, 1, stock=1)
+    etag = client.get("/products/").headers["ETag"]
+
+    client.patch(f"/products/{product['product_id']}", json={"stock": 2})
+    response = _revalidate(client, "/products/", etag)
+    assert response.status_code == 200
+    assert response.json()[0]["stock"] == 2
+
+
+def test_writes_to_another_partition_keep_a_filtered_list(client):
+    create_user(client, 1, role="seller")
+    create_product(client, 1, category="books")
+    toy = create_product(client, 1, category="toys")
+    books = client.get("/products/", params={"category": "books"}).headers["ETag"]
+    everything = client.get("/products/").headers["ETag"]
+
+    client.patch(f"/products/{toy['product_id']}", json={"stock": 99})
+    assert _revalidate(client, "/products/?category=books", books).status_code == 304
+    assert _revalidate(client, "/products/", everything).status_code == 200
+
+
+def test_a_refused_write_invalidates_nothing(client):
+    create_user(client, 1, role="seller")
+    product = create_product(client, 1)
+    etag = client.get("/products/").headers["ETag"]
+
+    stale = client.patch(f"/products/{product['product_id']}", json={"stock": 3},
+                         headers={"If-Match": '"0"'})
+    assert stale.status_code == 409
+    assert _revalidate(client, "/products/", etag).status_code == 304
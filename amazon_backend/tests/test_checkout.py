@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app import crud, schemas, summaries
+from app.database import SessionLocal
+from tests.conftest import admin_logs, create_product, create_user
+
+
+@pytest.fixture
+def shop(client):
+    create_user(client, 1, role="seller")
+    create_user(client, 2)
+    return [create_product(client, 1, stock=5, price=2.0), create_product(client, 1, stock=1, price=3.0)]
+
+
+def _checkout(client, *lines):
+    return client.post("/orders/checkout", json={
+        "user_id": 2, "items": [{"product_id": product_id, "quantity": quantity} for product_id, quantity in lines],
+    })
+
+
+def _stock(client, product):
+    return client.get(f"/products/{product['product_id']}").json()["stock"]
+
+
+def test_checkout_takes_the_stock_of_every_line(client, db, shop):
+    books, toy = shop
+    response = _checkout(client, (books["product_id"], 2), (toy["product_id"], 1))
+    assert response.status_code == 200
+    order = response.json()
+    assert order["total_amount"] == 7.0
+    assert sorted((item["product_id"], item["quantity"]) for item in order["items"]) == [
+        (books["product_id"], 2), (toy["product_id"], 1)]
+    assert (_stock(client, books), _stock(client, toy)) == (3, 0)
+    assert client.get(f"/products/{books['product_id']}").json()["version"] > books["version"]
+    assert summaries.check(db) == []
+
+
+def test_a_line_without_enough_stock_reserves_nothing(client, db, shop):
+    books, toy = shop
+    response = _checkout(client, (books["product_id"], 2), (toy["product_id"], 2))
+    assert response.status_code == 409
+    assert (_stock(client, books), _stock(client, toy)) == (5, 1)
+    assert client.get("/orders/").json() == []
+    assert admin_logs(db, "checkout") == []
+
+
+def test_an_unknown_product_is_not_found(client, shop):
+    assert _checkout(client, (shop[0]["product_id"], 1), (99, 1)).status_code == 404
+    assert _stock(client, shop[0]) == 5
+
+
+def test_concurrent_checkouts_never_oversell(shop):
+    product_id = shop[0]["product_id"]
+
+    def buy(_):
+        with SessionLocal() as db:
+            request = schemas.CheckoutRequest(user_id=2, items=[{"product_id": product_id, "quantity": 1}])
+            try:
+                crud.checkout(db, request)
+                return True
+            except crud.InsufficientStock:
+                return False
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(buy, range(12)))
+    assert results.count(True) == 5
+    with SessionLocal() as db:
+        assert crud.get_row(db, "products", product_id)["stock"] == 0
+        assert summaries.check(db) == []
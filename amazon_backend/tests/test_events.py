@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+
+from app import audit, events, models
+from tests.conftest import admin_logs, create_product, create_user
+
+
+@pytest.fixture
+def subscriber(monkeypatch):
+    """A subscriber registered with the broker; its events are read with ``drain``."""
+    loop = asyncio.new_event_loop()
+    subscriber = events.Subscriber(loop, events.TABLES)
+    monkeypatch.setattr(events.broker, "subscribers", (subscriber,))
+    yield subscriber
+    loop.close()
+
+
+@pytest.fixture
+def product(client):
+    create_user(client, 1, role="seller")
+    return create_product(client, 1, stock=1)
+
+
+@pytest.mark.parametrize("mode", ["queued", "strict"])
+def test_admin_log_events_carry_the_log_id(client, db, subscriber, product, monkeypatch, mode):
+    monkeypatch.setattr(audit, "AUDIT_MODE", mode)
+    subscriber.drain()
+    client.patch(f"/products/{product['product_id']}", json={"stock": 2})
+    logged = [body for body in subscriber.drain() if body["table"] == "admin_logs"]
+    assert [body["row"]["id"] for body in logged] == [admin_logs(db)[-1].id]
+
+
+def test_relayed_events_are_delivered_in_commit_order(client, db, subscriber, product, monkeypatch):
+    monkeypatch.setattr(events, "EVENTS_RELAY", "database")
+    relay = events.Relay(retention=0)
+    last = relay.poll(None)
+    subscriber.drain()
+
+    for stock in (2, 3, 4):
+        client.patch(f"/products/{product['product_id']}", json={"stock": stock})
+    assert subscriber.drain() == []  # nothing is delivered before the relay reads it back
+    stored = db.scalar(select(func.count()).select_from(models.ChangeEvent))
+    db.commit()
+    assert stored >= 3
+
+    offered, offer = [], subscriber.offer
+    monkeypatch.setattr(subscriber, "offer", lambda bodies: (offered.extend(bodies), offer(bodies))[1])
+    last = relay.poll(last)
+    updates = [body for body in offered if body["table"] == "products"]
+    assert [body["row"]["stock"] for body in updates] == [2, 3, 4]
+    assert [body["version"] for body in updates] == sorted(body["version"] for body in updates)
+    assert relay.poll(last) == last
+
+    relay.prune()
+    assert db.scalar(select(func.count()).select_from(models.ChangeEvent)) == 0
+    db.commit()
@@ -0,0 +1,44 @@
+import json
+
+from sqlalchemy import text
+
+from app import search
+from tests.conftest import create_product, create_user
+
+
+def _found(client, q):
+    return [row["name"] for row in client.get("/products/search", params={"q": q}).json()["results"]]
+
+
+def test_the_index_follows_every_write_path(client, db):
+    create_user(client, 1, role="seller")
+    heels = create_product(client, 1, name="Red heels", category="shoes")
+    lamp = create_product(client, 1, name="Desk lamp", category="home")
+    assert _found(client, "hee") == ["Red heels"]
+
+    client.patch(f"/products/{heels['product_id']}", json={"name": "Blue sandals"})
+    assert _found(client, "heels") == []
+    assert _found(client, "sand") == ["Blue sandals"]
+
+    client.delete(f"/products/{lamp['product_id']}")
+    assert _found(client, "lamp") == []
+
+    body = json.dumps({"name": "Walking boots", "description": "", "price": 40.0, "stock": 3,
+                       "category": "shoes", "seller_id": 1})
+    assert client.post("/bulk/products", content=body + "\n").json()["written"] == 1
+    assert _found(client, "boots") == ["Walking boots"]
+
+    db.execute(text("UPDATE products SET name = 'Hiking boots' WHERE name = 'Walking boots'"))
+    db.commit()
+    assert [row["name"] for row in search.search_products(db, "hiking")["results"]] == ["Hiking boots"]
+    assert search.check(db)
+
+
+def test_facets_count_matches_per_category(client):
+    create_user(client, 1, role="seller")
+    create_product(client, 1, name="Red heels", category="shoes")
+    create_product(client, 1, name="Red lamp", category="home")
+    create_product(client, 1, name="Red boots", category="shoes")
+    result = client.get("/products/search", params={"q": "red", "category": "shoes"}).json()
+    assert result["total"] == 2
+    assert {facet["category"]: facet["count"] for facet in result["facets"]} == {"shoes": 2, "home": 1}
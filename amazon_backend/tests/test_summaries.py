@@ -0,0 +1,74 @@
+import sqlite3
+
+from sqlalchemy.exc import OperationalError
+
+from app import crud, summaries
+from tests.conftest import create_order, create_product, create_user
+
+
+def test_summaries_follow_product_writes(client, db):
+    create_user(client, 1, role="seller")
+    kept = create_product(client, 1, stock=4, price=2.5, category="books")
+    moved = create_product(client, 1, stock=3, price=1.0, category="books")
+    deleted = create_product(client, 1, stock=7, price=9.0, category="toys")
+
+    client.patch(f"/products/{kept['product_id']}", json={"stock": 6, "price": 3.0})
+    client.patch(f"/products/{moved['product_id']}", json={"category": "toys"})
+    client.delete(f"/products/{deleted['product_id']}")
+    assert summaries.check(db) == []
+
+
+def test_summaries_follow_order_writes(client, db):
+    create_user(client, 1)
+    create_user(client, 2)
+    first = create_order(client, 1, total_amount=10.0)
+    second = create_order(client, 1, total_amount=5.0)
+    create_order(client, 2, total_amount=7.5, status="shipped")
+
+    client.patch(f"/orders/{first['id']}", json={"status": "shipped", "total_amount": 12.0})
+    client.patch(f"/orders/{second['id']}", json={"user_id": 2})
+    client.delete(f"/orders/{first['id']}")
+    assert summaries.check(db) == []
+
+
+def test_deleting_a_user_versions_and_summarizes_their_orders(client, db):
+    create_user(client, 1)
+    create_user(client, 2)
+    orders = [create_order(client, 1, total_amount=amount)["id"] for amount in (3.0, 4.0)]
+    create_order(client, 2, total_amount=6.0)
+    since = client.get("/changes").json()["orders"]
+
+    client.delete("/users/1")
+    feed = client.get("/changes/orders", params={"since": since}).json()
+    assert [(row["id"], row["user_id"]) for row in feed["changes"]] == [(order_id, None) for order_id in orders]
+    assert summaries.check(db) == []
+    assert client.get("/users/1/stats").status_code == 404
+    assert [customer["user_id"] for customer in client.get("/customers/top").json()] == [2]
+
+
+def test_status_transitions_leave_customer_summaries_alone(client, db, monkeypatch):
+    create_user(client, 1)
+    ids = [create_order(client, 1, total_amount=5.0)["id"] for _ in range(3)]
+    upserts = []
+    original = summaries._increment_customer
+    monkeypatch.setattr(summaries, "_increment_customer",
+                        lambda *args: (upserts.append(args[1]), original(*args)))
+
+    assert client.post("/orders/status", json={"status": "shipped", "ids": ids}).json()["updated"] == 3
+    client.patch(f"/orders/{ids[0]}", json={"status": "delivered"})
+    assert upserts == []
+    assert summaries.check(db) == []
+
+    client.patch(f"/orders/{ids[0]}", json={"total_amount": 8.0})
+    assert upserts == [1]
+    assert summaries.check(db) == []
+
+
+def test_a_locked_database_during_a_transition_is_a_retryable_503(client, monkeypatch):
+    def locked(*args, **kwargs):
+        raise OperationalError("UPDATE orders", {}, sqlite3.OperationalError("database is locked"))
+
+    monkeypatch.setattr(crud, "transition_orders", locked)
+    response = client.post("/orders/status", json={"status": "shipped", "ids": [1]})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,80 @@
+import pytest
+
+from app import audit, changes, crud, schemas
+from app.database import SessionLocal
+from tests.conftest import admin_logs, create_product, create_user
+
+
+@pytest.fixture
+def product(client):
+    create_user(client, 1, role="seller")
+    return create_product(client, 1, stock=10)
+
+
+def test_if_match_applies_the_update_at_the_current_version(client, product):
+    response = client.patch(f"/products/{product['product_id']}", json={"stock": 7},
+                            headers={"If-Match": f'"{product["version"]}"'})
+    assert response.status_code == 200
+    assert response.json()["stock"] == 7
+    assert response.headers["ETag"] == f'"{response.json()["version"]}"'
+    assert response.json()["version"] > product["version"]
+
+
+def test_if_match_with_a_stale_version_is_a_conflict(client, db, product):
+    url = f"/products/{product['product_id']}"
+    current = client.patch(url, json={"stock": 7}).json()
+    logs = len(admin_logs(db))
+
+    response = client.put(url, json={**product, "stock": 1}, headers={"If-Match": f'"{product["version"]}"'})
+    assert response.status_code == 409
+    assert response.headers["ETag"] == f'"{current["version"]}"'
+    assert client.get(url).json()["stock"] == 7
+    assert len(admin_logs(db)) == logs  # nothing logged for a refused write
+
+
+def test_if_match_on_a_missing_row_is_not_found(client):
+    response = client.patch("/products/99", json={"stock": 1}, headers={"If-Match": '"3"'})
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("mode", ["queued", "strict"])
+def test_patch_retried_after_a_concurrent_write_keeps_its_audit_entry(client, db, product, monkeypatch, mode):
+    monkeypatch.setattr(audit, "AUDIT_MODE", mode)
+    product_id = product["product_id"]
+    reserve, bumped = changes.reserve, []
+
+    def reserve_after_a_concurrent_write(session, table, count):
+        # Runs between _patch's read of the old values and its UPDATE
+        if table == "products" and not bumped:
+            bumped.append(True)
+            with SessionLocal() as other:
+                crud.patch_product(other, product_id, schemas.ProductUpdate(price=9.0))
+        return reserve(session, table, count)
+
+    monkeypatch.setattr(changes, "reserve", reserve_after_a_concurrent_write)
+    logs = len(admin_logs(db, "update"))
+
+    response = client.patch(f"/products/{product_id}", json={"stock": 3})
+    assert response.status_code == 200
+    assert bumped
+    assert response.json()["stock"] == 3
+    assert response.json()["price"] == 9.0  # the concurrent write was read again, not overwritten
+    assert len(admin_logs(db, "update")) == logs + 1
+
+
+@pytest.mark.parametrize("mode", ["queued", "strict"])
+def test_empty_patch_logs_nothing_and_keeps_the_version(client, db, product, monkeypatch, mode):
+    monkeypatch.setattr(audit, "AUDIT_MODE", mode)
+    logs = len(admin_logs(db))
+
+    response = client.patch(f"/products/{product['product_id']}", json={},
+                            headers={"If-Match": f'"{product["version"]}"'})
+    assert response.status_code == 200
+    assert response.json()["version"] == product["version"]
+    assert len(admin_logs(db)) == logs
+
+
+def test_empty_patch_with_a_stale_version_is_still_a_conflict(client, product):
+    url = f"/products/{product['product_id']}"
+    client.patch(url, json={"stock": 7})
+    assert client.patch(url, json={}, headers={"If-Match": f'"{product["version"]}"'}).status_code == 409
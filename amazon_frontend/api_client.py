@@ -0,0 +1,116 @@
+"""HTTP client for the backend API.
+
+One ``ApiClient`` per Streamlit server process (see ``get_client`` in
+streamlit_app.py) keeps a pool of keep-alive connections to the backend.
+Every call has a connect/read timeout, idempotent calls are retried with
+exponential backoff on connection errors and 502/503/504, responses are
+requested gzip-compressed, and the latency of each call is recorded for the
+Diagnostics page.
+"""
+import re
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class ApiClient:
+    def __init__(self, base_url, pool_size=10, connect_timeout=3.05, read_timeout=30,
+                 retries=3, backoff=0.3, history=500):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.retries = retries
+        self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = "gzip"
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET", "HEAD", "PUT", "DELETE"}),  # POST is not idempotent
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.calls = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="api")
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        started = time.perf_counter()
+        status, size = None, 0
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+            status, size = response.status_code, len(response.content)
+            return response
+        finally:
+            self._record(method, path, status, time.perf_counter() - started, size)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.request("PATCH", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def parallel(self, **calls):
+        """Run independent calls concurrently: ``parallel(a=lambda: ..., b=lambda: ...)`` -> ``{"a": ..., "b": ...}``."""
+        futures = {name: self._executor.submit(call) for name, call in calls.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+    # ---------- Instrumentation ----------
+
+    def _record(self, method, path, status, elapsed, size):
+        endpoint = re.sub(r"/\d+(?=/|$)", "/{id}", path.split("?")[0])
+        with self._lock:
+            self.calls.append({
+                "time": time.strftime("%H:%M:%S"),
+                "method": method,
+                "endpoint": endpoint,
+                "status": status,  # None when the call raised (timeout, connection error)
+                "ms": round(elapsed * 1000, 1),
+                "bytes": size,
+            })
+
+    def clear_history(self):
+        with self._lock:
+            self.calls.clear()
+
+    def recent_calls(self):
+        with self._lock:
+            return list(reversed(self.calls))
+
+    def endpoint_stats(self):
+        """Latency percentiles and error counts per method and endpoint over the recorded calls."""
+        grouped = {}
+        for call in self.recent_calls():
+            grouped.setdefault((call["method"], call["endpoint"]), []).append(call)
+        stats = []
+        for (method, endpoint), calls in sorted(grouped.items()):
+            latencies = sorted(call["ms"] for call in calls)
+            stats.append({
+                "method": method,
+                "endpoint": endpoint,
+                "calls": len(calls),
+                "errors": sum(1 for call in calls if call["status"] is None or call["status"] >= 400),
+                "p50_ms": latencies[len(latencies) // 2],
+                "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                "mean_ms": round(statistics.fmean(latencies), 1),
+                "kb": round(sum(call["bytes"] for call in calls) / 1024, 1),
+            })
+        return stats
@@ -1,15 +1,122 @@
 import streamlit as st
-import requests
 import pandas as pd
 from datetime import datetime
 import re
 
+from api_client import ApiClient
+
 API_URL = "http://backend:8000"
+PAGE_SIZE = 1000
+ORDERS_PAGE_SIZE = 500
+LOG_PAGE_SIZE = 100
+CHART_POINTS = 400
+PRODUCT_SEARCH_LIMIT = 50
 st.set_page_config(page_title="Amazon Admin", layout="wide")
 
+@st.cache_resource
+def get_client():
+    # Shared by all sessions of this Streamlit server, so connections stay pooled
+    return ApiClient(API_URL)
+
+api = get_client()
+
 # ----------------- CUSTOM LIGHT THEME -----------------
 
 
+# ----------------- API HELPERS -----------------
+# Fetched data is cached across reruns and sessions under the tables' change feed
+# versions (GET /changes): every widget interaction reruns the script, but a page is
+# only downloaded and decoded again after its table changed.
+def data_version(*tables):
+    versions = st.session_state.versions
+    return tuple(versions[table] for table in (tables or sorted(versions)))
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def cached_json(path, version):
+    return api.get(path).json()
+
+def latest_log_id():
+    # Admin logs are not in the change feed, and in the default queued audit mode they are
+    # written up to a second after the table change they record, so their pages are keyed
+    # on the newest entry instead: one indexed single-row request per rerun
+    res = api.get("/admin-logs", params={"limit": 1})
+    res.raise_for_status()
+    logs = res.json()
+    return logs[0]["id"] if logs else 0
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def fetch_frame(path, params, version, dates=()):
+    # One page of a list endpoint as (DataFrame, next cursor). The page comes column by
+    # column, so the frame is built from whole columns, and date columns are parsed once
+    # here instead of being reformatted on every rerun.
+    res = api.get(path, params={**dict(params), "format": "columns"})
+    res.raise_for_status()
+    frame = pd.DataFrame(res.json())
+    for column in dates:
+        frame[column] = pd.to_datetime(frame[column])
+    return frame, res.headers.get("X-Next-Cursor")
+
+def if_match(row):
+    # Updates apply only to the version on screen: the backend answers 409 when the row changed since
+    return {"If-Match": f'"{int(row["version"])}"'}
+
+def update_failed(res, what):
+    if res.status_code == 409:
+        st.error(f"This {what} was changed by someone else in the meantime. Check the new values and try again.")
+    else:
+        st.error("Update failed.")
+
+def page_cursors(key, params):
+    # Cursors of the keyset pages leading to the one on screen, reset when the filters change.
+    # Only the page on screen is ever fetched, however large the table.
+    filters_key = str(sorted(params.items()))
+    state = st.session_state.setdefault(key, {"filters": None, "cursors": []})
+    if state["filters"] != filters_key:
+        state["filters"], state["cursors"] = filters_key, []
+    return state["cursors"]
+
+def page_buttons(cursors, next_cursor, newer="⬅️ Newer", older="Older ➡️"):
+    col1, col2, col3 = st.columns([1, 1, 4])
+    with col1:
+        if cursors and st.button(newer):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if next_cursor and st.button(older):
+            cursors.append(next_cursor)
+            st.rerun()
+    col3.caption(f"Page {len(cursors) + 1}")
+
+def downsample(frame, points=CHART_POINTS):
+    # Sum a time series indexed by date into at most `points` equal buckets, so a chart
+    # over years of daily data stays light to send and draw
+    if len(frame) <= points:
+        return frame
+    days = -(-(frame.index[-1] - frame.index[0]).days // points)
+    return frame.resample(f"{max(days, 1)}D").sum()
+
+def table_sync(table, key):
+    # Returns a call that brings the session's local copy of a table up to date through
+    # the change feed: after the first load, only rows changed or deleted since the last
+    # sync are downloaded. The copy is looked up now, since the call may run on a worker
+    # thread where st.session_state is not available.
+    cache = st.session_state.setdefault(f"{table}_cache", {"version": 0, "rows": {}})
+
+    def sync():
+        while True:
+            feed = api.get(f"/changes/{table}", params={"since": cache["version"], "limit": PAGE_SIZE}).json()
+            if feed["reset"]:
+                cache["version"], cache["rows"] = 0, {}
+                continue
+            for row in feed["changes"]:
+                cache["rows"][row[key]] = row
+            for row_id in feed["deleted"]:
+                cache["rows"].pop(row_id, None)
+            cache["version"] = feed["version"]
+            if not feed["has_more"]:
+                return sorted(cache["rows"].values(), key=lambda row: row[key])
+    return sync
+
 # ----------------- AUTHENTICATION -----------------
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
@@ -30,11 +137,15 @@ if not st.session_state.authenticated:
         login = st.form_submit_button("Login")
 
     if login:
-        users = requests.get(f"{API_URL}/users/").json()
-        for user in users:
-            if user['email'] == email and user['password'] == password and user['role'] == 'admin':
+        res = api.post("/auth/login", json={"email": email, "password": password})
+        if res.ok:
+            session = res.json()
+            if session["role"] == "admin":
                 st.session_state.authenticated = True
+                st.session_state.auth_token = session["token"]
                 st.rerun()
+            # Not an admin: end the session the backend just opened
+            api.post("/auth/logout", headers={"Authorization": f"Bearer {session['token']}"})
         st.session_state.login_error = True
 
     if st.session_state.login_error:
@@ -49,11 +160,18 @@ if "form_reset" not in st.session_state:
 
 # ----------------- DATA FETCH -----------------
 def refresh_data():
-    st.session_state.users_data = requests.get(f"{API_URL}/users/").json()
-    st.session_state.products_data = requests.get(f"{API_URL}/products/").json()
-    st.session_state.orders_data = requests.get(f"{API_URL}/orders/").json()
-
-refresh_data()
+    # Only load what the current page shows; totals come from server-side aggregates.
+    # Independent fetches run concurrently on the client's connection pool.
+    page = st.session_state.page
+    calls = {"versions": lambda: api.get("/changes").json()}
+    if page == "Users":
+        calls["users_data"] = table_sync("users", "user_id")
+    elif page == "Products":
+        calls["products_data"] = table_sync("products", "product_id")
+    for name, value in api.parallel(**calls).items():
+        st.session_state[name] = value
+    if page in ("Home", "Orders"):
+        st.session_state.dashboard = cached_json("/dashboard/aggregates", data_version())
 
 # ----------------- HELPERS -----------------
 def get_unique_categories():
@@ -65,7 +183,9 @@ def is_valid_email(email):
 # ----------------- SIDEBAR -----------------
 st.sidebar.image("https://upload.wikimedia.org/wikipedia/commons/a/a9/Amazon_logo.svg", use_container_width=True)
 st.sidebar.title("Navigation")
-st.session_state.page = st.sidebar.radio("Go to", ["Home", "Users", "Products", "Orders", "Activity Logs"])
+st.session_state.page = st.sidebar.radio("Go to", ["Home", "Users", "Products", "Orders", "Activity Logs", "Diagnostics"])
+
+refresh_data()
 
 # ----------------- HOME PAGE -----------------
 if st.session_state.page == "Home":
@@ -80,6 +200,35 @@ if st.session_state.page == "Home":
 
     Ensure all actions are in line with platform policies.
     """)
+
+    dashboard = st.session_state.dashboard
+    overview = dashboard["overview"]
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Users", overview["users"])
+    col2.metric("Products", overview["products"])
+    col3.metric("Orders", overview["orders"])
+    col4.metric("Revenue", f"{overview['revenue']:,.2f}")
+
+    if dashboard["orders_by_period"]:
+        st.subheader("📈 Orders over Time")
+        series = pd.DataFrame(dashboard["orders_by_period"])
+        series = series.set_index(pd.to_datetime(series["period"]))[["order_count", "revenue"]]
+        first, last = series.index[0].date(), series.index[-1].date()
+        if first < last:
+            first, last = st.slider("Window", min_value=first, max_value=last, value=(first, last))
+        st.line_chart(downsample(series.loc[str(first):str(last)]))
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("🏆 Top Customers")
+        st.dataframe(pd.DataFrame(dashboard["top_customers"]), use_container_width=True)
+        st.subheader("🗂️ Products per Category")
+        st.dataframe(pd.DataFrame(dashboard["products_by_category"]), use_container_width=True)
+    with col2:
+        st.subheader("📊 Orders by Status")
+        st.dataframe(pd.DataFrame(dashboard["orders_by_status"]), use_container_width=True)
+        st.subheader("⚠️ Low Stock")
+        st.dataframe(pd.DataFrame(dashboard["low_stock_products"]), use_container_width=True)
 # ----------------- USERS PAGE -----------------
 
 elif st.session_state.page == "Users":
@@ -111,7 +260,7 @@ elif st.session_state.page == "Users":
                     "address": address,
                     "role": role
                 }
-                res = requests.post(f"{API_URL}/users/", json=data)
+                res = api.post("/users/", json=data)
                 if res.ok:
                     st.success("User created successfully.")
                     refresh_data()
@@ -153,15 +302,16 @@ elif st.session_state.page == "Users":
                             "address": new_address,
                             "role": new_role
                         }
-                        res = requests.put(f"{API_URL}/users/{user_id}", json=updated_data)
+                        res = api.put(f"/users/{user_id}", json={"user_id": user_id, **updated_data},
+                                      headers=if_match(user))
                         if res.ok:
                             st.success("User updated.")
                             refresh_data()
                         else:
-                            st.error("Update failed.")
+                            update_failed(res, "user")
 
                 if st.button("🗑️ Delete This User"):
-                    res = requests.delete(f"{API_URL}/users/{user_id}")
+                    res = api.delete(f"/users/{user_id}")
                     if res.ok:
                         st.success("User deleted.")
                         refresh_data()
@@ -197,19 +347,29 @@ elif st.session_state.page == "Products":
                         "category": category,
                         "seller_id": seller_id
                     }
-                    res = requests.post(f"{API_URL}/products/", json=product_data)
+                    res = api.post("/products/", json=product_data)
                     if res.ok:
                         st.success("Product created successfully.")
                         refresh_data()
                     else:
                         st.error("Failed to create product.")
 
-    if st.session_state.products_data:
-        product_ids = [f"{p['product_id']} - {p['name']}" for p in st.session_state.products_data]
-        selected = st.selectbox("Select product to update/delete:", ["None"] + product_ids)
+    # Search on the server instead of listing every product in the selectbox
+    query = st.text_input("🔍 Search products to update/delete", placeholder="Name, description or category")
+    if query.strip():
+        search_params = {"q": query, "limit": PRODUCT_SEARCH_LIMIT}
+        search = api.get("/products/search", params=search_params).json()
+        facets = {f"{f['category'] or '(none)'} ({f['count']})": f['category'] for f in search["facets"]}
+        if len(facets) > 1:
+            facet = st.selectbox("Category", ["All"] + list(facets))
+            if facet != "All":
+                search = api.get("/products/search", params={**search_params, "category": facets[facet]}).json()
+        matches = {f"{p['product_id']} - {p['name']}": p for p in search["results"]}
+        shown = f"{len(matches)} of {search['total']}" if search["total"] > len(matches) else str(search["total"])
+        selected = st.selectbox(f"Select product to update/delete ({shown} matches):", ["None"] + list(matches))
         if selected != "None":
-            product_id = int(selected.split(" - ")[0])
-            product = next(p for p in st.session_state.products_data if p['product_id'] == product_id)
+            product = matches[selected]
+            product_id = product['product_id']
 
             st.subheader("✏️ Update Product")
             with st.form("edit_product_form"):
@@ -229,15 +389,15 @@ elif st.session_state.page == "Products":
                         "category": new_category,
                         "seller_id": new_seller_id
                     }
-                    res = requests.put(f"{API_URL}/products/{product_id}", json=updated_product)
+                    res = api.put(f"/products/{product_id}", json=updated_product, headers=if_match(product))
                     if res.ok:
                         st.success("Product updated.")
                         refresh_data()
                     else:
-                        st.error("Update failed.")
+                        update_failed(res, "product")
 
             if st.button("🗑️ Delete This Product"):
-                res = requests.delete(f"{API_URL}/products/{product_id}")
+                res = api.delete(f"/products/{product_id}")
                 if res.ok:
                     st.success("Product deleted.")
                     refresh_data()
@@ -247,7 +407,7 @@ elif st.session_state.page == "Products":
 # ----------------- ORDERS PAGE -----------------
 elif st.session_state.page == "Orders":
     st.title("🛒 Manage Orders")
-    st.write(f"Total Orders: {len(st.session_state.orders_data)}")
+    st.write(f"Total Orders: {st.session_state.dashboard['overview']['orders']}")
 
     with st.expander("➕ Create New Order"):
         with st.form("order_form"):
@@ -265,23 +425,57 @@ elif st.session_state.page == "Orders":
                         "total_amount": total_amount,
                         "status": status
                     }
-                    res = requests.post(f"{API_URL}/orders/", json=order_data)
+                    res = api.post("/orders/", json=order_data)
                     if res.ok:
                         st.success("Order created successfully.")
                         refresh_data()
                     else:
                         st.error("Failed to create order. Ensure user exists.")
 
-    df = pd.DataFrame(st.session_state.orders_data)
-    if not df.empty:
-        df['order_date'] = pd.to_datetime(df['order_date']).dt.strftime("%Y-%m-%d %H:%M")
-        st.dataframe(df, use_container_width=True)
+    # Newest first, one page of ORDERS_PAGE_SIZE at a time
+    status_filter = st.selectbox("Status", ["All", "pending", "shipped", "delivered", "cancelled"])
+    params = {"limit": ORDERS_PAGE_SIZE, "sort": "order_date", "order": "desc"}
+    if status_filter != "All":
+        params["status"] = status_filter
+    cursors = page_cursors("order_pages", params)
+    if cursors:
+        params["after"] = cursors[-1]
+    orders, next_cursor = fetch_frame("/orders/", tuple(sorted(params.items())), data_version("orders"),
+                                      dates=("order_date",))
+    if orders.empty:
+        st.info("No orders found.")
+    else:
+        st.dataframe(orders, use_container_width=True, hide_index=True, column_config={
+            "order_date": st.column_config.DatetimeColumn(format="YYYY-MM-DD HH:mm"),
+        })
+    page_buttons(cursors, next_cursor)
+
+    with st.expander("🚚 Change Status of Many Orders"):
+        with st.form("bulk_status_form"):
+            statuses = ["pending", "shipped", "delivered", "cancelled"]
+            from_status = st.selectbox("Orders currently", ["Listed IDs"] + statuses)
+            id_text = st.text_input("Order IDs (comma separated, when using listed IDs)")
+            to_status = st.selectbox("New status", statuses, index=1)
+            bulk_btn = st.form_submit_button("Change Status")
+            if bulk_btn:
+                transition = {"status": to_status}
+                if from_status == "Listed IDs":
+                    transition["ids"] = [int(i) for i in id_text.replace(" ", "").split(",") if i.isdigit()]
+                else:
+                    transition["filter"] = {"status": from_status}
+                res = api.post("/orders/status", json=transition)
+                if res.ok:
+                    st.success(f"{res.json()['updated']} orders set to {to_status}.")
+                    refresh_data()
+                else:
+                    st.error("Status change failed. Enter at least one order ID.")
 
-    order_ids = [f"{o['id']} - User {o['user_id']}" for o in st.session_state.orders_data]
+    order_ids = [f"{order_id} - User {user_id}" for order_id, user_id in zip(orders["id"], orders["user_id"])]
     selected = st.selectbox("Select order to update/delete:", ["None"] + order_ids)
     if selected != "None":
         order_id = int(selected.split(" - ")[0])
-        order = next(o for o in st.session_state.orders_data if o['id'] == order_id)
+        order = orders[orders["id"] == order_id].iloc[0].to_dict()
+        order["total_amount"] = float(order["total_amount"])
 
         st.subheader("✏️ Update Order")
         with st.form("edit_order_form"):
@@ -289,20 +483,18 @@ elif st.session_state.page == "Orders":
             new_total = st.number_input("Total Amount", min_value=0.01, value=order['total_amount'])
             update_btn = st.form_submit_button("Update")
             if update_btn:
-                updated_data = {
-                    "user_id": order['user_id'],
-                    "status": new_status,
-                    "total_amount": new_total
-                }
-                res = requests.put(f"{API_URL}/orders/{order_id}", json=updated_data)
+                # Only send what changed
+                updated_data = {field: value for field, value in (("status", new_status), ("total_amount", new_total))
+                                if value != order[field]}
+                res = api.patch(f"/orders/{order_id}", json=updated_data, headers=if_match(order))
                 if res.ok:
                     st.success("Order updated.")
                     refresh_data()
                 else:
-                    st.error("Update failed.")
+                    update_failed(res, "order")
 
         if st.button("🗑️ Delete This Order"):
-            res = requests.delete(f"{API_URL}/orders/{order_id}")
+            res = api.delete(f"/orders/{order_id}")
             if res.ok:
                 st.success("Order deleted.")
                 refresh_data()
@@ -312,23 +504,55 @@ elif st.session_state.page == "Orders":
 # ----------------- ACTIVITY LOGS PAGE -----------------
 elif st.session_state.page == "Activity Logs":
     st.title("📜 Admin Activity Logs")
-    logs = requests.get(f"{API_URL}/admin-logs/").json()
-
-    if logs:
-        # Handle case where logs is a single dict instead of a list
-        if isinstance(logs, dict):
-            logs = [logs]
-        
-        # Proceed only if it's now a list of dictionaries
-        if isinstance(logs, list) and all(isinstance(item, dict) for item in logs):
-            df = pd.DataFrame(logs)
-
-            if 'timestamp' in df.columns:
-                df['timestamp'] = pd.to_datetime(df['timestamp']).dt.strftime("%Y-%m-%d %H:%M:%S")
-
-            st.dataframe(df, use_container_width=True)
-        else:
-            st.error("Unexpected format: logs should be a list of dictionaries.")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        target_table = st.selectbox("Table", ["All", "users", "products", "orders"])
+    with col2:
+        action = st.selectbox("Action", ["All", "add", "update", "delete", "checkout", "bulk_insert", "bulk_upsert", "bulk_status"])
+    with col3:
+        since = st.date_input("Since", value=None)
+
+    params = {"limit": LOG_PAGE_SIZE}
+    if target_table != "All":
+        params["target_table"] = target_table
+    if action != "All":
+        params["action"] = action
+    if since:
+        params["time_from"] = since.isoformat()
+
+    # Newest first; "Older" follows the cursor of the page on screen
+    cursors = page_cursors("log_pages", params)
+    if cursors:
+        params["after"] = cursors[-1]
+    logs, next_cursor = fetch_frame("/admin-logs", tuple(sorted(params.items())), latest_log_id(),
+                                    dates=("timestamp",))
+
+    if not logs.empty:
+        st.dataframe(logs, use_container_width=True, hide_index=True, column_config={
+            "timestamp": st.column_config.DatetimeColumn(format="YYYY-MM-DD HH:mm:ss"),
+        })
     else:
         st.info("No logs found.")
+    page_buttons(cursors, next_cursor)
+
+# ----------------- DIAGNOSTICS PAGE -----------------
+elif st.session_state.page == "Diagnostics":
+    st.title("🩺 API Diagnostics")
+    st.caption(f"Backend {api.base_url} · pool of {api.pool_size} connections · "
+               f"timeouts {api.timeout[0]}s connect / {api.timeout[1]}s read · {api.retries} retries")
+
+    st.subheader("Latency by endpoint")
+    stats = api.endpoint_stats()
+    if stats:
+        st.dataframe(pd.DataFrame(stats), use_container_width=True)
+    else:
+        st.info("No API calls recorded yet.")
+
+    st.subheader("Backend response cache")
+    st.json(api.get("/cache/stats").json())
 
+    st.subheader("Recent calls")
+    st.dataframe(pd.DataFrame(api.recent_calls()), use_container_width=True)
+    if st.button("Clear history"):
+        api.clear_history()
+        st.rerun()